@@ -0,0 +1,52 @@
+'''
+Compara los niveles de detalle del GeoJSON del AMM:
+número de vértices, tamaño del archivo y tiempo de construir en Python
+la figura de un mapa coroplético con cada nivel y serializarla a HTML.
+No mide el dibujo del mapa en el navegador.
+
+Ejecutar desde el directorio del repositorio:
+`python benchmarks/geojson_detail.py`
+'''
+
+import os
+import sys
+import time
+
+import plotly.graph_objects as go
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'georef'))
+
+from filter_geojson import DETAIL_LEVELS, get_amm_geojson_path, read_amm_geojson
+from simplify import count_vertices
+
+def time_build(geojson: dict, repeat: int = 3) -> float:
+    '''
+    :returns: Mejor tiempo en segundos de construir la figura y serializarla a HTML.
+    '''
+    locations = [feature['id'] for feature in geojson['features']]
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        figure = go.Figure(
+            data=[dict(
+                type='choroplethmapbox',
+                geojson=geojson,
+                locations=locations,
+                z=list(range(len(locations)))
+            )],
+            layout=go.Layout(mapbox_style='carto-positron')
+        )
+        figure.to_html(include_plotlyjs=False)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main() -> None:
+    print(f'{"nivel":<8}{"tolerancia":>12}{"vértices":>10}{"KB":>10}{"HTML (s)":>10}')
+    for detail, tolerance in DETAIL_LEVELS.items():
+        geojson = read_amm_geojson(detail)
+        size = os.path.getsize(get_amm_geojson_path(detail)) / 1024
+        seconds = time_build(geojson)
+        print(f'{detail:<8}{str(tolerance):>12}{count_vertices(geojson):>10}{size:>10.0f}{seconds:>10.3f}')
+
+if __name__ == '__main__':
+    main()
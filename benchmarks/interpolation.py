@@ -0,0 +1,43 @@
+'''
+Compara los métodos de interpolación de los mapas de calor contra el kriging
+sobre la misma malla: tiempo por hora, cuántas veces más rápido
+y error de la malla del contaminante (ver `interpolation.compare_methods`).
+
+Ejecutar desde el directorio del repositorio, con 'filled.csv' en 'resources':
+`python benchmarks/interpolation.py PM10 15-Dec-18`
+'''
+
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'georef'))
+
+from heatmap import read_day, DATE_FORMAT
+from interpolation import compare_methods
+from readers import read_stations
+from settings import INTERPOLATION_METHODS
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compara los métodos de interpolación contra el kriging.')
+    parser.add_argument('pollutant', help='contaminante, ejemplo: PM10')
+    parser.add_argument('date', help="fecha con formato 'd-b-y', ejemplo: 15-Dec-18")
+    parser.add_argument('--days', type=int, default=1, help='días a partir de la fecha')
+    args = parser.parse_args()
+
+    day = pd.to_datetime(args.date, format=DATE_FORMAT)
+    dataset = read_day(args.pollutant, day, read_stations(), days=args.days)
+    report = compare_methods(dataset, args.pollutant, INTERPOLATION_METHODS)
+
+    print(f'{"método":<10}{"horas":>7}{"ms/hora":>10}{"veces":>8}{"RMSE":>10}{"máximo":>10}{"relativo":>10}')
+    for row in report:
+        print(
+            f'{row["method"]:<10}{row["hours"]:>7}{row["seconds_per_hour"] * 1000:>10.2f}'
+            f'{row["speedup"]:>8.1f}{row["rmse"]:>10.3f}{row["max_error"]:>10.3f}'
+            f'{row["relative_rmse"]:>10.1%}'
+        )
+
+if __name__ == '__main__':
+    main()
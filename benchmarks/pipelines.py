@@ -0,0 +1,258 @@
+'''
+Mide el tiempo y la memoria máxima de cada etapa de los mapas
+coroplético y de calor con datos sintéticos (ver `synthetic.py`).
+
+El reporte se guarda en JSON junto con el commit actual,
+para compararlo con el de otro commit:
+
+`python benchmarks/pipelines.py --report antes.json`
+`git checkout otra-rama`
+`python benchmarks/pipelines.py --report despues.json --compare antes.json`
+
+Los datos se generan una sola vez en `--workdir` y se reutilizan
+mientras no cambien sus parámetros.
+'''
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import webbrowser
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'georef'))
+
+from synthetic import REPO_DIR, copy_resources, generate_air_quality, generate_entries
+
+# los mapas se guardan en el directorio de trabajo sin abrirlos en el navegador
+webbrowser.open = lambda *args, **kwargs: False
+
+def measure(name: str, func: Callable[[], Any], repeat: int = 1) -> Dict[str, Any]:
+    '''
+    Ejecuta `func` `repeat` veces para medir el mejor tiempo
+    y una vez más con `tracemalloc` para medir la memoria máxima
+    (se mide aparte porque `tracemalloc` hace más lento el código).
+
+    :param func: Etapa a medir, si regresa un `DataFrame`, `Series` o lista
+        su longitud se reporta como número de registros.
+
+    :returns: Diccionario con nombre, segundos, MB máximos y registros.
+    '''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    rows = len(result) if isinstance(result, (pd.DataFrame, pd.Series, list)) else None
+    stage = {'stage': name, 'seconds': round(best, 4), 'peak_mb': round(peak / 2**20, 2), 'rows': rows}
+    print(f'{name:<32}{best:>10.3f} s{peak / 2**20:>10.1f} MB{rows if rows is not None else "":>12}', flush=True)
+    return stage
+
+def prepare_data(workdir: str, year: int, rows: int, amm_share: float, day: str, seed: int) -> None:
+    '''
+    Genera los datos sintéticos en `workdir`, solo si no existen
+    o si se generaron con otros parámetros.
+    '''
+    params = {'year': year, 'rows': rows, 'amm_share': amm_share, 'day': day, 'seed': seed}
+    paramspath = os.path.join(workdir, 'params.json')
+    if os.path.exists(paramspath):
+        with open(paramspath) as file:
+            if json.load(file) == params:
+                return
+    # datos de otros parámetros, borrar también los cachés
+    shutil.rmtree(os.path.join(workdir, 'resources'), ignore_errors=True)
+
+    print(f'{workdir}: Generando datos sintéticos...', flush=True)
+    resources = copy_resources(workdir)
+    generate_entries(os.path.join(resources, f'EGRESO_{year}.csv'), year, rows, amm_share, seed=seed)
+    # un mes alrededor del día del mapa de calor, para que el almacén tenga varias particiones
+    center = pd.Timestamp(day)
+    generate_air_quality(
+        os.path.join(resources, 'filled.csv'),
+        str((center - pd.Timedelta(days=15)).date()), str((center + pd.Timedelta(days=15)).date()),
+        seed
+    )
+    with open(paramspath, 'w') as file:
+        json.dump(params, file)
+
+def run_stages(
+        year: int, cie: str, day: str, workers: int, repeat: int,
+        points: int = 1_000_000, seed: int = 0) -> List[Dict[str, Any]]:
+    '''
+    Mide cada etapa en orden. Debe ejecutarse en el directorio de trabajo.
+    '''
+    # importar hasta aquí, ya en el directorio de trabajo
+    from readers import (
+        read_entries, build_entries_cache, build_air_quality_store,
+        read_stations, get_entries_cache_path, AIR_QUALITY_STORE
+    )
+    from choropleth import get_epiweek_numbers, count_entries_cube, read_cube_munics, plot_entries_choropleth
+    from heatmap import read_day, plot_heatmap, DATE_FORMAT
+    from kriging import KrigingEngine
+    from spatial import get_amm_index
+    import results
+
+    # medir siempre el cálculo completo, sin resultados guardados
+    results.set_use_saved(False)
+
+    amm_munics = read_cube_munics()
+    munics = amm_munics['MUNIC']
+    stages = list()
+
+    # sin caché: leer el CSV por bloques
+    cachepath = get_entries_cache_path(year)
+    if os.path.exists(cachepath):
+        os.remove(cachepath)
+    read_csv = lambda: read_entries(year, entity='19', munics=munics, cie=cie)
+    stages.append(measure('read_entries (CSV)', read_csv, repeat))
+
+    stages.append(measure('build_entries_cache', lambda: build_entries_cache(year), 1))
+    read_cache = lambda: read_entries(year, entity='19', munics=munics)
+    stages.append(measure('read_entries (caché)', read_cache, repeat))
+
+    # todas las letras del AMM, para agrupar más registros
+    entries = read_cache()
+    entries['INGRE'] = pd.to_datetime(entries['INGRE'])
+    stages.append(measure('get_epiweek_numbers', lambda: get_epiweek_numbers(entries['INGRE']), repeat))
+    cies = list(string.ascii_uppercase)
+    stages.append(measure('count_entries_cube', lambda: count_entries_cube(entries, amm_munics, cies), repeat))
+
+    stages.append(measure('plot_entries_choropleth', lambda: plot_entries_choropleth(year, cie, f'ingresos_{cie}_{year}.html'), repeat))
+
+    shutil.rmtree(AIR_QUALITY_STORE, ignore_errors=True)
+    stages.append(measure('build_air_quality_store', build_air_quality_store, 1))
+
+    date = pd.Timestamp(day)
+    dataset = read_day('PM10', date, read_stations())
+    hours = [group for _, group in dataset.groupby('timestamp')]
+    # motor nuevo en cada medición: incluye el cálculo de distancias de la malla
+    interpolate_hour = lambda: KrigingEngine(hours[0].lon, hours[0].lat, range(5, 41, 5)).interpolate(hours[0]['PM10'])
+    stages.append(measure('interpolate (1 hora)', interpolate_hour, repeat))
+
+    # igual que `heatmap`: variogramas del día y una factorización por paso
+    def interpolate_day() -> list:
+        engine = KrigingEngine(hours[0].lon, hours[0].lat, range(5, 41, 5))
+        variograms = engine.fit_variograms([hour['PM10'] for hour in hours])
+        return [engine.interpolate(hour['PM10'], variograms) for hour in hours]
+    stages.append(measure(f'interpolate ({len(hours)} horas)', interpolate_day, repeat))
+
+    # puntos uniformes en el rectángulo del AMM, con el índice ya creado
+    index = get_amm_index()
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = index.bounds
+    lon, lat = rng.uniform(xmin, xmax, points), rng.uniform(ymin, ymax, points)
+    stages.append(measure(f'locate ({points} puntos)', lambda: index.locate(lon, lat), repeat))
+
+    strdate = date.strftime(DATE_FORMAT)
+    with open('token.txt', 'w') as file:
+        file.write('pk.sintetico')
+    heatmap = lambda: plot_heatmap('PM10', strdate, 'token.txt', f'PM10_{strdate}.html', workers)
+    stages.append(measure('plot_heatmap', heatmap, repeat))
+
+    return stages
+
+def get_commit() -> Optional[str]:
+    '''
+    :returns: Commit actual del repositorio, o `None` si no se puede obtener.
+    '''
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(stages: List[Dict[str, Any]], baseline: Dict[str, Any]) -> None:
+    '''
+    Imprime cada etapa junto a la del reporte `baseline`
+    con la razón actual / anterior de tiempo y memoria.
+    '''
+    previous = {stage['stage']: stage for stage in baseline['stages']}
+    print(f'\nComparación con {baseline.get("commit")}:')
+    print(f'{"etapa":<32}{"s":>10}{"antes":>10}{"razón":>8}{"MB":>10}{"antes":>10}{"razón":>8}')
+    for stage in stages:
+        before = previous.get(stage['stage'])
+        if before is None:
+            print(f'{stage["stage"]:<32}{stage["seconds"]:>10.3f}{"-":>10}{"-":>8}{stage["peak_mb"]:>10.1f}{"-":>10}{"-":>8}')
+            continue
+        timeratio = stage['seconds'] / before['seconds'] if before['seconds'] else float('nan')
+        memratio = stage['peak_mb'] / before['peak_mb'] if before['peak_mb'] else float('nan')
+        print(
+            f'{stage["stage"]:<32}{stage["seconds"]:>10.3f}{before["seconds"]:>10.3f}{timeratio:>8.2f}'
+            f'{stage["peak_mb"]:>10.1f}{before["peak_mb"]:>10.1f}{memratio:>8.2f}'
+        )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Mide las etapas de los mapas con datos sintéticos.')
+    parser.add_argument('--workdir', help='directorio de datos y salidas, por defecto uno temporal')
+    parser.add_argument('--year', type=int, default=2018, help='año del archivo EGRESO')
+    parser.add_argument('--rows', type=int, default=500_000, help='registros del archivo EGRESO')
+    parser.add_argument('--amm-share', type=float, default=0.15, help='proporción de registros del AMM')
+    parser.add_argument('--cie', default='J', help='letra de CIE del mapa coroplético')
+    parser.add_argument('--day', default='2018-12-15', help='día del mapa de calor')
+    parser.add_argument('--workers', type=int, default=1, help='procesos del mapa de calor')
+    parser.add_argument('--repeat', type=int, default=1, help='repeticiones para el mejor tiempo')
+    parser.add_argument('--points', type=int, default=1_000_000, help='puntos a asignar a municipios')
+    parser.add_argument('--seed', type=int, default=0, help='semilla de los datos')
+    parser.add_argument('--report', help='archivo JSON donde guardar el reporte')
+    parser.add_argument('--compare', help='reporte JSON anterior para comparar')
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='georef-bench-'))
+    os.makedirs(workdir, exist_ok=True)
+    prepare_data(workdir, args.year, args.rows, args.amm_share, args.day, args.seed)
+
+    report = {
+        'commit': get_commit(),
+        'date': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'params': {
+            'year': args.year, 'rows': args.rows, 'amm_share': args.amm_share, 'cie': args.cie,
+            'day': args.day, 'workers': args.workers, 'repeat': args.repeat,
+            'points': args.points, 'seed': args.seed
+        },
+    }
+    # las rutas de los módulos son relativas al directorio de trabajo
+    reportpath = os.path.abspath(args.report) if args.report else None
+    comparepath = os.path.abspath(args.compare) if args.compare else None
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        print(f'{"etapa":<32}{"tiempo":>12}{"memoria":>13}{"registros":>12}')
+        report['stages'] = run_stages(
+            args.year, args.cie, args.day, args.workers, args.repeat, args.points, args.seed
+        )
+    finally:
+        os.chdir(cwd)
+
+    if reportpath:
+        with open(reportpath, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f'\nReporte: {reportpath}')
+
+    if comparepath:
+        with open(comparepath) as file:
+            compare(report['stages'], json.load(file))
+
+if __name__ == '__main__':
+    main()
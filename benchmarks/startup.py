@@ -0,0 +1,94 @@
+'''
+Mide el tiempo de inicio de la CLI (`georef --help` y la ayuda de cada subcomando)
+y revisa que no cargue las dependencias pesadas antes de ejecutar un mapa.
+
+Ejecutar desde el directorio del repositorio:
+`python benchmarks/startup.py`
+
+Termina con código 1 si algún comando tarda más de `--limit` segundos
+o si la ayuda importa alguna de las dependencias de los mapas.
+'''
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+GEOREF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'georef')
+CLI_PATH = os.path.join(GEOREF_DIR, 'cli.py')
+
+# módulos que solo deben importarse al ejecutar un mapa
+HEAVY_MODULES = ['pandas', 'numpy', 'plotly', 'pykrige', 'scipy', 'pyarrow', 'epiweeks']
+
+COMMANDS = [
+    ['--help'],
+    ['cm', '--help'],
+    ['hm', '--help'],
+]
+
+def time_command(args: List[str], repeat: int) -> List[float]:
+    '''
+    :returns: Segundos de cada ejecución de `cli.py` con `args`, en un proceso nuevo.
+    '''
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, CLI_PATH] + args, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+def time_interpreter() -> float:
+    '''
+    :returns: Segundos de iniciar el intérprete sin importar nada.
+    '''
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    return time.perf_counter() - start
+
+def get_loaded_heavy_modules(args: List[str]) -> List[str]:
+    '''
+    :returns: Dependencias pesadas cargadas después de ejecutar la CLI con `args`.
+    '''
+    code = (
+        'import sys\n'
+        f'sys.path.insert(0, {GEOREF_DIR!r})\n'
+        f'sys.argv = ["georef"] + {args!r}\n'
+        # la ayuda se escribe en stdout, la lista de módulos en stderr
+        'import cli\n'
+        'try:\n'
+        f'    cli.parse_arguments({args!r})\n'
+        'except SystemExit:\n'
+        '    pass\n'
+        f'print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules), file=sys.stderr)\n'
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    loaded = result.stderr.strip()
+    return loaded.split(',') if loaded else list()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Mide el tiempo de inicio de la CLI.')
+    parser.add_argument('--repeat', type=int, default=5, help='ejecuciones por comando')
+    parser.add_argument('--limit', type=float, default=0.5, help='segundos máximos por comando')
+    args = parser.parse_args()
+
+    ok = True
+    # el intérprete solo, como referencia
+    baseline = min(time_interpreter() for _ in range(args.repeat))
+    print(f'{"comando":<24}{"mínimo (s)":>12}{"mediana (s)":>13}  importados')
+    print(f'{"python -c pass":<24}{baseline:>12.3f}{"":>13}')
+    for command in COMMANDS:
+        times = time_command(command, args.repeat)
+        loaded = get_loaded_heavy_modules(command)
+        best, median = min(times), statistics.median(times)
+        print(f'{"georef " + " ".join(command):<24}{best:>12.3f}{median:>13.3f}  {", ".join(loaded) or "-"}')
+        ok &= best < args.limit and not loaded
+
+    if not ok:
+        print(f'\nLa CLI tarda más de {args.limit} s en iniciar o importa dependencias de los mapas.')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
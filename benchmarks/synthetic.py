@@ -0,0 +1,166 @@
+'''
+Generadores de datos sintéticos con el mismo formato que los archivos reales,
+que no están en el repositorio: EGRESO_{año}.csv de la Secretaría de Salud
+y filled.csv de las estaciones de calidad del aire.
+
+Ejemplo, desde el directorio del repositorio:
+`python benchmarks/synthetic.py /tmp/georef --rows 1000000 --year 2018`
+'''
+
+import argparse
+import os
+import shutil
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+RESOURCES_DIR = os.path.join(REPO_DIR, 'resources')
+
+# letras de CIE y su frecuencia aproximada en los egresos hospitalarios,
+# embarazo y parto (O) y enfermedades digestivas (K) son las más comunes
+CIE_WEIGHTS = {
+    'O': 26, 'K': 11, 'S': 8, 'N': 6, 'J': 6, 'Z': 5, 'I': 5, 'C': 5,
+    'P': 4, 'E': 3, 'A': 3, 'R': 3, 'T': 3, 'D': 2, 'M': 2, 'Q': 1,
+    'G': 1, 'L': 1, 'H': 1, 'F': 1, 'B': 1, 'U': 1,
+}
+# claves de entidades federativas, Nuevo León es la 19
+ENTITIES = [f'{entity:02}' for entity in range(1, 33)]
+# columnas del CSV de calidad del aire, en orden
+AIR_QUALITY_COLUMNS = [
+    'timestamp', 'station', 'CO', 'NO', 'NO2', 'NOX', 'O3', 'PM10', 'PM2_5',
+    'pressure', 'rainfall', 'humidity', 'SO2', 'solar', 'temperature',
+    'velocity', 'direction', 'valid', 'notes'
+]
+
+def copy_resources(directory: str) -> str:
+    '''
+    Crea `directory`/resources con los archivos del repositorio
+    que usan los módulos (municipios, GeoJSON y estaciones).
+
+    :returns: Ruta de la carpeta de recursos creada.
+    '''
+    resources = os.path.join(directory, 'resources')
+    os.makedirs(resources, exist_ok=True)
+    for filename in os.listdir(RESOURCES_DIR):
+        source = os.path.join(RESOURCES_DIR, filename)
+        if os.path.isfile(source):
+            shutil.copy2(source, resources)
+    return resources
+
+def generate_entries(
+        filepath: str, year: int, rows: int, amm_share: float = 0.15,
+        cies: Optional[Sequence[str]] = None, seed: int = 0, chunksize: int = 500_000) -> str:
+    '''
+    Genera un archivo EGRESO_`year`.csv sintético, por bloques
+    para no tener todos los registros en memoria.
+
+    :param rows: Número de registros.
+
+    :param amm_share: Proporción de registros de municipios del AMM;
+        el resto son de otras entidades o de otros municipios de Nuevo León.
+
+    :param cies: Letras de CIE posibles, por defecto todas las de `CIE_WEIGHTS`
+        con su frecuencia.
+
+    :param seed: Semilla, el mismo valor genera el mismo archivo.
+
+    :returns: `filepath`.
+    '''
+    rng = np.random.default_rng(seed)
+    amm_munics = pd.read_csv(os.path.join(RESOURCES_DIR, 'AMM_MUNICS.csv'), dtype={'MUNIC': str})['MUNIC'].to_numpy()
+    other_munics = np.array([f'{munic:03}' for munic in range(1, 52) if f'{munic:03}' not in set(amm_munics)])
+    other_entities = np.array([entity for entity in ENTITIES if entity != '19'])
+
+    letters = np.array(list(cies) if cies else list(CIE_WEIGHTS))
+    weights = np.array([CIE_WEIGHTS.get(letter, 1) for letter in letters], dtype=float)
+    weights /= weights.sum()
+
+    first = np.datetime64(f'{year}-01-01')
+    days = int((np.datetime64(f'{year + 1}-01-01') - first).astype(int))
+
+    with open(filepath, 'w', encoding='utf-8', newline='') as file:
+        for offset in range(0, rows, chunksize):
+            n = min(chunksize, rows - offset)
+
+            amm = rng.random(n) < amm_share
+            # la mitad de los registros fuera del AMM son de otros municipios de Nuevo León
+            nuevo_leon = amm | (rng.random(n) < 0.5)
+            entity = np.where(nuevo_leon, '19', rng.choice(other_entities, n))
+            munic = np.where(amm, rng.choice(amm_munics, n), rng.choice(other_munics, n))
+
+            ingre = first + rng.integers(0, days, n).astype('timedelta64[D]')
+            egreso = ingre + rng.geometric(0.3, n).astype('timedelta64[D]')
+            # código CIE de 4 caracteres, ejemplo: 'O800'
+            diag = np.char.add(rng.choice(letters, n, p=weights), np.char.zfill(rng.integers(0, 1000, n).astype(str), 3))
+
+            chunk = pd.DataFrame({
+                'ID': np.arange(offset, offset + n),
+                'CLUES': np.char.add('NLSSA', np.char.zfill(rng.integers(0, 2000, n).astype(str), 6)),
+                'INGRE': pd.to_datetime(ingre).strftime('%Y-%m-%d'),
+                'EGRESO': pd.to_datetime(egreso).strftime('%Y-%m-%d'),
+                'EDAD': rng.integers(0, 100, n),
+                'SEXO': rng.integers(1, 3, n),
+                'ENTIDAD': entity,
+                'MUNIC': munic,
+                'DIAG_INI': diag,
+                'AFECPRIN': diag,
+            })
+            chunk.to_csv(file, header=offset == 0, index=False)
+    return filepath
+
+def generate_air_quality(filepath: str, start: str, end: str, seed: int = 0) -> str:
+    '''
+    Genera un archivo filled.csv sintético con un registro por hora
+    de cada estación de estaciones.dat, entre `start` y `end` (incluidos).
+
+    Los contaminantes siguen un ciclo diario con ruido y un nivel propio
+    de cada estación, para que el kriging tenga variación espacial.
+
+    :param start: Fecha inicial, ejemplo: '2018-01-01'.
+
+    :param end: Fecha final, ejemplo: '2018-12-31'.
+
+    :returns: `filepath`.
+    '''
+    rng = np.random.default_rng(seed)
+    stations = pd.read_csv(os.path.join(RESOURCES_DIR, 'estaciones.dat'))['station'].to_numpy()
+    hours = pd.date_range(start, pd.Timestamp(end) + pd.Timedelta(hours=23), freq='h')
+
+    timestamps = np.repeat(hours, len(stations))
+    names = np.tile(stations, len(hours))
+    n = len(timestamps)
+    # ciclo diario, máximo por la tarde
+    cycle = np.sin((timestamps.hour.to_numpy() - 9) / 24 * 2 * np.pi)
+    level = np.tile(rng.uniform(0.6, 1.4, len(stations)), len(hours))
+
+    dataframe = pd.DataFrame({'timestamp': timestamps.strftime('%d-%b-%y %H'), 'station': names})
+    for column in AIR_QUALITY_COLUMNS[2:-2]:
+        base = rng.uniform(10, 60)
+        values = base * level * (1 + 0.3 * cycle) + rng.normal(0, base * 0.1, n)
+        dataframe[column] = np.round(np.abs(values), 2)
+    dataframe['direction'] = np.round(rng.uniform(0, 360, n), 2)
+    dataframe['valid'] = 1
+    dataframe['notes'] = ''
+
+    dataframe[AIR_QUALITY_COLUMNS].to_csv(filepath, index=False)
+    return filepath
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Genera datos sintéticos en <directorio>/resources.')
+    parser.add_argument('directory', help='directorio de trabajo')
+    parser.add_argument('--year', type=int, default=2018, help='año del archivo EGRESO')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='registros del archivo EGRESO')
+    parser.add_argument('--amm-share', type=float, default=0.15, help='proporción de registros del AMM')
+    parser.add_argument('--start', default='2018-01-01', help='fecha inicial de filled.csv')
+    parser.add_argument('--end', default='2018-12-31', help='fecha final de filled.csv')
+    parser.add_argument('--seed', type=int, default=0, help='semilla')
+    args = parser.parse_args()
+
+    resources = copy_resources(args.directory)
+    print(generate_entries(os.path.join(resources, f'EGRESO_{args.year}.csv'), args.year, args.rows, args.amm_share, seed=args.seed))
+    print(generate_air_quality(os.path.join(resources, 'filled.csv'), args.start, args.end, args.seed))
+
+if __name__ == '__main__':
+    main()
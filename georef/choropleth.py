@@ -6,71 +6,166 @@ municipio del AMM y semana epidemiológica.
 AMM = Área Metropolitana de Monterrey
 '''
 
-import itertools
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Union
+from pathlib import Path
+import os
+import string
 
-import plotly
 import plotly.graph_objects as go
 import pandas as pd
+import numpy as np
 import epiweeks
 
 from filter_geojson import read_amm_geojson
-from readers import read_entries, read_amm_municipalities
-
-def group_dates_by_epiweeks(entries_dates: pd.Series) -> pd.Series:
+from output import FigureWriter, OutputOptions
+from profiling import span
+from readers import (
+    read_entries, read_amm_municipalities, filter_entries, get_entries_path, get_entries_source,
+    AMM_MUNICS_PATH, DEFAULT_CHUNKSIZE
+)
+from watermark import get_appended_offset, make_watermark, read_appended
+import results
+
+# domingo con el que empieza la semana epidemiológica número 0,
+# la semana de una fecha es el número de semanas completas desde él
+EPIWEEK_EPOCH = pd.Timestamp('1970-01-04')
+
+class EntriesCube(NamedTuple):
+    '''
+    Conteos densos de ingresos del AMM: `counts[l, m, w]` es el número de casos
+    de la letra de CIE `letters[l]` en el municipio de la fila `m` de `munics`
+    durante la semana epidemiológica `first_week + w`.
+    Las semanas sin casos de un municipio tienen 0, así ningún municipio
+    desaparece del mapa en esas semanas.
+    '''
+    # primeras letras de CIE
+    letters: List[str]
+    # municipios del AMM, con columnas [MUNIC, NOM_MUN]
+    munics: pd.DataFrame
+    # número de la primera semana, ver `get_epiweek_numbers`
+    first_week: int
+    # arreglo de enteros de forma (letras, municipios, semanas)
+    counts: np.ndarray
+
+    def get_week_labels(self) -> List[epiweeks.Week]:
+        '''
+        :returns: Semana epidemiológica de cada índice del último eje de `counts`.
+        '''
+        return [
+            get_epiweek_label(self.first_week + week)
+            for week in range(self.counts.shape[2])
+        ]
+
+    def select(self, cie: str) -> 'EntriesCube':
+        '''
+        :returns: Cubo de solo la letra `cie`, sin las semanas sin casos
+            antes de la primera y después de la última con casos de la letra.
+        '''
+        counts = self.counts[self.letters.index(cie)]
+        weeks = np.flatnonzero(counts.any(axis=0))
+        if len(weeks) == 0:
+            return self._replace(letters=[cie], first_week=0, counts=counts[None, :, :0])
+        return self._replace(
+            letters=[cie],
+            first_week=self.first_week + int(weeks[0]),
+            counts=counts[None, :, weeks[0]:weeks[-1] + 1]
+        )
+
+    def add(self, other: 'EntriesCube') -> 'EntriesCube':
+        '''
+        Suma los conteos de otro cubo de las mismas letras y municipios,
+        ampliando las semanas para cubrir las de ambos.
+        '''
+        if other.counts.shape[2] == 0:
+            return self
+        if self.counts.shape[2] == 0:
+            return other
+        first = min(self.first_week, other.first_week)
+        last = max(
+            self.first_week + self.counts.shape[2],
+            other.first_week + other.counts.shape[2]
+        )
+        counts = np.zeros(self.counts.shape[:2] + (last - first,), dtype=np.int64)
+        for cube in (self, other):
+            start = cube.first_week - first
+            counts[:, :, start:start + cube.counts.shape[2]] += cube.counts
+        return self._replace(first_week=first, counts=counts)
+
+def get_epiweek_numbers(entries_dates: pd.Series) -> np.ndarray:
     '''
-    Agrupa fechas de ingreso for semanas epidemiológicas.
+    Calcula el número consecutivo de la semana epidemiológica
+    (sistema CDC, semanas de domingo a sábado) de cada fecha,
+    en una sola operación vectorizada: semanas completas desde `EPIWEEK_EPOCH`.
+    No requiere que las fechas estén ordenadas.
 
-    :param entries: Columna de fechas de ingreso.
+    :param entries_dates: Columna de fechas de ingreso de tipo datetime.
 
-    :returns: `pandas.Series` de fechas de ingreso ya agrupadas.
+    :returns: Arreglo de enteros, semanas consecutivas tienen números consecutivos.
     '''
-    # años mínimo y máximo que aparecen en el archivo
-    minyear, maxyear = min(entries_dates).year, max(entries_dates).year
+    dates = pd.DatetimeIndex(entries_dates).normalize()
+    return (dates - EPIWEEK_EPOCH).days.to_numpy(dtype=np.int64) // 7
 
-    # unir semanas de los años que aparecen en el archivo
-    # y uno posterior
-    weeks = list(itertools.chain.from_iterable(
-        epiweeks.Year(year).iterweeks()
-        for year in range(minyear, maxyear + 2)
-    ))
+def get_epiweek_label(number: int) -> epiweeks.Week:
+    '''
+    Crea el objeto `epiweeks.Week` de un número de semana, solo para etiquetar.
 
-    # lista de ingresos en semana epidemiológica
-    epidates = list()
-    # índice para iterar las semanas
-    i = 0
-    week = weeks[i]
-    for dfdate in entries_dates.tolist():
-        while True:
-            # si está dentro de la semana actual
-            if week.startdate() <= dfdate <= week.enddate():
-                epidates.append(week)
-                # siguiente ingreso
-                break
-            # si no, siguiente semana
-            # pero mismo ingreso
-            i += 1
-            week = weeks[i]
-    return epidates
+    :param number: Número de semana de `get_epiweek_numbers`.
+    '''
+    sunday = EPIWEEK_EPOCH + pd.Timedelta(weeks=number)
+    return epiweeks.Week.fromdate(sunday.date())
 
-def count_grouped_entries(entries: pd.DataFrame) -> pd.DataFrame:
+def count_entries_cube(
+        entries: pd.DataFrame, munics: pd.DataFrame, cies: Sequence[str],
+        cie_column: str = 'DIAG_INI') -> EntriesCube:
     '''
-    Cuenta los casos de ingresos agrupados por CIE, municipio y semana epidemiológica.
+    Agrupa las fechas de ingreso por semana epidemiológica y cuenta los casos
+    de cada letra de CIE, municipio y semana con un solo `numpy.bincount`
+    sobre códigos enteros, sin agrupar objetos de Python.
 
-    :param entries: `DataFrame` filtrado por CIE, debe contener las columnas:
-        [MUNIC, INGRE]
+    :param entries: Registros ya filtrados por entidad y municipios, con columnas:
+        [INGRE, MUNIC, `cie_column`]
 
-    :returns: `entries` con una columna `CONT`, que cuenta de los casos agrupados.
-    '''
-    # agregar columna de conteos de casos
-    entries['CONT'] = 0
+    :param munics: Municipios del cubo, con columnas [MUNIC, NOM_MUN],
+        se descartan los registros de otros municipios.
 
-    # contar casos
-    return (entries
-        .groupby(['MUNIC', 'INGRE'])
-        .count()
-        .reset_index())
+    :param cies: Primeras letras de CIE ordenadas, se descartan las demás.
+        También puede ser un solo prefijo de CIE si `entries` ya está filtrado por él.
 
-def get_amm_entries(year: int, cie: str) -> pd.DataFrame:
+    :returns: Cubo de conteos, desde la primera hasta la última semana con casos.
+    '''
+    with span('filter', rows=len(entries)):
+        # códigos enteros de letra y municipio, -1 si no se pidieron
+        letter_codes = pd.Index([cie[0] for cie in cies]).get_indexer(entries[cie_column].str[0])
+        munic_codes = pd.Index(munics['MUNIC']).get_indexer(entries['MUNIC'])
+        valid = (letter_codes >= 0) & (munic_codes >= 0)
+        letter_codes = letter_codes[valid].astype(np.int64)
+        munic_codes = munic_codes[valid].astype(np.int64)
+        dates = pd.to_datetime(entries['INGRE']).to_numpy()[valid]
+
+    with span('epiweeks', rows=len(dates)):
+        weeks = get_epiweek_numbers(dates)
+
+    with span('aggregate', rows=len(weeks)):
+        shape = (len(cies), len(munics))
+        if len(weeks) == 0:
+            return EntriesCube(list(cies), munics, 0, np.zeros(shape + (0,), dtype=np.int64))
+
+        first = int(weeks.min())
+        nweeks = int(weeks.max()) - first + 1
+        # índice plano de cada registro en el cubo (letra, municipio, semana)
+        cells = (letter_codes * shape[1] + munic_codes) * nweeks + (weeks - first)
+        counts = np.bincount(cells, minlength=shape[0] * shape[1] * nweeks)
+        return EntriesCube(list(cies), munics, first, counts.reshape(shape + (nweeks,)))
+
+def read_cube_munics() -> pd.DataFrame:
+    '''
+    :returns: Municipios del AMM ordenados por clave, las filas de los cubos.
+    '''
+    return read_amm_municipalities().sort_values('MUNIC', ignore_index=True)
+
+def compute_amm_entries(year: int, cie: str, chunksize: int = DEFAULT_CHUNKSIZE) -> EntriesCube:
     '''
     Filtra solamente los ingresos del AMM, agrupa las fechas
     por semana epidemiológica y cuenta los casos de CIE.
@@ -79,155 +174,400 @@ def get_amm_entries(year: int, cie: str) -> pd.DataFrame:
 
     :param cie: Primera letra de CIE.
 
-    :returns: Registros de ingresos del AMM, y con columnas extras:
-        [NOM_MUN, LETRA_CIE, CONT]
+    :param chunksize: Registros por bloque si se lee el CSV sin caché.
+
+    :returns: Cubo de conteos de ingresos del AMM de la letra `cie`.
     '''
-    entries = read_entries(year)
-    amm_munics = read_amm_municipalities()
+    amm_munics = read_cube_munics()
 
-    # filtrar registros por
-    entries_amm = entries[
+    # leer registros filtrados por
+    entries_amm = read_entries(
+        year,
         # Nuevo León
-        (entries['ENTIDAD'] == '19') &
+        entity='19',
         # municipios del AMM
-        entries['MUNIC'].isin(amm_munics['MUNIC']) &
+        munics=amm_munics['MUNIC'],
         # primera letra de CIE coincide con el parámetro
-        entries['DIAG_INI'].str.startswith(cie)
-    # las columnas del estado y CIE ya no se usarán
-    ].drop(columns=['ENTIDAD', 'DIAG_INI'])
+        cie=cie,
+        chunksize=chunksize
+    )
+    return count_entries_cube(entries_amm, amm_munics, [cie])
 
-    # convertir columna de ingresos a tipo datetime
-    entries_amm['INGRE'] = pd.to_datetime(entries_amm['INGRE'])
-    # ordenar ascendente por ingresos
-    entries_amm.sort_values('INGRE', inplace=True)
-    # agrupar fechas de ingreso por semanas epidemiológicas
-    entries_amm['INGRE'] = group_dates_by_epiweeks(entries_amm['INGRE'])
+def get_amm_entries(year: int, cie: str, chunksize: int = DEFAULT_CHUNKSIZE) -> EntriesCube:
+    '''
+    Igual que `compute_amm_entries`, pero si el archivo del año y los municipios
+    no han cambiado usa los conteos guardados de una ejecución anterior,
+    ver `results`.
+    '''
+    key = results.make_key(
+        'amm_entries', [get_entries_source(year), AMM_MUNICS_PATH],
+        year=year, cie=cie
+    )
+    return results.cached(key, lambda: compute_amm_entries(year, cie, chunksize))
 
-    entries_amm = count_grouped_entries(entries_amm)
+def compute_amm_entries_by_cie(year: int, cies: Iterable[str], chunksize: int = DEFAULT_CHUNKSIZE) -> EntriesCube:
+    '''
+    Igual que `compute_amm_entries` pero para varias letras de CIE a la vez:
+    lee el archivo una sola vez y cuenta los casos de todas las letras
+    en un solo cubo.
 
-    # agregar columna con nombres de municipios
-    entries_amm = amm_munics.merge(entries_amm, on='MUNIC')
+    :param year: Año del archivo a leer (EGRESO_`year`.csv).
 
-    return entries_amm
+    :param cies: Primeras letras de CIE.
 
-def plot_entries_choropleth(year: int, cie: str, output: str = '') -> None:
+    :param chunksize: Registros por bloque si se lee el CSV sin caché.
+
+    :returns: Cubo de conteos de ingresos del AMM de las letras `cies`.
+    '''
+    amm_munics = read_cube_munics()
+
+    # leer registros de Nuevo León y municipios del AMM, de cualquier CIE
+    entries_amm = read_entries(
+        year,
+        entity='19',
+        munics=amm_munics['MUNIC'],
+        chunksize=chunksize
+    )
+    return count_entries_cube(entries_amm, amm_munics, sorted(set(cies)))
+
+def get_amm_entries_by_cie(year: int, cies: Iterable[str], chunksize: int = DEFAULT_CHUNKSIZE) -> EntriesCube:
+    '''
+    Igual que `compute_amm_entries_by_cie`, usando los conteos guardados
+    si las entradas no han cambiado, ver `get_amm_entries`.
+    '''
+    cies = sorted(set(cies))
+    key = results.make_key(
+        'amm_entries_by_cie', [get_entries_source(year), AMM_MUNICS_PATH],
+        year=year, cies=cies
+    )
+    return results.cached(key, lambda: compute_amm_entries_by_cie(year, cies, chunksize))
+
+def update_amm_entries(year: int, chunksize: int = DEFAULT_CHUNKSIZE) -> EntriesCube:
+    '''
+    Conteos de todas las letras de CIE del año, actualizados con una marca de agua
+    (ver `watermark`): si a EGRESO_`year`.csv solo se le agregaron registros
+    desde la última actualización, se leen y cuentan solo esos registros
+    y se suman a los conteos guardados, así solo cambian las semanas
+    epidemiológicas de los registros nuevos.
+
+    Si no hay conteos guardados o el archivo cambió en otra parte,
+    se cuenta el archivo completo. Sin el CSV (solo con su caché columnar)
+    es igual que `get_amm_entries_by_cie`.
+
+    :returns: Cubo de conteos de ingresos del AMM de todas las letras.
+    '''
+    cies = list(string.ascii_uppercase)
+    csvpath = get_entries_path(year)
+    if not os.path.exists(csvpath):
+        return get_amm_entries_by_cie(year, cies, chunksize)
+
+    # la llave no depende del CSV, que cambia en cada lote
+    key = results.make_key('amm_entries_update', [AMM_MUNICS_PATH], year=year)
+    saved = results.load(key)
+    offset = get_appended_offset(csvpath, saved['watermark']) if saved else None
+
+    if offset is None:
+        print(f'{csvpath}: Contando registros...', flush=True)
+        mark = make_watermark(csvpath)
+        cube = compute_amm_entries_by_cie(year, cies, chunksize)
+        # si el archivo creció durante la lectura no se sabe hasta dónde se leyó,
+        # se guardan los conteos sin marca para contarlo completo la próxima vez
+        if os.path.getsize(csvpath) != mark['offset']:
+            mark = None
+    else:
+        columns = ['INGRE', 'ENTIDAD', 'MUNIC', 'DIAG_INI']
+        with span('read', year=year, source='appended') as record:
+            appended, end = read_appended(
+                csvpath, offset, usecols=columns,
+                dtype={'ENTIDAD': str, 'MUNIC': str, 'INGRE': str}
+            )
+            record['rows'] = len(appended)
+        mark = make_watermark(csvpath, end)
+
+        cube = saved['counts']
+        appended = filter_entries(appended.dropna(), entity='19', munics=cube.munics['MUNIC'])
+        new_cube = count_entries_cube(appended, cube.munics, cies)
+        print(
+            f'{csvpath}: {len(appended)} registros nuevos del AMM, '
+            f'{np.count_nonzero(new_cube.counts.any(axis=(0, 1)))} semanas actualizadas',
+            flush=True
+        )
+        # sumar a los conteos guardados, las semanas sin registros nuevos no cambian
+        cube = cube.add(new_cube)
+
+    results.store(key, {'watermark': mark, 'counts': cube})
+    return cube
+
+def get_year_entries(
+        year: int, cies: Sequence[str], chunksize: int = DEFAULT_CHUNKSIZE,
+        update: bool = False) -> EntriesCube:
+    '''
+    :returns: Cubo de conteos de un año, de `update_amm_entries` si `update`,
+        o de `get_amm_entries` con una sola letra y `get_amm_entries_by_cie` con varias.
+    '''
+    if update:
+        return update_amm_entries(year, chunksize)
+    if len(cies) == 1:
+        return get_amm_entries(year, cies[0], chunksize)
+    return get_amm_entries_by_cie(year, cies, chunksize)
+
+def get_years_entries(
+        years: Sequence[int], cies: Iterable[str], chunksize: int = DEFAULT_CHUNKSIZE,
+        update: bool = False, workers: Optional[int] = None) -> EntriesCube:
+    '''
+    Cubo de conteos de varios años en una sola línea de tiempo de semanas epidemiológicas.
+    Cada archivo se lee y se agrega en su propio proceso, que solo regresa
+    el cubo del AMM, así el tiempo depende del archivo más grande y no de la suma.
+
+    :param years: Años de los archivos a leer (EGRESO_`year`.csv).
+
+    :param cies: Primeras letras de CIE.
+
+    :param chunksize: Registros por bloque si se lee el CSV sin caché.
+
+    :param update: Usar los conteos de `update_amm_entries`.
+
+    :param workers: Número de procesos, por defecto uno por año
+        hasta el número de núcleos. Con 1 se leen en serie.
+
+    :returns: Suma de los cubos de todos los años.
+    '''
+    cies = sorted(set(cies))
+    workers = min(workers or os.cpu_count() or 1, len(years))
+    with span('years', years=len(years), workers=workers):
+        if workers == 1:
+            cubes = [get_year_entries(year, cies, chunksize, update) for year in years]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                cubes = list(executor.map(
+                    get_year_entries, years, repeat(cies), repeat(chunksize), repeat(update)
+                ))
+
+    # las semanas se numeran igual en todos los años, solo se suman los cubos
+    cube = cubes[0]
+    for other in cubes[1:]:
+        cube = cube.add(other)
+    return cube
+
+def get_years_label(years: Sequence[int]) -> str:
+    '''
+    :returns: '2018' con un año, '2015-2020' con varios.
+    '''
+    if len(years) == 1:
+        return str(years[0])
+    return f'{min(years)}-{max(years)}'
+
+def plot_entries_choropleth(
+        year: Union[int, Sequence[int]], cie: str, output: str = '',
+        chunksize: int = DEFAULT_CHUNKSIZE, detail: str = 'full',
+        options: Optional[OutputOptions] = None, update: bool = False,
+        workers: Optional[int] = None) -> None:
     '''
     Genera un mapa coroplético animado sobre el conteo de
     ingresos por municipio, CIE y semana epidemiológica.
 
-    :param year: Año del archivo a leer (EGRESO_`year`.csv).
+    :param year: Año del archivo a leer (EGRESO_`year`.csv), o lista de años
+        para una sola animación de todas sus semanas con la misma escala de colores.
 
     :param cie: Primera letra de CIE.
 
     :param output: Ruta relativa del archivo HTML para guardar el mapa coroplético.
+
+    :param chunksize: Registros por bloque si se lee el CSV sin caché.
+
+    :param detail: Nivel de detalle de los polígonos de municipios,
+        ver `filter_geojson.DETAIL_LEVELS`.
+
+    :param options: Opciones de salida del HTML, ver `output.OutputOptions`.
+
+    :param update: Usar los conteos de `update_amm_entries`, que solo cuentan
+        los registros agregados al archivo desde la última actualización.
+
+    :param workers: Número de procesos para leer varios años, ver `get_years_entries`.
     '''
+    years = [year] if isinstance(year, int) else list(year)
+    label = get_years_label(years)
     # si no se especificó nombre de archivo, generar uno
-    filepath = output if output else f'ingresos_{cie}_{year}.html'
+    filepath = output if output else f'ingresos_{cie}_{label}.html'
     print(f'{filepath}: Preparando datos...', flush=True)
 
-    entries_amm = get_amm_entries(year, cie)
-    # límites de casos por archivo (año)
-    mincount, maxcount = min(entries_amm['CONT']), max(entries_amm['CONT'])
+    cube = get_years_entries(years, [cie], chunksize, update, workers).select(cie)
+    if not cube.counts.any():
+        print(f'{filepath}: Sin ingresos de CIE {cie}, no se generó el mapa', flush=True)
+        return
+    render_entries_choropleth(cube, label, cie, filepath, detail, options)
+
+def plot_entries_choropleths(
+        year: Union[int, Sequence[int]], cies: Iterable[str], output: str = '',
+        chunksize: int = DEFAULT_CHUNKSIZE, detail: str = 'full',
+        options: Optional[OutputOptions] = None, update: bool = False,
+        workers: Optional[int] = None) -> None:
+    '''
+    Genera un mapa coroplético por cada letra de CIE en `cies`,
+    leyendo y agregando el archivo de cada año una sola vez.
+
+    :param year: Año del archivo a leer (EGRESO_`year`.csv), o lista de años,
+        ver `plot_entries_choropleth`.
 
-    munics_geojson = read_amm_geojson()
+    :param cies: Primeras letras de CIE.
 
-    # por cada letra inicial de los CIE
-    # for cie_letter in entries_amm['LETRA_CIE'].unique():
+    :param output: Ruta relativa base de los archivos HTML, a su nombre
+        se le agrega la letra de CIE, ejemplo: 'mapa.html' -> 'mapa_O.html'.
+        Si no se especifica, se usa el mismo nombre que `plot_entries_choropleth`.
 
-    # filtrar ingresos por la letra CIE
-    entries_amm = entries_amm.sort_values('INGRE')
+    :param chunksize: Registros por bloque si se lee el CSV sin caché.
 
-    # listas para animación del mapa
-    frames, steps = list(), list()
+    :param detail: Nivel de detalle de los polígonos de municipios,
+        ver `filter_geojson.DETAIL_LEVELS`.
+
+    :param options: Opciones de salida del HTML, ver `output.OutputOptions`.
+
+    :param update: Usar los conteos de `update_amm_entries`.
+
+    :param workers: Número de procesos para leer varios años, ver `get_years_entries`.
+    '''
+    years = [year] if isinstance(year, int) else list(year)
+    label = get_years_label(years)
+    print(f'EGRESO_{label}.csv: Preparando datos...', flush=True)
+    cube = get_years_entries(years, cies, chunksize, update, workers)
+
+    for cie in sorted(set(cies)):
+        if output:
+            path = Path(output)
+            filepath = str(path.with_name(f'{path.stem}_{cie}{path.suffix}'))
+        else:
+            filepath = f'ingresos_{cie}_{label}.html'
+
+        cube_cie = cube.select(cie)
+        if not cube_cie.counts.any():
+            print(f'{filepath}: Sin ingresos de CIE {cie}, no se generó el mapa', flush=True)
+            continue
+        render_entries_choropleth(cube_cie, label, cie, filepath, detail, options)
+
+def render_entries_choropleth(
+        cube: EntriesCube, year: Union[int, str], cie: str, filepath: str,
+        detail: str = 'full', options: Optional[OutputOptions] = None) -> None:
+    '''
+    Dibuja y guarda el mapa coroplético de conteos ya agregados.
+    Cada cuadro es una columna del cubo, con todos los municipios.
+
+    :param cube: Cubo de conteos de una letra de CIE, con al menos una semana,
+        ver `EntriesCube.select`.
+
+    :param year: Año o rango de años de los conteos, ejemplo: '2015-2020', para el título.
+
+    :param cie: Primera letra de CIE, para el título.
+
+    :param filepath: Ruta relativa del archivo HTML para guardar el mapa coroplético.
+
+    :param detail: Nivel de detalle de los polígonos de municipios.
+
+    :param options: Opciones de salida del HTML.
+    '''
+    # matriz de municipios por semanas
+    counts = cube.counts[0]
+    # límites de casos de todas las semanas, una sola escala para toda la animación
+    mincount, maxcount = int(counts.min()), int(counts.max())
+
+    munics_geojson = read_amm_geojson(detail)
+
+    # pasos del deslizador, los cuadros se escriben al archivo conforme se crean
+    steps = list()
+    first = None
 
     print(f'{filepath}: Generando mapa coroplético...', flush=True)
-    # por cada semana en los ingresos del CIE actual
-    for week in entries_amm['INGRE'].unique():
-        # filtrar ingresos por la semana
-        entries_ingre = entries_amm[
-            entries_amm['INGRE'] == week
-        ].sort_values('MUNIC')
-
-        label = f'{week.year}, semana {week.week}'
-        name = f'frame_{week}'
-        frames.append({
-            'name': name,
-            'data': [
-                # mapa coroplético
-                dict(
-                    type='choroplethmapbox',
-                    geojson=munics_geojson,
-                    locations=entries_ingre['MUNIC'],
-                    z=entries_ingre['CONT'],
-                    zmin=mincount,
-                    zmax=maxcount,
-                    hoverinfo='z+text+name',
-                    text=entries_ingre['NOM_MUN'],
-                    name='Casos en',
-                    colorscale='Viridis',
-                    marker_opacity=0.5,
-                    marker_line_width=0,
-                )
-            ]
-        })
-        steps.append({
-            'label': label,
-            'method': 'animate',
-            'args': [
-                [name],
-                {
-                    'mode': 'immediate',
-                    'frame': {
-                        'duration': 500,
-                        'redraw': True
-                    },
-                    'transition': {'duration': 300}
-                }
-            ]
-        })
-
-    sliders = [{
-        'transition': {'duration': 300},
-        'x': 0.08,
-        'len': 0.88,
-        'currentvalue': {'xanchor': 'center'},
-        'steps': steps
-    }]
-
-    playbtn = [{
-        'type': 'buttons',
-        'showactive': True,
-        'x': 0.045, 'y': -0.08,
-        'buttons': [{
-            'label': 'Play',
-            'method': 'animate',
-            'args': [
-                None,
-                {
-                    'mode': 'immediate',
-                    'frame': {
-                        'duration': 500,
-                        'redraw': True
-                    },
-                    'transition': {'duration': 300},
-                    'fromcurrent': True
-                }
-            ]
+    with FigureWriter(filepath, options) as writer:
+        # por cada semana del cubo, incluso sin casos
+        for i, week in enumerate(cube.get_week_labels()):
+            label = f'{week.year}, semana {week.week}'
+            name = f'frame_{week}'
+            # cada cuadro solo lleva los conteos de la semana, los municipios
+            # son los mismos en todas; Plotly.animate los combina con la traza base,
+            # que conserva municipios, GeoJSON y estilo, así se escriben una sola vez
+            frame = {
+                'name': name,
+                'data': [
+                    dict(
+                        type='choroplethmapbox',
+                        z=counts[:, i],
+                    )
+                ]
+            }
+            with span('frame', week=str(week)):
+                writer.add_frame(frame)
+            if first is None:
+                first = frame
+            steps.append({
+                'label': label,
+                'method': 'animate',
+                'args': [
+                    [name],
+                    {
+                        'mode': 'immediate',
+                        'frame': {
+                            'duration': 500,
+                            'redraw': True
+                        },
+                        'transition': {'duration': 300}
+                    }
+                ]
+            })
+
+        sliders = [{
+            'transition': {'duration': 300},
+            'x': 0.08,
+            'len': 0.88,
+            'currentvalue': {'xanchor': 'center'},
+            'steps': steps
         }]
-    }]
-
-    layout = go.Layout(
-        title=f'Archivo: EGRESOS_{year}     CIE: {cie}',
-        mapbox_style='carto-positron',
-        mapbox_zoom=9.5,
-        mapbox_center = {'lat': 25.680, 'lon': -100.249},
-        sliders=sliders,
-        updatemenus=playbtn
-    )
 
-    data = frames[0]['data']
-    figure = go.Figure(data=data, layout=layout, frames=frames)
+        playbtn = [{
+            'type': 'buttons',
+            'showactive': True,
+            'x': 0.045, 'y': -0.08,
+            'buttons': [{
+                'label': 'Play',
+                'method': 'animate',
+                'args': [
+                    None,
+                    {
+                        'mode': 'immediate',
+                        'frame': {
+                            'duration': 500,
+                            'redraw': True
+                        },
+                        'transition': {'duration': 300},
+                        'fromcurrent': True
+                    }
+                ]
+            }]
+        }]
 
-    print(f'{filepath}: Guardando mapa en archivo...', flush=True)
-    # guardar mapa en archivo
-    plotly.offline.plot(figure, filename=filepath)
+        layout = go.Layout(
+            title=f'Archivo: EGRESOS_{year}     CIE: {cie}',
+            mapbox_style='carto-positron',
+            mapbox_zoom=9.5,
+            mapbox_center = {'lat': 25.680, 'lon': -100.249},
+            sliders=sliders,
+            updatemenus=playbtn
+        )
+
+        # mapa coroplético base, con los datos de la primera semana
+        data = [
+            dict(
+                first['data'][0],
+                locations=cube.munics['MUNIC'].to_numpy(),
+                text=cube.munics['NOM_MUN'].to_numpy(),
+                geojson=munics_geojson,
+                zmin=mincount,
+                zmax=maxcount,
+                hoverinfo='z+text+name',
+                name='Casos en',
+                colorscale='Viridis',
+                marker_opacity=0.5,
+                marker_line_width=0,
+            )
+        ]
+        print(f'{filepath}: Guardando mapa en archivo...', flush=True)
+        # escribir traza base y diseño al final del archivo
+        writer.finish(data, layout)
@@ -3,13 +3,57 @@ Funciones para la consola de comandos (CLI).
 '''
 
 import sys
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
 from typing import Optional, List
 from pathlib import Path
 import string
 
-from heatmap import plot_heatmap
-from choropleth import plot_entries_choropleth
+# solo módulos sin dependencias externas, los de cada mapa
+# se importan al ejecutar su subcomando para que la CLI inicie rápido
+from filter_geojson import DETAIL_LEVELS
+from settings import DEFAULT_CHUNKSIZE, INTERPOLATION_METHODS, RESULTS_DIR, RESULTS_MAX_BYTES
+import profiling
+
+def cie_letter(value: str) -> str:
+    '''
+    Valida que `value` sea una letra de CIE.
+
+    :returns: La letra en mayúscula.
+    '''
+    letter = value.upper()
+    if len(letter) != 1 or letter not in string.ascii_uppercase:
+        raise ArgumentTypeError(f'letra de CIE inválida: {value!r}')
+    return letter
+
+def year_range(value: str) -> List[int]:
+    '''
+    Valida que `value` sea un año o un rango de años, ejemplos: '2018', '2015-2020'.
+
+    :returns: Lista de años del rango, incluyendo el último.
+    '''
+    start, _, end = value.partition('-')
+    try:
+        first = int(start)
+        last = int(end) if end else first
+    except ValueError:
+        raise ArgumentTypeError(f'año inválido: {value!r}')
+    if last < first:
+        raise ArgumentTypeError(f'rango de años inválido: {value!r}')
+    return list(range(first, last + 1))
+
+def positive_int(value: str) -> int:
+    '''
+    Valida que `value` sea un entero mayor que cero, ejemplo: '100000'.
+
+    :returns: El entero.
+    '''
+    try:
+        number = int(value)
+    except ValueError:
+        raise ArgumentTypeError(f'entero inválido: {value!r}')
+    if number <= 0:
+        raise ArgumentTypeError(f'debe ser mayor que cero: {value!r}')
+    return number
 
 def parse_arguments(optional_args: Optional[List[str]] = None) -> None:
     '''
@@ -53,12 +97,48 @@ def parse_arguments(optional_args: Optional[List[str]] = None) -> None:
             La ruta debe contener carpetas existentes.
             Ejemplos: diractual.html , carpetas/existentes/mapa.html'''
     )
+    common_args_parser.add_argument(
+        '--precision',
+        metavar='N',
+        type=int,
+        help='''Redondea coordenadas y valores del mapa a N decimales
+            para reducir el tamaño del archivo.'''
+    )
+    common_args_parser.add_argument(
+        '--binary',
+        action='store_true',
+        help='''Guarda los arreglos numéricos del mapa codificados en binario (base64)
+            en lugar de texto JSON, el archivo pesa menos y carga más rápido.'''
+    )
+    common_args_parser.add_argument(
+        '--plotlyjs',
+        metavar='MODE',
+        default='inline',
+        help='''Cómo incluir la librería plotly.js: 'inline' dentro del archivo (por defecto),
+            'cdn' referenciada en línea, 'directory' como archivo 'plotly.min.js'
+            junto al HTML, o una ruta o URL terminada en '.js'.'''
+    )
+    common_args_parser.add_argument(
+        '--recompute',
+        action='store_true',
+        help='''Ignora los resultados guardados de ejecuciones anteriores
+            (conteos de ingresos y mallas de kriging) y los vuelve a calcular.'''
+    )
+    common_args_parser.add_argument(
+        '--profile',
+        metavar='FILEPATH',
+        type=Path,
+        help='''Mide cada etapa (lectura, filtrado, semanas epidemiológicas, agregación,
+            kriging, cuadros y escritura) y guarda la traza en un archivo JSON
+            con tiempo real, tiempo de CPU, registros procesados y cambio de memoria.'''
+    )
 
     cm_help = '''Mapa coroplético que muestra el conteo de casos de ingresos
         agrupados por municipio, CIE y semana epidemiológica
-        de un año específico.'''
+        de un año o rango de años específico.'''
     cm_description = f'''Genera un {cm_help[0].lower()}{cm_help[1:]}
-        Ejemplo: georef cm 2018 O'''
+        Ejemplos: georef cm 2018 O , georef cm 2018 A J O , georef cm 2018 --all-cie ,
+        georef cm 2015-2020 J'''
     # subparser de argumentos para mapa coroplético
     choropleth_parser = maptypes.add_parser(
         'choroplethmap',
@@ -69,13 +149,67 @@ def parse_arguments(optional_args: Optional[List[str]] = None) -> None:
     )
     choropleth_parser.add_argument(
         'year',
-        type=int,
-        help='Año del archivo de egresos a leer: EGRESOS_{year}.csv'
+        type=year_range,
+        help='''Año del archivo de egresos a leer: EGRESOS_{year}.csv.
+            Con un rango, ejemplo: 2015-2020, se leen los archivos de todos
+            los años en paralelo y se genera una sola animación
+            con la misma escala de colores'''
     )
     choropleth_parser.add_argument(
         'cie',
-        choices=string.ascii_uppercase,
-        help='Primera letra del diagnóstico CIE'
+        nargs='*',
+        type=cie_letter,
+        help='''Primera letra del diagnóstico CIE.
+            Si se especifican varias, se genera un mapa por letra
+            leyendo el archivo una sola vez'''
+    )
+    choropleth_parser.add_argument(
+        '-a', '--all-cie',
+        action='store_true',
+        help='''Genera un mapa por cada letra de CIE (A-Z),
+            leyendo el archivo una sola vez.
+            Con '-o', a cada nombre de archivo se le agrega la letra.'''
+    )
+    choropleth_parser.add_argument(
+        '-c', '--cache',
+        action='store_true',
+        help='''Antes de generar el mapa, convierte EGRESO_{year}.csv en un caché
+            columnar en la carpeta 'resources/cache'.
+            Solo es necesario una vez por año (o si el CSV cambia),
+            las siguientes ejecuciones lo usarán automáticamente.'''
+    )
+    choropleth_parser.add_argument(
+        '-u', '--update',
+        action='store_true',
+        help='''Para archivos que reciben lotes nuevos de registros al final:
+            solo cuenta los registros agregados a EGRESO_{year}.csv desde la última
+            ejecución con '-u' y los suma a los conteos guardados.
+            La primera vez cuenta el archivo completo.'''
+    )
+    choropleth_parser.add_argument(
+        '--chunksize',
+        metavar='N',
+        type=positive_int,
+        default=DEFAULT_CHUNKSIZE,
+        help=f'''Número de registros por bloque al leer el CSV sin caché.
+            Solo se conservan en memoria los registros filtrados de cada bloque,
+            valores menores reducen la memoria usada. Por defecto: {DEFAULT_CHUNKSIZE}'''
+    )
+    choropleth_parser.add_argument(
+        '-w', '--workers',
+        metavar='N',
+        type=positive_int,
+        help='''Número de procesos para leer los archivos de un rango de años,
+            uno por archivo. Por defecto uno por año hasta el número de núcleos,
+            con 1 se leen en serie.'''
+    )
+    choropleth_parser.add_argument(
+        '-d', '--detail',
+        choices=DETAIL_LEVELS,
+        default='full',
+        help='''Nivel de detalle de los polígonos de municipios.
+            Los niveles menores pesan menos y se dibujan más rápido
+            conservando las fronteras entre municipios. Por defecto: full'''
     )
 
     hm_help = '''Mapa de calor que muestra la densidad de un contaminante
@@ -83,7 +217,7 @@ def parse_arguments(optional_args: Optional[List[str]] = None) -> None:
         del viento de una fecha específica.
         Requiere tener un token de Mapbox.'''
     hm_description = f'''Genera un {hm_help[0].lower()}{hm_help[1:]}
-        Ejemplo: georef hm PM10 25-Dec-18'''
+        Ejemplos: georef hm PM10 25-Dec-18 , georef hm PM10 1-Dec-18 --end 7-Dec-18 --per-day'''
     # subparser de argumentos para mapa de calor
     heat_parser = maptypes.add_parser(
         'heatmap',
@@ -107,10 +241,129 @@ def parse_arguments(optional_args: Optional[List[str]] = None) -> None:
         '-t', '--token',
         metavar='FILEPATH',
         type=Path,
-        required=True,
-        help='''Ruta relativa del archivo que contiene el token de Mapbox.
+        help='''Ruta relativa del archivo que contiene el token de Mapbox,
+            necesario excepto con '--export'.
             Más información: https://docs.mapbox.com/help/tutorials/get-started-tokens-api/'''
     )
+    heat_parser.add_argument(
+        '-e', '--end',
+        metavar='DATE',
+        help='''Fecha final (incluida) para generar un rango de días desde 'date',
+            con el mismo formato. Los días se procesan uno a la vez.'''
+    )
+    heat_parser.add_argument(
+        '--stride',
+        metavar='N',
+        type=int,
+        default=1,
+        help='Solo grafica las horas múltiplo de N, ejemplo: 3 -> 0, 3, 6... Por defecto: 1'
+    )
+    heat_parser.add_argument(
+        '--per-day',
+        action='store_true',
+        help='''Con un rango de días, crea un archivo por día en lugar de
+            una sola animación. Con '-o', a cada nombre de archivo se le agrega la fecha.'''
+    )
+    heat_parser.add_argument(
+        '-c', '--cache',
+        action='store_true',
+        help='''Antes de generar el mapa, convierte 'filled.csv' en un almacén
+            particionado por mes en la carpeta 'resources/cache/filled'.
+            Solo es necesario una vez (o si el CSV cambia),
+            las siguientes ejecuciones solo leerán los meses necesarios.'''
+    )
+    heat_parser.add_argument(
+        '-u', '--update',
+        action='store_true',
+        help='''Antes de generar el mapa, agrega al almacén particionado solo los
+            registros agregados a 'filled.csv' desde la última vez (lo crea si no existe).
+            Las horas que ya se interpolaron se toman de los resultados guardados,
+            así actualizar el mapa del día solo interpola las horas nuevas.'''
+    )
+    heat_parser.add_argument(
+        '-w', '--workers',
+        metavar='N',
+        type=positive_int,
+        help='''Número de procesos para generar las horas del mapa en paralelo.
+            Por defecto usa todos los núcleos, con 1 se generan en serie.'''
+    )
+    heat_parser.add_argument(
+        '--export',
+        metavar='FILEPATH',
+        type=Path,
+        help='''En lugar del mapa, guarda las mallas interpoladas de cada hora
+            (contaminante, velocidad y dirección del viento) en un archivo binario
+            que se puede leer por partes sin volver a interpolar,
+            ver 'raster.py'. Acepta '--end', '--stride' y '--method'.'''
+    )
+    heat_parser.add_argument(
+        '-m', '--method',
+        choices=INTERPOLATION_METHODS,
+        default='kriging',
+        help='''Método de interpolación de las mallas. 'idw' (distancia inversa ponderada)
+            y 'nearest' (vecino más cercano) son aproximados pero mucho más rápidos,
+            para vistas previas. Por defecto: kriging'''
+    )
+
+    # subparser para administrar los resultados guardados
+    cache_parser = maptypes.add_parser(
+        'cache',
+        help='Administra los resultados guardados de ejecuciones anteriores.',
+        description=f'''Los conteos de ingresos y las mallas de kriging se guardan en
+            '{RESULTS_DIR}' para no recalcularlos si sus datos no cambian.
+            Ejemplos: georef cache info , georef cache clear'''
+    )
+    cache_parser.add_argument(
+        'action',
+        choices=['info', 'clear', 'prune'],
+        help=''''info' muestra cuántos resultados hay y cuánto ocupan,
+            'clear' los borra todos y 'prune' borra los usados hace más tiempo
+            hasta ocupar a lo más --max-size.'''
+    )
+    cache_parser.add_argument(
+        '--max-size',
+        metavar='MB',
+        type=float,
+        default=RESULTS_MAX_BYTES / 2**20,
+        help=f'''Tamaño máximo en MB para 'prune'. Después de cada mapa
+            se aplica el mismo límite. Por defecto: {RESULTS_MAX_BYTES // 2**20}'''
+    )
+
+    # subparser del servidor de mapas
+    serve_parser = maptypes.add_parser(
+        'serve',
+        help='Inicia un servidor HTTP local que genera los mapas bajo pedido.',
+        description='''Inicia un servidor HTTP local que conserva en memoria los datos
+            de los mapas entre peticiones y responde cada mapa en HTML o JSON.
+            Ejemplos: georef serve -t token.txt , y abrir
+            http://127.0.0.1:8000/choropleth?year=2018&cie=J o
+            http://127.0.0.1:8000/heatmap?pollutant=PM10&date=15-Dec-18&format=json'''
+    )
+    serve_parser.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help='Dirección en la que escucha el servidor. Por defecto: 127.0.0.1'
+    )
+    serve_parser.add_argument(
+        '-p', '--port',
+        type=int,
+        default=8000,
+        help='Puerto del servidor. Por defecto: 8000'
+    )
+    serve_parser.add_argument(
+        '-t', '--token',
+        metavar='FILEPATH',
+        type=Path,
+        help='''Ruta relativa del archivo que contiene el token de Mapbox,
+            sin él solo se sirven mapas coropléticos.'''
+    )
+    serve_parser.add_argument(
+        '-w', '--workers',
+        metavar='N',
+        type=positive_int,
+        help='''Número de procesos para el kriging de los mapas de calor,
+            compartidos por todas las peticiones. Por defecto usa todos los núcleos.'''
+    )
 
     # si el comando no recibe argumentos
     if len(sys.argv) == 1:
@@ -120,19 +373,113 @@ def parse_arguments(optional_args: Optional[List[str]] = None) -> None:
     # leer argumentos de consola
     arguments = parser.parse_args(optional_args)
 
+    if arguments.maptype == 'cache':
+        run_cache_command(arguments.action, int(arguments.max_size * 2**20))
+        return
+
+    if arguments.maptype == 'serve':
+        from server import serve
+        token = str(arguments.token) if arguments.token else None
+        serve(arguments.host, arguments.port, token, arguments.workers)
+        return
+
+    from output import OutputOptions
+    import results
+
+    if arguments.recompute:
+        results.set_use_saved(False)
+
     # ruta del archivo, si no especificó, usar string vacío
     filepath = str(arguments.output) if arguments.output else ''
+    options = OutputOptions(
+        precision=arguments.precision,
+        binary=arguments.binary,
+        plotlyjs=True if arguments.plotlyjs == 'inline' else arguments.plotlyjs
+    )
+
+    if arguments.profile:
+        profiling.enable()
+    try:
+        with profiling.span('run', command=arguments.maptype):
+            # no es necesario checar si el subcomando 'maptype' existe porque es obligatorio
+            if arguments.maptype in ('cm', 'choroplethmap'):
+                years = arguments.year
+                cies = list(string.ascii_uppercase) if arguments.all_cie else arguments.cie
+                if not cies:
+                    choropleth_parser.error('se requiere al menos una letra de CIE o --all-cie')
+                from choropleth import plot_entries_choropleth, plot_entries_choropleths
+                from readers import build_entries_cache
+                if arguments.cache:
+                    for year in years:
+                        print(f'EGRESO_{year}.csv: Creando caché columnar...', flush=True)
+                        with profiling.span('cache', year=year):
+                            build_entries_cache(year)
+                if len(cies) == 1:
+                    plot_entries_choropleth(
+                        years, cies[0], filepath, arguments.chunksize, arguments.detail,
+                        options, arguments.update, arguments.workers
+                    )
+                else:
+                    plot_entries_choropleths(
+                        years, cies, filepath, arguments.chunksize, arguments.detail,
+                        options, arguments.update, arguments.workers
+                    )
+            elif arguments.maptype in ('hm', 'heatmap'):
+                pollutant = arguments.pollutant
+                date = arguments.date
+                if arguments.token is None and arguments.export is None:
+                    heat_parser.error('se requiere -t/--token para generar el mapa')
+                token = str(arguments.token)
+                from heatmap import plot_heatmap, plot_heatmap_range, export_grids
+                from readers import build_air_quality_store, update_air_quality_store
+                if arguments.cache:
+                    print('filled.csv: Creando almacén particionado...', flush=True)
+                    with profiling.span('cache'):
+                        build_air_quality_store()
+                elif arguments.update:
+                    with profiling.span('cache', update=True):
+                        update_air_quality_store()
+                if arguments.export:
+                    end = arguments.end if arguments.end else date
+                    export_grids(
+                        pollutant, date, end, str(arguments.export),
+                        arguments.workers, arguments.stride, arguments.method
+                    )
+                elif arguments.end or arguments.per_day or arguments.stride > 1:
+                    end = arguments.end if arguments.end else date
+                    plot_heatmap_range(
+                        pollutant, date, end, token, filepath,
+                        arguments.workers, arguments.stride, arguments.per_day, options,
+                        arguments.method
+                    )
+                else:
+                    plot_heatmap(pollutant, date, token, filepath, arguments.workers, options, arguments.method)
+    finally:
+        # mantener el límite de tamaño de los resultados guardados
+        results.evict()
+        if arguments.profile:
+            profiling.dump(str(arguments.profile))
+
+def run_cache_command(action: str, max_bytes: int) -> None:
+    '''
+    Ejecuta el subcomando 'cache'.
+
+    :param action: 'info', 'clear' o 'prune'.
+
+    :param max_bytes: Tamaño máximo para 'prune'.
+    '''
+    import results
 
-    # no es necesario checar si el subcomando 'maptype' existe porque es obligatorio
-    if arguments.maptype in ('cm', 'choroplethmap'):
-        year = arguments.year
-        cie = arguments.cie
-        plot_entries_choropleth(year, cie, filepath)
-    elif arguments.maptype in ('hm', 'heatmap'):
-        pollutant = arguments.pollutant
-        date = arguments.date
-        token = str(arguments.token)
-        plot_heatmap(pollutant, date, token, filepath)
+    if action == 'clear':
+        print(f'{RESULTS_DIR}: {results.clear()} resultados borrados')
+    elif action == 'prune':
+        print(f'{RESULTS_DIR}: {results.evict(max_bytes)} resultados borrados')
+    else:
+        usage = results.get_usage()
+        if not usage:
+            print(f'{RESULTS_DIR}: Sin resultados guardados')
+        for namespace, total in usage.items():
+            print(f'{namespace}: {total["count"]} resultados, {total["bytes"] / 2**20:.1f} MB')
 
 # ejecutar la aplicación de consola al correr este archivo
 if __name__ == '__main__':
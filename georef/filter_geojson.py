@@ -3,38 +3,314 @@ El GeoJSON 'mun2019gw.json' contiene la división municipal de todo México.
 En este proyecto solo se usan los municipios del Área Metropolitana de Monterrey (AMM),
 por lo que se crea un archivo nuevo que los contiene y no el resto.
 
+El archivo nacional se lee por streaming, un feature a la vez, y los municipios
+se eligen por sus claves CVE_ENT y CVE_MUN, así la memoria no depende del tamaño
+del archivo y sirve para extraer otras zonas metropolitanas:
+`python filter_geojson.py 09 15058 15104 -o resources/zmvm.json`
+
 'mun2019gw.json' obtenido de CONABIO:
 http://www.conabio.gob.mx/informacion/gis/
 '''
 
+import argparse
+import csv
 import json
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from simplify import simplify_geojson
+
+# GeoJSON nacional y el del AMM que se extrae de él
+NATIONAL_GEOJSON_PATH = 'resources/mun2019gw.json'
+AMM_GEOJSON_PATH = 'resources/amm_mun2019gw.json'
+# misma ruta que `readers.AMM_MUNICS_PATH`, sin importar pandas
+AMM_MUNICS_PATH = 'resources/AMM_MUNICS.csv'
+# clave de Nuevo León
+AMM_ENTITY = '19'
+
+# niveles de detalle del GeoJSON del AMM:
+# tolerancia de simplificación en grados (~0.0001° = 11 m), `None` es la geometría original
+DETAIL_LEVELS: Dict[str, Optional[float]] = {
+    'full': None,
+    'high': 0.0001,
+    'medium': 0.0005,
+    'low': 0.002,
+}
+# decimales de las coordenadas simplificadas (~1 m)
+DETAIL_PRECISION = 5
+
+# caracteres que se leen del archivo a la vez
+READ_SIZE = 2**20
+
+# GeoJSON ya leídos por ruta, con la fecha de modificación del archivo al leerlo
+_geojson_cache: Dict[str, Tuple[int, dict]] = dict()
+
+class JSONStream:
+    '''
+    Lector de un archivo JSON por partes: decodifica un valor a la vez
+    con `json.JSONDecoder.raw_decode` y solo conserva en memoria
+    lo que falta por decodificar del bloque leído.
+    '''
+    def __init__(self, file: TextIO) -> None:
+        self.file = file
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        '''
+        Descarta lo ya decodificado y lee otro bloque.
+
+        :returns: `False` si ya no hay más que leer.
+        '''
+        if self.eof:
+            return False
+        chunk = self.file.read(READ_SIZE)
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        self.eof = not chunk
+        return not self.eof
+
+    def peek(self) -> str:
+        '''
+        :returns: Siguiente carácter que no es espacio, sin consumirlo,
+            o '' al final del archivo.
+        '''
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in ' \t\r\n':
+                self.position += 1
+            if self.position < len(self.buffer) or not self.fill():
+                return self.buffer[self.position:self.position + 1]
 
-def write_filtered_geojson() -> None:
+    def expect(self, char: str) -> None:
+        '''
+        Consume el carácter `char`, que debe ser el siguiente.
+        '''
+        found = self.peek()
+        if found != char:
+            raise ValueError(f'JSON inválido: se esperaba {char!r} y se encontró {found!r}')
+        self.position += 1
+
+    def decode(self) -> Any:
+        '''
+        Decodifica el siguiente valor. Si el bloque termina antes que el valor,
+        lee más y vuelve a intentar.
+        '''
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # un número al final del bloque podría continuar en el siguiente
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.position = end
+            return value
+
+    def iter_members(self) -> Iterator[Tuple[str, Optional[Any]]]:
+        '''
+        Itera sobre los miembros del objeto de nivel superior.
+        Para la llave 'features' el valor es `None` y el arreglo
+        debe consumirse con `iter_array` antes de continuar.
+        '''
+        self.expect('{')
+        if self.peek() == '}':
+            self.position += 1
+            return
+        while True:
+            key = self.decode()
+            self.expect(':')
+            if key == 'features':
+                yield key, None
+            else:
+                yield key, self.decode()
+            if self.peek() == ',':
+                self.position += 1
+                continue
+            self.expect('}')
+            return
+
+    def iter_array(self) -> Iterator[Any]:
+        '''
+        Itera sobre los elementos del arreglo siguiente, decodificando uno a la vez.
+        '''
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+        while True:
+            yield self.decode()
+            if self.peek() == ',':
+                self.position += 1
+                continue
+            self.expect(']')
+            return
+
+def iter_features(filepath: str) -> Iterator[dict]:
+    '''
+    Itera sobre los features de un GeoJSON sin cargar el archivo completo.
+    '''
+    with open(filepath, 'r', encoding='utf-8') as jsonfile:
+        stream = JSONStream(jsonfile)
+        for key, _ in stream.iter_members():
+            if key == 'features':
+                yield from stream.iter_array()
+
+def get_amm_codes() -> List[str]:
+    '''
+    :returns: Claves CVEGEO (entidad y municipio, ejemplo: '19039')
+        de los municipios de AMM_MUNICS.csv.
     '''
-    Crea un nuevo archivo GeoJSON con solo los municipios del AMM.
+    with open(AMM_MUNICS_PATH, 'r', encoding='utf-8', newline='') as csvfile:
+        return [f'{AMM_ENTITY}{row["MUNIC"]}' for row in csv.DictReader(csvfile)]
+
+def match_codes(codes: Iterable[str]) -> Callable[[dict], bool]:
     '''
-    # leer GeoJSON de división municipal de México
-    with open('resources/mun2019gw.json', 'r', encoding='utf-8') as jsonfile:
-        munics = json.load(jsonfile)
+    :param codes: Claves de 2 dígitos (CVE_ENT, todos los municipios de la entidad)
+        o de 5 dígitos (CVE_ENT y CVE_MUN, un municipio).
 
-    # los municipios del AMM son del 959 al 1002
-    munics['features'] = munics['features'][959:1003]
-    for feature in munics['features']:
-        # agregar llave 'id' con el valor del ID del municipio
-        feature['id'] = feature['properties']['CVE_MUN']
+    :returns: Función que revisa si un feature es de alguna de las claves.
+    '''
+    entities, munics = set(), set()
+    for code in codes:
+        if len(code) == 2:
+            entities.add(code)
+        elif len(code) == 5:
+            munics.add((code[:2], code[2:]))
+        else:
+            raise ValueError(f'Clave inválida: {code!r}, se esperan 2 o 5 dígitos')
 
-    # guardar datos GeoJSON filtrados por AMM
-    with open('resources/amm_mun2019gw.json', 'w', encoding='utf-8') as newfile:
-        json.dump(munics, newfile)
+    def matches(feature: dict) -> bool:
+        properties = feature['properties']
+        entity = properties['CVE_ENT']
+        return entity in entities or (entity, properties['CVE_MUN']) in munics
+    return matches
 
-def read_amm_geojson() -> dict:
+def write_filtered_geojson(
+        codes: Optional[Iterable[str]] = None, source: str = NATIONAL_GEOJSON_PATH,
+        target: str = AMM_GEOJSON_PATH) -> int:
+    '''
+    Crea un nuevo archivo GeoJSON con solo los municipios de `codes`,
+    leyendo y escribiendo un feature a la vez.
+    Los demás miembros del archivo (type, crs...) se copian igual.
+
+    :param codes: Claves de entidades o municipios, ver `match_codes`.
+        Por defecto los municipios del AMM de AMM_MUNICS.csv.
+
+    :param source: GeoJSON de origen.
+
+    :param target: GeoJSON a crear.
+
+    :returns: Número de features escritos.
+    '''
+    matches = match_codes(get_amm_codes() if codes is None else codes)
+    count = 0
+    # escribir a un temporal, así un error no deja un archivo a medias en `target`
+    temppath = f'{target}.tmp'
+    with open(source, 'r', encoding='utf-8') as jsonfile, open(temppath, 'w', encoding='utf-8') as newfile:
+        stream = JSONStream(jsonfile)
+        newfile.write('{')
+        for i, (key, value) in enumerate(stream.iter_members()):
+            if i > 0:
+                newfile.write(', ')
+            newfile.write(f'{json.dumps(key)}: ')
+            if key != 'features':
+                json.dump(value, newfile)
+                continue
+
+            newfile.write('[')
+            for feature in stream.iter_array():
+                if not matches(feature):
+                    continue
+                # agregar llave 'id' con el valor del ID del municipio
+                feature['id'] = feature['properties']['CVE_MUN']
+                if count > 0:
+                    newfile.write(', ')
+                json.dump(feature, newfile)
+                count += 1
+            newfile.write(']')
+        newfile.write('}')
+    os.replace(temppath, target)
+    return count
+
+def get_amm_geojson_path(detail: str = 'full') -> str:
+    '''
+    :returns: Ruta del GeoJSON del AMM con el nivel de detalle `detail`.
+    '''
+    if DETAIL_LEVELS[detail] is None:
+        return AMM_GEOJSON_PATH
+    return f'resources/amm_mun2019gw_{detail}.json'
+
+def write_simplified_geojson(detail: str, tolerance: Optional[float] = None, precision: int = DETAIL_PRECISION) -> str:
+    '''
+    Crea el archivo GeoJSON del AMM simplificado con un nivel de detalle,
+    conservando las fronteras compartidas entre municipios.
+
+    :param detail: Nombre del nivel de detalle, una llave de `DETAIL_LEVELS`.
+
+    :param tolerance: Tolerancia de simplificación en grados,
+        si no se especifica se usa la del nivel de detalle.
+
+    :param precision: Decimales de las coordenadas.
+
+    :returns: Ruta del archivo creado.
+    '''
+    if tolerance is None:
+        tolerance = DETAIL_LEVELS[detail]
+
+    simplified = simplify_geojson(read_amm_geojson(), tolerance, precision)
+
+    filepath = get_amm_geojson_path(detail)
+    with open(filepath, 'w', encoding='utf-8') as newfile:
+        # sin espacios para reducir el tamaño
+        json.dump(simplified, newfile, separators=(',', ':'))
+    return filepath
+
+def read_amm_geojson(detail: str = 'full') -> dict:
     '''
     Lee archivo GeoJSON que contiene la división municipal del AMM.
+    Si el archivo del nivel de detalle no existe, lo crea.
+
+    Mientras el archivo no cambie se regresa el mismo diccionario,
+    así los mapas de varias letras de CIE o las peticiones del servidor
+    lo leen una sola vez; por eso no debe modificarse.
+
+    :param detail: Nivel de detalle, una llave de `DETAIL_LEVELS`.
 
     :returns: diccionario GeoJSON.
     '''
-    with open('resources/amm_mun2019gw.json', 'r', encoding='utf-8') as jsonfile:
-        return json.load(jsonfile)
+    filepath = get_amm_geojson_path(detail)
+    if not os.path.exists(filepath):
+        write_simplified_geojson(detail)
+
+    mtime = os.stat(filepath).st_mtime_ns
+    cached = _geojson_cache.get(filepath)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with open(filepath, 'r', encoding='utf-8') as jsonfile:
+        geojson = json.load(jsonfile)
+    _geojson_cache[filepath] = (mtime, geojson)
+    return geojson
 
 if __name__ == '__main__':
-    write_filtered_geojson()
+    parser = argparse.ArgumentParser(description='Extrae municipios del GeoJSON nacional.')
+    parser.add_argument(
+        'codes', nargs='*',
+        help='claves de entidad (2 dígitos) o municipio (5 dígitos), por defecto las del AMM'
+    )
+    parser.add_argument('-s', '--source', default=NATIONAL_GEOJSON_PATH, help='GeoJSON nacional')
+    parser.add_argument('-o', '--output', default=AMM_GEOJSON_PATH, help='GeoJSON a crear')
+    args = parser.parse_args()
+
+    count = write_filtered_geojson(args.codes or None, args.source, args.output)
+    print(f'{args.output}: {count} municipios', flush=True)
+    if args.output == AMM_GEOJSON_PATH:
+        # precalcular los niveles de detalle simplificados
+        for level, tolerance in DETAIL_LEVELS.items():
+            if tolerance is not None:
+                write_simplified_geojson(level)
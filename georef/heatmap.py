@@ -3,16 +3,383 @@ Genera un mapa de calor basado en datos de contaminantes,
 viento y coordenadas de estaciones de calidad del aire.
 '''
 
-from math import copysign
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 import pandas as pd
 import numpy as np
-import plotly
 import plotly.graph_objects as go
 
-from kriging import interpolate
+from interpolation import get_engine, interpolate, interpolate_fields
+from output import FigureWriter, OutputOptions
+from profiling import span, timed
+from raster import GridWriter
+from readers import read_air_quality, read_stations, AIR_QUALITY_STRFDT
+import results
 
-def plot_heatmap(pollutant: str, date: str, tokenfile: str, output: str = '') -> None:
+# formato de las fechas de los argumentos, ejemplo: '1-Dec-18'
+DATE_FORMAT = '%d-%b-%y'
+# tamaños de la malla recursiva del contaminante (40x40) y del viento (20x20)
+POLLUTION_GRID = range(5, 41, 5)
+WIND_GRID = range(5, 21, 5)
+
+def fit_day_variograms(dataset: pd.DataFrame, pollutant: str) -> Tuple[tuple, tuple]:
+    '''
+    Ajusta los variogramas del kriging de cada paso de la malla recursiva
+    con todas las horas de `dataset`, uno para el contaminante y uno para
+    cada campo del viento (velocidad y dirección).
+    Al interpolar cada hora con ellos el sistema de kriging de cada paso
+    se factoriza una vez por día en lugar de una vez por hora.
+    Se ajustan con las horas del conjunto de estaciones más frecuente.
+
+    Se guardan en `results` por días, contaminante y estaciones, no por valores:
+    así al agregar horas nuevas al día (`-u`) se reutilizan los mismos
+    y las mallas guardadas de las demás horas siguen siendo válidas.
+
+    :param dataset: Registros con coordenadas, ver `read_day`.
+
+    :returns: Variogramas del contaminante y del viento, ver `KrigingEngine.fit_variograms`.
+    '''
+    hourly = [data for _, data in split_hours(dataset)]
+    common, _ = Counter(tuple(data['station']) for data in hourly).most_common(1)[0]
+    hourly = [data for data in hourly if tuple(data['station']) == common]
+    lon, lat = hourly[0].lon, hourly[0].lat
+
+    def fit() -> Tuple[tuple, tuple]:
+        with span('variogram', rows=sum(len(data) for data in hourly)):
+            pollution = get_engine('kriging', lon, lat, POLLUTION_GRID).fit_variograms(
+                [data[pollutant] for data in hourly]
+            )
+            wind = get_engine('kriging', lon, lat, WIND_GRID).fit_variograms(
+                [data[['velocity', 'direction']].T for data in hourly]
+            )
+        return pollution, wind
+
+    days = sorted({str(day.date()) for day in dataset['timestamp'].dt.normalize().unique()})
+    key = results.make_key(
+        'variograms', days=days, pollutant=pollutant, stations=list(common),
+        grids=[list(POLLUTION_GRID), list(WIND_GRID)]
+    )
+    return results.cached(key, fit)
+
+def get_hour_key(data: pd.DataFrame, pollutant: str) -> str:
+    '''
+    :returns: Llave en `results` de las mallas de kriging de una hora:
+        las coordenadas y valores de sus estaciones.
+    '''
+    values = data[['lon', 'lat', pollutant, 'velocity', 'direction']].to_numpy(dtype=np.float64)
+    return results.make_key('kriging', data=results.fingerprint_bytes(values.tobytes()), shape=values.shape)
+
+def get_day_variograms(
+        hourly: List[Tuple[np.datetime64, pd.DataFrame]], dataset: pd.DataFrame, pollutant: str,
+        method: str = 'kriging') -> Optional[Tuple[tuple, tuple]]:
+    '''
+    :param hourly: Horas de `dataset`, ver `split_hours`.
+
+    :returns: Variogramas del día (ver `fit_day_variograms`) si se usa kriging
+        y alguna hora no tiene sus mallas guardadas, si no `None`.
+    '''
+    if method != 'kriging' or all(results.exists(get_hour_key(data, pollutant)) for _, data in hourly):
+        return None
+    return fit_day_variograms(dataset, pollutant)
+
+def interpolate_hour(
+        data: pd.DataFrame, pollutant: str, method: str = 'kriging',
+        variograms: Optional[Tuple[tuple, tuple]] = None) -> tuple:
+    '''
+    Interpola el contaminante y el viento de una hora.
+
+    :param data: Registros de las estaciones en la hora, con coordenadas.
+
+    :param method: Método de interpolación, ver `settings.INTERPOLATION_METHODS`.
+
+    :param variograms: Variogramas del día para el kriging, ver `fit_day_variograms`;
+        si no se especifican se ajustan a la hora.
+
+    :returns: Coordenadas x, y y valores de la malla del contaminante (40x40)
+        y coordenadas x, y y arreglo (velocidad, dirección) de la malla del viento (20x20).
+    '''
+    pollution, wind = variograms if variograms is not None else (None, None)
+    with span(method, rows=len(data)):
+        # interpolar contaminante
+        xpollution, ypollution, zpollution = interpolate(
+            data.lon, data.lat, data[pollutant], POLLUTION_GRID, method, pollution
+        )
+
+        # interpolar velocidad y dirección de viento en una sola llamada
+        xwind, ywind, zwind = interpolate_fields(
+            data.lon, data.lat, data[['velocity', 'direction']].T, WIND_GRID, method, wind
+        )
+    return xpollution, ypollution, zpollution, xwind, ywind, zwind
+
+def get_hour_grids(
+        data: pd.DataFrame, pollutant: str, method: str = 'kriging',
+        variograms: Optional[Tuple[tuple, tuple]] = None) -> tuple:
+    '''
+    Igual que `interpolate_hour`. Con kriging usa las mallas guardadas si ya se
+    interpolaron exactamente los mismos valores de las mismas estaciones, ver `results`;
+    los demás métodos cuestan menos que leer un resultado guardado.
+    '''
+    if method != 'kriging':
+        return interpolate_hour(data, pollutant, method)
+
+    key = get_hour_key(data, pollutant)
+    return results.cached(key, lambda: interpolate_hour(data, pollutant, method, variograms))
+
+def build_hour_frame(
+        hourdata: Tuple[np.datetime64, pd.DataFrame], pollutant: str,
+        pollutionrange: Tuple[float, float], velocityrange: Tuple[float, float],
+        method: str = 'kriging', variograms: Optional[Tuple[tuple, tuple]] = None) -> Tuple[dict, dict]:
+    '''
+    Interpola los datos de una hora y crea su cuadro de animación.
+    Es independiente de las demás horas, por lo que puede ejecutarse en otro proceso.
+
+    :param hourdata: Hora y registros de las estaciones en esa hora.
+
+    :param pollutant: Nombre del contaminante.
+
+    :param pollutionrange: Valores mínimo y máximo del contaminante en el día.
+
+    :param velocityrange: Valores mínimo y máximo de la velocidad del viento en el día.
+
+    :param method: Método de interpolación, ver `settings.INTERPOLATION_METHODS`.
+
+    :param variograms: Variogramas del día para el kriging, ver `fit_day_variograms`.
+
+    :returns: Cuadro de la animación y paso del deslizador de la hora.
+    '''
+    hour, data = hourdata
+    pollutionmin, pollutionmax = pollutionrange
+    velocitymin, velocitymax = velocityrange
+
+    xpollution, ypollution, zpollution, xwind, ywind, zwind = get_hour_grids(data, pollutant, method, variograms)
+    xvelocity, yvelocity, zvelocity = xwind, ywind, zwind[0].tolist()
+    xdirection, ydirection, zdirection = xwind, ywind, zwind[1].tolist()
+
+    strhour = pd.to_datetime(hour).strftime(AIR_QUALITY_STRFDT)
+
+    frame = {
+        'name': f'frame_{strhour}',
+        'data': [
+            # mapa de dirección de viento
+            dict(
+                type='scattermapbox',
+                lon=xdirection,
+                lat=ydirection,
+                mode='markers',
+                marker=dict(
+                    symbol='marker',
+                    size=12,
+                    allowoverlap=True,
+                    angle=[angle + 180 for angle in zdirection]
+                ),
+                text=zdirection
+            ),
+            # mapa de velocidad de viento
+            dict(
+                type='scattermapbox',
+                lon=xvelocity,
+                lat=yvelocity,
+                mode='markers',
+                marker=dict(
+                    symbol='circle',
+                    size=12,
+                    allowoverlap=True,
+                    color='white',
+                    opacity=np.interp(zvelocity, (velocitymin, velocitymax), (0, 1)),
+                ),
+                text=zvelocity
+            ),
+            # mapa de calor de densidad de contaminante
+            dict(
+                type='densitymapbox',
+                lon=xpollution,
+                lat=ypollution,
+                z=zpollution,
+                opacity=0.5,
+                zmin=pollutionmin,
+                zmax=pollutionmax
+            )
+        ]
+    }
+    step = {
+        'label': strhour,
+        'method': 'animate',
+        'args': [
+            [f'frame_{strhour}'],
+            {
+                'mode': 'immediate',
+                'frame': {
+                    'duration': 500,
+                    'redraw': True
+                },
+                'transition': {'duration': 300}
+            }
+        ]
+    }
+    return frame, step
+
+def read_day(
+        pollutant: str, day: pd.Timestamp, stations: pd.DataFrame,
+        stride: int = 1, days: int = 1) -> pd.DataFrame:
+    '''
+    Lee los registros de `days` días a partir de `day` y les agrega
+    las coordenadas de las estaciones.
+
+    :param stations: Coordenadas de estaciones, ver `readers.read_stations`.
+
+    :param stride: Solo se conservan las horas múltiplo de `stride`.
+
+    :returns: `DataFrame` con columnas:
+        [station, lat, lon, timestamp, `pollutant`, velocity, direction]
+    '''
+    # columnas a extraer del CSV
+    columns = ['timestamp', 'station', pollutant, 'velocity', 'direction']
+    with span('read', day=str(day.date())) as record:
+        dataframe = read_air_quality(day, day + pd.Timedelta(days=days), columns).dropna()
+        record['rows'] = len(dataframe)
+
+    with span('filter', rows=len(dataframe)):
+        if stride > 1:
+            dataframe = dataframe[dataframe['timestamp'].dt.hour % stride == 0]
+
+        # unir DataFrames de datos con coordenadas
+        return stations.merge(dataframe, on='station')
+
+def split_hours(dataset: pd.DataFrame) -> List[Tuple[np.datetime64, pd.DataFrame]]:
+    '''
+    :returns: Cada hora de `dataset`, en orden, con sus registros.
+    '''
+    hours = np.sort(dataset['timestamp'].unique())
+    return [(hour, dataset.loc[dataset['timestamp'] == hour]) for hour in hours]
+
+def build_frames(
+        dataset: pd.DataFrame, pollutant: str,
+        pollutionrange: Tuple[float, float], velocityrange: Tuple[float, float],
+        executor: Optional[Executor] = None, method: str = 'kriging') -> Iterator[Tuple[dict, dict]]:
+    '''
+    Crea los cuadros de animación de cada hora de `dataset`, en orden.
+    Los cuadros se generan conforme se consumen, así pueden escribirse
+    al archivo sin tener todos en memoria.
+
+    :param executor: Grupo de procesos para generar las horas en paralelo,
+        si es `None` se generan en serie.
+
+    :param method: Método de interpolación, ver `settings.INTERPOLATION_METHODS`.
+        Con kriging, si falta alguna hora en `results`, los variogramas
+        se ajustan una vez con todas las horas, ver `get_day_variograms`.
+
+    :returns: Iterador de cuadros de animación y pasos del deslizador.
+    '''
+    hourly = split_hours(dataset)
+    build = partial(
+        build_hour_frame,
+        pollutant=pollutant,
+        pollutionrange=pollutionrange,
+        velocityrange=velocityrange,
+        method=method,
+        variograms=get_day_variograms(hourly, dataset, pollutant, method)
+    )
+
+    if executor is None:
+        return map(build, hourly)
+    # `map` conserva el orden de las horas
+    return executor.map(build, hourly)
+
+def write_heatmap(
+        frames: Iterable[Tuple[dict, dict]], tokenfile: str, filepath: str,
+        options: Optional[OutputOptions] = None) -> None:
+    '''
+    Crea la figura animada con los cuadros y la guarda en un archivo HTML,
+    escribiendo cada cuadro en cuanto se genera.
+
+    :param frames: Cuadros de animación y pasos del deslizador, ver `build_frames`.
+
+    :param tokenfile: Archivo con token de Mapbox.
+
+    :param filepath: Ruta relativa del archivo HTML.
+
+    :param options: Opciones de salida del HTML, ver `output.OutputOptions`.
+    '''
+    steps = list()
+    data = None
+    with FigureWriter(filepath, options) as writer:
+        # con un grupo de procesos se mide la espera de cada hora
+        for frame, step in timed('frame', frames):
+            writer.add_frame(frame)
+            steps.append(step)
+            if data is None:
+                data = frame['data']
+
+        if data is None:
+            print(f'{filepath}: Sin registros, no se guardó el mapa', flush=True)
+            return
+
+        sliders = [{
+            'transition': {'duration': 300},
+            'x': 0.08,
+            'len': 0.88,
+            'currentvalue': {'xanchor': 'center'},
+            'steps': steps
+        }]
+
+        playbtn = [{
+            'type': 'buttons',
+            'showactive': True,
+            'x': 0.045, 'y': -0.08,
+            'buttons': [{
+                'label': 'Play',
+                'method': 'animate',
+                'args': [
+                    None,
+                    {
+                        'mode': 'immediate',
+                        'frame': {
+                            'duration': 500,
+                            'redraw': True
+                        },
+                        'transition': {'duration': 300},
+                        'fromcurrent': True
+                    }
+                ]
+            }]
+        }]
+
+        with open(tokenfile, 'r') as file:
+            token = file.read()
+
+        layout = go.Layout(
+            sliders=sliders,
+            updatemenus=playbtn,
+            autosize=True,
+            mapbox=dict(
+                accesstoken=token,
+                center=dict(lat=25.67, lon=-100.338),
+                zoom=9.3
+            )
+        )
+
+        print(f'{filepath}: Guardando mapa en archivo...', flush=True)
+        # escribir traza base y diseño al final del archivo
+        writer.finish(data, layout)
+
+def create_executor(workers: Optional[int], method: str = 'kriging') -> Optional[ProcessPoolExecutor]:
+    '''
+    :returns: Grupo de `workers` procesos, o `None` si `workers` es 1
+        o si el método no es kriging: los demás cuestan menos que enviar
+        cada hora a otro proceso.
+    '''
+    if workers == 1 or method != 'kriging':
+        return None
+    return ProcessPoolExecutor(max_workers=workers)
+
+def plot_heatmap(
+        pollutant: str, date: str, tokenfile: str, output: str = '',
+        workers: Optional[int] = None, options: Optional[OutputOptions] = None,
+        method: str = 'kriging') -> None:
     '''
     Genera un mapa de calor de un contaminante con marcadores
     de dirección y velocidad del viento del día especificado.
@@ -25,177 +392,195 @@ def plot_heatmap(pollutant: str, date: str, tokenfile: str, output: str = '') ->
     :param tokenfile: Archivo con token de Mapbox.
 
     :param output: Ruta relativa del archivo HTML para guardar el mapa de calor.
+
+    :param workers: Número de procesos para generar las horas en paralelo,
+        por defecto el número de núcleos. Con 1 se generan en serie.
+
+    :param options: Opciones de salida del HTML, ver `output.OutputOptions`.
+
+    :param method: Método de interpolación, ver `settings.INTERPOLATION_METHODS`.
+        'idw' y 'nearest' son aproximados pero mucho más rápidos, para vistas previas.
     '''
     # si no se especificó nombre de archivo, generar uno
     filepath = output if output else f'{pollutant}_{date}.html'
     print(f'{filepath}: Preparando datos...', flush=True)
 
-    # columnas a extraer del CSV
-    columns = ['timestamp', 'station', pollutant, 'velocity', 'direction']
-    dataframe = pd.read_csv('resources/filled.csv', usecols=columns).dropna()
-
-    # leer coordenadas de estaciones
-    coords = pd.read_csv('resources/estaciones.dat')
-    # iterar sobre índice y datos de cada fila
-    for i, r in coords.iterrows():
-        # signo de latitud: + Norte, - Sur
-        sign = copysign(1, r[0])
-        # calcular coordenadas decimales a partir de GMS
-        coords.loc[i, 'lat'] = sign * (abs(r[0]) + r[1] / 60 + r[2] / 3600)
-
-        # signo de longitud: + Este, - Oeste
-        sign = copysign(1, r[3])
-        # calcular coordenadas decimales a partir de GMS
-        coords.loc[i, 'lon'] = sign * (abs(r[3]) + r[4] / 60 + r[5] / 3600)
-
-    dataset = coords.merge(
-        # filtrar registros del día elegido
-        dataframe.loc[dataframe['timestamp'].str.startswith(date)],
-        # unir DataFrames de datos con coordenadas
-        on='station'
-    # eliminar columnas GMS
-    ).drop(coords.columns[range(6)], axis=1)
-
-    # convertir strings a objeto datetime
-    strfdt = '%d-%b-%y %H'
-    dataset['timestamp'] = pd.to_datetime(dataset['timestamp'], format=strfdt)
+    # leer solo los registros del día elegido
+    day = pd.to_datetime(date, format=DATE_FORMAT)
+    dataset = read_day(pollutant, day, read_stations())
 
     # escala de densidad
     pollutionmin, pollutionmax = min(dataset[pollutant]), max(dataset[pollutant])
 
     velocitymin, velocitymax = min(dataset['velocity']), max(dataset['velocity'])
 
-    frames, steps = [], []
-    # filtrar horas del día elegido
-    hours = dataset.timestamp.unique()
-    hours.sort()
     print(f'{filepath}: Generando mapa de calor...', flush=True)
-    for hour in hours:
-        # datos leídos en la hora epecífica
-        data = dataset.loc[dataset['timestamp'] == hour]
-
-        ## método de kringing
-        # interpolar contaminante
-        xpollution, ypollution, zpollution = interpolate(data.lon, data.lat, data[pollutant], range(5, 41, 5))
-
-        # rango para interpolación recursiva para valores de viento (20x20 puntos)
-        grid = range(5, 21, 5)
-        # interpolar velocidad de viento
-        xvelocity, yvelocity, zvelocity = interpolate(data.lon, data.lat, data['velocity'], grid)
-        # interpolar dirección de viento
-        xdirection, ydirection, zdirection = interpolate(data.lon, data.lat, data['direction'], grid)
-
-        strhour = pd.to_datetime(hour).strftime(strfdt)
-
-        frames.append({
-            'name': f'frame_{strhour}',
-            'data': [
-                # mapa de dirección de viento
-                dict(
-                    type='scattermapbox',
-                    lon=xdirection,
-                    lat=ydirection,
-                    mode='markers',
-                    marker=dict(
-                        symbol='marker',
-                        size=12,
-                        allowoverlap=True,
-                        angle=[angle + 180 for angle in zdirection]
-                    ),
-                    text=zdirection
-                ),
-                # mapa de velocidad de viento
-                dict(
-                    type='scattermapbox',
-                    lon=xvelocity,
-                    lat=yvelocity,
-                    mode='markers',
-                    marker=dict(
-                        symbol='circle',
-                        size=12,
-                        allowoverlap=True,
-                        color='white',
-                        opacity=np.interp(zvelocity, (velocitymin, velocitymax), (0, 1)),
-                    ),
-                    text=zvelocity
-                ),
-                # mapa de calor de densidad de contaminante
-                dict(
-                    type='densitymapbox',
-                    lon=xpollution,
-                    lat=ypollution,
-                    z=zpollution,
-                    opacity=0.5,
-                    zmin=pollutionmin,
-                    zmax=pollutionmax
-                )
-            ]
-        })
-        steps.append({
-            'label': strhour,
-            'method': 'animate',
-            'args': [
-                [f'frame_{strhour}'],
-                {
-                    'mode': 'immediate',
-                    'frame': {
-                        'duration': 500,
-                        'redraw': True
-                    },
-                    'transition': {'duration': 300}
-                }
-            ]
-        })
-
-    sliders = [{
-        'transition': {'duration': 300},
-        'x': 0.08,
-        'len': 0.88,
-        'currentvalue': {'xanchor': 'center'},
-        'steps': steps
-    }]
-
-    playbtn = [{
-        'type': 'buttons',
-        'showactive': True,
-        'x': 0.045, 'y': -0.08,
-        'buttons': [{
-            'label': 'Play',
-            'method': 'animate',
-            'args': [
-                None,
-                {
-                    'mode': 'immediate',
-                    'frame': {
-                        'duration': 500,
-                        'redraw': True
-                    },
-                    'transition': {'duration': 300},
-                    'fromcurrent': True
-                }
-            ]
-        }]
-    }]
-
-    with open(tokenfile, 'r') as file:
-        token = file.read()
-
-    layout = go.Layout(
-        sliders=sliders,
-        updatemenus=playbtn,
-        autosize=True,
-        mapbox=dict(
-            accesstoken=token,
-            center=dict(lat=25.67, lon=-100.338),
-            zoom=9.3
+    executor = create_executor(workers, method)
+    try:
+        frames = build_frames(
+            dataset, pollutant,
+            (pollutionmin, pollutionmax), (velocitymin, velocitymax),
+            executor, method
         )
+        # cada cuadro se escribe en cuanto termina su hora
+        write_heatmap(frames, tokenfile, filepath, options)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+def plot_heatmap_range(
+        pollutant: str, start: str, end: str, tokenfile: str, output: str = '',
+        workers: Optional[int] = None, stride: int = 1, per_day: bool = False,
+        options: Optional[OutputOptions] = None, method: str = 'kriging') -> None:
+    '''
+    Genera mapas de calor de un rango de fechas, procesando un día a la vez:
+    solo se tienen en memoria los registros del día actual.
+    Las coordenadas de estaciones, el grupo de procesos y las mallas de kriging
+    se preparan una sola vez para todo el rango.
+
+    :param pollutant: Nombre del contaminante.
+
+    :param start: Fecha inicial en formato `'d-b-y'`, incluida.
+
+    :param end: Fecha final en formato `'d-b-y'`, incluida.
+
+    :param tokenfile: Archivo con token de Mapbox.
+
+    :param output: Ruta relativa del archivo HTML. Con `per_day`,
+        a su nombre se le agrega la fecha, ejemplo: 'mapa.html' -> 'mapa_1-Dec-18.html'.
+
+    :param workers: Número de procesos para generar las horas en paralelo.
+
+    :param stride: Solo se grafican las horas múltiplo de `stride`, ejemplo: 3 -> 0, 3, 6...
+
+    :param per_day: Si es `True` se crea un archivo por día,
+        si no, una sola animación con todas las horas del rango
+        (en ese caso los cuadros de cada día se escriben al archivo conforme se generan).
+
+    :param options: Opciones de salida del HTML.
+
+    :param method: Método de interpolación, ver `plot_heatmap`.
+    '''
+    days = pd.date_range(
+        pd.to_datetime(start, format=DATE_FORMAT),
+        pd.to_datetime(end, format=DATE_FORMAT),
+        freq='D'
     )
+    stations = read_stations()
 
-    data = frames[0]['data']
-    figure = go.Figure(data=data, layout=layout, frames=frames)
+    if per_day:
+        pollutionrange = velocityrange = None
+        filepath = ''
+    else:
+        filepath = output if output else f'{pollutant}_{start}_{end}.html'
+        print(f'{filepath}: Preparando datos...', flush=True)
+        # escala de todo el rango, leyendo un día a la vez
+        pollutionrange, velocityrange = (np.inf, -np.inf), (np.inf, -np.inf)
+        for day in days:
+            dataset = read_day(pollutant, day, stations, stride)
+            if dataset.empty:
+                continue
+            pollutionrange = (
+                min(pollutionrange[0], dataset[pollutant].min()),
+                max(pollutionrange[1], dataset[pollutant].max())
+            )
+            velocityrange = (
+                min(velocityrange[0], dataset['velocity'].min()),
+                max(velocityrange[1], dataset['velocity'].max())
+            )
+        print(f'{filepath}: Generando mapa de calor...', flush=True)
 
-    print(f'{filepath}: Guardando mapa en archivo...', flush=True)
-    # guardar mapa en archivo
-    plotly.offline.plot(figure, filename=filepath)
+    # registros de cada día con datos, leídos hasta que se necesitan
+    def read_days() -> Iterator[Tuple[pd.Timestamp, pd.DataFrame]]:
+        for day in days:
+            dataset = read_day(pollutant, day, stations, stride)
+            if dataset.empty:
+                print(f'{day.day}-{day:%b-%y}: Sin registros', flush=True)
+                continue
+            yield day, dataset
+
+    # cuadros de todas las horas del rango, con la escala de todo el rango
+    def range_frames() -> Iterator[Tuple[dict, dict]]:
+        for _, dataset in read_days():
+            yield from build_frames(dataset, pollutant, pollutionrange, velocityrange, executor, method)
+
+    executor = create_executor(workers, method)
+    try:
+        if not per_day:
+            write_heatmap(range_frames(), tokenfile, filepath, options)
+            return
+
+        for day, dataset in read_days():
+            date = f'{day.day}-{day:%b-%y}'
+            if output:
+                path = Path(output)
+                filepath = str(path.with_name(f'{path.stem}_{date}{path.suffix}'))
+            else:
+                filepath = f'{pollutant}_{date}.html'
+            print(f'{filepath}: Generando mapa de calor...', flush=True)
+
+            # escala de cada día, igual que `plot_heatmap`
+            frames = build_frames(
+                dataset, pollutant,
+                (dataset[pollutant].min(), dataset[pollutant].max()),
+                (dataset['velocity'].min(), dataset['velocity'].max()),
+                executor, method
+            )
+            write_heatmap(frames, tokenfile, filepath, options)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+def export_grids(
+        pollutant: str, start: str, end: str, output: str = '',
+        workers: Optional[int] = None, stride: int = 1, method: str = 'kriging') -> None:
+    '''
+    Interpola cada hora de un rango de fechas y guarda sus mallas
+    del contaminante y del viento en un archivo binario, sin generar el mapa,
+    para analizarlas después con `raster.GridCube` sin volver a interpolar.
+    Se procesa un día a la vez y cada hora se escribe en cuanto se interpola.
+
+    :param pollutant: Nombre del contaminante.
+
+    :param start: Fecha inicial en formato `'d-b-y'`, incluida.
+
+    :param end: Fecha final en formato `'d-b-y'`, incluida.
+
+    :param output: Ruta relativa del archivo de mallas.
+
+    :param workers: Número de procesos para interpolar las horas en paralelo.
+
+    :param stride: Solo se guardan las horas múltiplo de `stride`.
+
+    :param method: Método de interpolación, ver `plot_heatmap`.
+    '''
+    filepath = output if output else f'{pollutant}_{start}_{end}.grid'
+    days = pd.date_range(
+        pd.to_datetime(start, format=DATE_FORMAT),
+        pd.to_datetime(end, format=DATE_FORMAT),
+        freq='D'
+    )
+    stations = read_stations()
+    bounds = (stations['lon'].min(), stations['lat'].min(), stations['lon'].max(), stations['lat'].max())
 
-plot_heatmap('PM10', '31-Dec-18', '')
\ No newline at end of file
+    print(f'{filepath}: Interpolando mallas...', flush=True)
+    executor = create_executor(workers, method)
+    try:
+        sizes = (POLLUTION_GRID[-1], WIND_GRID[-1])
+        with GridWriter(filepath, pollutant, method, bounds, sizes) as writer:
+            for day in days:
+                dataset = read_day(pollutant, day, stations, stride)
+                hourly = split_hours(dataset)
+                if not hourly:
+                    continue
+                variograms = get_day_variograms(hourly, dataset, pollutant, method)
+                interpolate_grids = partial(get_hour_grids, pollutant=pollutant, method=method, variograms=variograms)
+                hours = [hour for hour, _ in hourly]
+                data = [hourdata for _, hourdata in hourly]
+                grids = map(interpolate_grids, data) if executor is None else executor.map(interpolate_grids, data)
+                for hour, hourgrids in zip(hours, timed('grid', grids)):
+                    writer.add_hour(hour, hourgrids)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    print(f'{filepath}: {writer.hours} horas guardadas', flush=True)
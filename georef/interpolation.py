@@ -0,0 +1,187 @@
+'''
+Motores de interpolación de las mallas de los mapas de calor.
+
+El kriging ordinario (`kriging.KrigingEngine`) es el método exacto pero el más
+costoso de cada hora. Para vistas previas y tableros se puede usar
+la distancia inversa ponderada (IDW) o el vecino más cercano (`IDWEngine`),
+que sobre la misma malla solo cuestan un producto por vector de valores.
+
+Todos los motores tienen `interpolate` e `interpolate_many` con los mismos
+argumentos y resultados, así `heatmap` no depende del método.
+`compare_methods` mide el error y el tiempo de cada método contra el kriging.
+'''
+
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from settings import INTERPOLATION_METHODS
+
+# potencia de la distancia en los pesos de IDW
+IDW_POWER = 2.0
+# estaciones más cercanas que se usan para cada punto de la malla con IDW
+IDW_NEIGHBORS = 8
+
+class IDWEngine:
+    '''
+    Distancia inversa ponderada sobre una red fija de estaciones.
+
+    Un árbol k-d de las estaciones da los vecinos más cercanos de cada punto
+    de la malla una sola vez; sus pesos quedan en una matriz, así interpolar
+    cada vector de valores es un solo producto vectorizado.
+    Con `neighbors=1` es interpolación por vecino más cercano.
+    '''
+    def __init__(
+            self, xcoords: Sequence, ycoords: Sequence, gridrange: range,
+            neighbors: int = IDW_NEIGHBORS, power: float = IDW_POWER) -> None:
+        '''
+        :param xcoords: Longitudes de las estaciones.
+
+        :param ycoords: Latitudes de las estaciones.
+
+        :param gridrange: Tamaños de la malla recursiva del kriging, solo se usa
+            el último, así la malla es la misma que la de `kriging.KrigingEngine`.
+
+        :param neighbors: Estaciones más cercanas a ponderar por punto.
+
+        :param power: Potencia de la distancia en los pesos.
+        '''
+        sources = np.column_stack((np.asarray(xcoords, dtype=float), np.asarray(ycoords, dtype=float)))
+        size = list(gridrange)[-1]
+        # misma malla y orden que el último paso del kriging
+        xpoints = np.linspace(sources[:, 0].min(), sources[:, 0].max(), size)
+        ypoints = np.linspace(sources[:, 1].min(), sources[:, 1].max(), size)
+        gridx, gridy = np.meshgrid(xpoints, ypoints)
+        self.targets = np.column_stack((gridx.ravel(), gridy.ravel()))
+
+        neighbors = min(neighbors, len(sources))
+        distances, self.indices = cKDTree(sources).query(self.targets, k=neighbors)
+        # `query` con k=1 regresa arreglos de una dimensión
+        distances = distances.reshape(len(self.targets), neighbors)
+        self.indices = self.indices.reshape(len(self.targets), neighbors)
+
+        with np.errstate(divide='ignore'):
+            weights = 1.0 / distances ** power
+        # valores exactos en puntos que coinciden con una estación
+        exact = distances == 0
+        hits = exact.any(axis=1)
+        weights[hits] = exact[hits]
+        self.weights = weights / weights.sum(axis=1, keepdims=True)
+
+    def interpolate_many(self, zblock: Sequence) -> Tuple[List[float], List[float], np.ndarray]:
+        '''
+        Igual que `kriging.KrigingEngine.interpolate_many`.
+        '''
+        block = np.asarray(zblock, dtype=float)
+        values = block.reshape(-1, block.shape[-1])
+        # (vectores, puntos, vecinos) ponderados y sumados por punto
+        estimated = np.einsum('vtk,tk->vt', values[:, self.indices], self.weights)
+        return (
+            self.targets[:, 0].tolist(), self.targets[:, 1].tolist(),
+            estimated.reshape(block.shape[:-1] + (-1,))
+        )
+
+    def interpolate(self, zvalues: Sequence) -> Tuple[List[float], List[float], List[float]]:
+        '''
+        Igual que `kriging.KrigingEngine.interpolate`.
+        '''
+        xpoints, ypoints, zpoints = self.interpolate_many(zvalues)
+        return xpoints, ypoints, zpoints.tolist()
+
+# motores por método y geometría, para no recalcular vecinos entre llamadas
+_engines: Dict[tuple, Any] = dict()
+_engines_lock = threading.Lock()
+
+def get_engine(method: str, xcoords: Sequence, ycoords: Sequence, gridrange: range) -> Any:
+    '''
+    :param method: Una de `settings.INTERPOLATION_METHODS`.
+
+    :returns: Motor del método para las coordenadas y malla, creado solo la primera vez.
+    '''
+    if method not in INTERPOLATION_METHODS:
+        raise ValueError(f'Método de interpolación inválido: {method!r}')
+    if method == 'kriging':
+        # pykrige solo se importa si se usa
+        from kriging import get_engine as get_kriging_engine
+        return get_kriging_engine(xcoords, ycoords, gridrange)
+
+    key = (
+        method,
+        tuple(np.asarray(xcoords, dtype=float)),
+        tuple(np.asarray(ycoords, dtype=float)),
+        tuple(gridrange)
+    )
+    with _engines_lock:
+        if key not in _engines:
+            neighbors = 1 if method == 'nearest' else IDW_NEIGHBORS
+            _engines[key] = IDWEngine(xcoords, ycoords, gridrange, neighbors)
+        return _engines[key]
+
+def interpolate(
+        xcoords: Sequence, ycoords: Sequence, zvalues: Sequence, gridrange: range,
+        method: str = 'kriging', variograms: Optional[Sequence] = None) -> Tuple[List[float], List[float], List[float]]:
+    '''
+    Igual que `kriging.interpolate`, con el método `method`.
+    Los demás métodos no usan `variograms`.
+    '''
+    engine = get_engine(method, xcoords, ycoords, gridrange)
+    if method == 'kriging':
+        return engine.interpolate(zvalues, variograms)
+    return engine.interpolate(zvalues)
+
+def interpolate_fields(
+        xcoords: Sequence, ycoords: Sequence, zblock: Sequence, gridrange: range,
+        method: str = 'kriging', variograms: Optional[Sequence] = None) -> Tuple[List[float], List[float], np.ndarray]:
+    '''
+    Igual que `kriging.interpolate_fields`, con el método `method`.
+    '''
+    engine = get_engine(method, xcoords, ycoords, gridrange)
+    if method == 'kriging':
+        return engine.interpolate_many(zblock, variograms)
+    return engine.interpolate_many(zblock)
+
+def compare_methods(
+        dataset: pd.DataFrame, pollutant: str, methods: Iterable[str] = INTERPOLATION_METHODS,
+        gridrange: range = range(5, 41, 5)) -> List[Dict[str, Any]]:
+    '''
+    Interpola el contaminante de cada hora de `dataset` con cada método
+    y compara sus mallas contra las del kriging.
+
+    :param dataset: Registros con coordenadas, ver `heatmap.read_day`.
+
+    :returns: Por método: segundos por hora (incluye crear el motor la primera vez),
+        raíz del error cuadrático medio, error absoluto máximo y error relativo
+        (RMSE entre el rango del contaminante en las mallas de kriging).
+    '''
+    hours = [group for _, group in dataset.groupby('timestamp')]
+
+    grids = dict()
+    seconds = dict()
+    for method in dict.fromkeys(['kriging', *methods]):
+        start = time.perf_counter()
+        grids[method] = np.array([
+            interpolate(hour.lon, hour.lat, hour[pollutant], gridrange, method)[2]
+            for hour in hours
+        ])
+        seconds[method] = (time.perf_counter() - start) / max(len(hours), 1)
+
+    reference = grids['kriging']
+    scale = np.ptp(reference) if reference.size else 0.0
+    report = list()
+    for method in dict.fromkeys(methods):
+        errors = grids[method] - reference
+        rmse = float(np.sqrt(np.mean(errors ** 2))) if errors.size else 0.0
+        report.append({
+            'method': method,
+            'hours': len(hours),
+            'seconds_per_hour': seconds[method],
+            'speedup': seconds['kriging'] / seconds[method] if seconds[method] else float('inf'),
+            'rmse': rmse,
+            'max_error': float(np.abs(errors).max()) if errors.size else 0.0,
+            'relative_rmse': rmse / scale if scale else 0.0,
+        })
+    return report
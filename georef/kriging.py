@@ -2,10 +2,14 @@
 Interpolación con método de Kringing.
 '''
 
-from typing import Iterable, Tuple, List, Sequence
-from itertools import chain, product
+import threading
+from collections import OrderedDict
+from typing import Iterable, Tuple, List, Sequence, Optional
 
 import numpy as np
+from scipy.linalg import lu_factor, lu_solve
+from scipy.spatial.distance import cdist, pdist
+from pykrige import core
 from pykrige.ok import OrdinaryKriging
 
 def get_segments(array: Iterable, n: int) -> np.ndarray:
@@ -15,25 +19,327 @@ def get_segments(array: Iterable, n: int) -> np.ndarray:
     amin, amax = min(array), max(array)
     return np.linspace(amin, amax, n)
 
-def interpolate(xcoords: Sequence, ycoords: Sequence, zvalues: Sequence, gridrange: range) -> Tuple[List[float], List[float], List[float]]:
+class KrigingStep:
     '''
-    Interpola las coordenadas (`xcoords`, `ycoords`) con valores `zvalues` para estimar puntos
-    usando un rango `gridrange` en forma de malla recursiva.
+    Geometría fija de un paso de la malla recursiva:
+    distancias entre puntos conocidos y de éstos a los puntos de la malla.
+    '''
+    def __init__(self, sources: np.ndarray, xpoints: np.ndarray, ypoints: np.ndarray, nlags: int = 6) -> None:
+        self.sources = sources
+        # puntos de la malla en el mismo orden que `OrdinaryKriging.execute('grid')`
+        gridx, gridy = np.meshgrid(xpoints, ypoints)
+        self.targets = np.column_stack((gridx.ravel(), gridy.ravel()))
+
+        self.distances = cdist(sources, sources)
+        self.target_distances = cdist(self.targets, sources)
+
+        # agrupación de distancias para el variograma experimental,
+        # igual que `pykrige.core._initialize_variogram_model`
+        self.pairs = pdist(sources)
+        dmin, dmax = np.amin(self.pairs), np.amax(self.pairs)
+        dd = (dmax - dmin) / nlags
+        bins = [dmin + n * dd for n in range(nlags)]
+        bins.append(dmax + 0.001)
+
+        # índices de los pares de cada grupo, sin los grupos vacíos
+        self.groups = list()
+        for n in range(nlags):
+            group = np.flatnonzero((self.pairs >= bins[n]) & (self.pairs < bins[n + 1]))
+            if group.size > 0:
+                self.groups.append(group)
+        self.lags = np.array([np.mean(self.pairs[group]) for group in self.groups])
+
+    def semivariance(self, values: np.ndarray) -> np.ndarray:
+        '''
+        Semivarianza experimental promedio de cada grupo de distancias.
+        '''
+        # se promedia igual que `pykrige` porque el ajuste del variograma
+        # es sensible a diferencias de redondeo
+        halfsq = 0.5 * pdist(values[:, np.newaxis], metric='sqeuclidean')
+        return np.array([np.mean(halfsq[group]) for group in self.groups])
+
+class KrigingEngine:
     '''
-    for k in gridrange:
-        krige = OrdinaryKriging(
-            xcoords, ycoords, zvalues,
-            variogram_model='spherical'
+    Kriging ordinario sobre una red fija de estaciones.
+
+    Las estaciones no se mueven, así que las distancias de cada paso
+    de la malla recursiva se calculan una sola vez. Cada vector de valores
+    tiene su propio variograma y el sistema de kriging factorizado se guarda
+    por variograma, así los vectores con el mismo variograma se resuelven juntos:
+    con los variogramas de un día (ver `fit_variograms`) cada hora solo cuesta
+    una sustitución hacia atrás y un producto de matrices por paso y campo.
+    '''
+    # diferencia mínima para considerar que una distancia es cero
+    eps = 1.0e-10
+
+    def __init__(
+            self, xcoords: Sequence, ycoords: Sequence, gridrange: range,
+            variogram_model: str = 'spherical', variogram_parameters: Optional[Sequence[float]] = None,
+            cache_size: Optional[int] = None) -> None:
+        '''
+        :param xcoords: Longitudes de las estaciones.
+
+        :param ycoords: Latitudes de las estaciones.
+
+        :param gridrange: Tamaños de la malla recursiva, ejemplo: `range(5, 41, 5)`.
+
+        :param variogram_model: Modelo de variograma de `pykrige`.
+
+        :param variogram_parameters: Parámetros fijos del variograma,
+            si no se especifican se ajustan a los vectores de valores como en `pykrige`.
+
+        :param cache_size: Número máximo de sistemas factorizados que se guardan,
+            por defecto dos por paso: los de los variogramas de un día
+            de dos campos, como velocidad y dirección del viento.
+        '''
+        self.variogram_model = variogram_model
+        self.variogram_function = OrdinaryKriging.variogram_dict[variogram_model]
+        self.variogram_parameters = None
+        if variogram_parameters is not None:
+            self.variogram_parameters = tuple(
+                core._make_variogram_parameter_list(variogram_model, variogram_parameters)
+            )
+        self.factors = OrderedDict()
+        # los hilos del servidor comparten el motor y su caché de factorizaciones
+        self.lock = threading.Lock()
+
+        sources = np.column_stack((np.asarray(xcoords, dtype=float), np.asarray(ycoords, dtype=float)))
+        self.steps = list()
+        for k in gridrange:
+            xpoints, ypoints = get_segments(sources[:, 0], k), get_segments(sources[:, 1], k)
+            step = KrigingStep(sources, xpoints, ypoints)
+            self.steps.append(step)
+            # la malla de este paso son los puntos conocidos del siguiente
+            sources = step.targets
+        self.cache_size = 2 * len(self.steps) if cache_size is None else cache_size
+
+    def fit_variogram(self, step: KrigingStep, values: np.ndarray) -> Tuple[float, ...]:
+        '''
+        Ajusta un solo variograma a todas las filas de `values`, o usa los parámetros fijos.
+        Las filas deben ser del mismo campo, por ejemplo varias horas de un contaminante.
+
+        La semivarianza de cada fila se divide entre su varianza para que
+        las horas de mayor variación no dominen el ajuste, y el promedio
+        se regresa a la varianza media.
+        Con una sola fila el ajuste es el mismo que el de `pykrige`.
+        '''
+        if self.variogram_parameters is not None:
+            return self.variogram_parameters
+
+        if len(values) == 1:
+            semivariance = step.semivariance(values[0])
+        else:
+            variances = np.var(values, axis=1)
+            semivariance = np.mean(
+                [step.semivariance(row) / variance for row, variance in zip(values, variances)],
+                axis=0
+            ) * np.mean(variances)
+
+        parameters = core._calculate_variogram_model(
+            step.lags, semivariance,
+            self.variogram_model, self.variogram_function, False
         )
+        return tuple(parameters)
+
+    def get_factor(self, index: int, parameters: Tuple[float, ...]) -> Tuple[tuple, np.ndarray]:
+        '''
+        Factorización LU del sistema de kriging del paso `index`
+        y la matriz de variograma hacia la malla, guardadas por variograma.
+        '''
+        key = (index, parameters)
+        with self.lock:
+            if key in self.factors:
+                self.factors.move_to_end(key)
+                return self.factors[key]
+
+        step = self.steps[index]
+        n = len(step.sources)
+
+        a = np.zeros((n + 1, n + 1))
+        a[:n, :n] = -self.variogram_function(parameters, step.distances)
+        np.fill_diagonal(a, 0.0)
+        a[n, :] = 1.0
+        a[:, n] = 1.0
+        a[n, n] = 0.0
+
+        b = np.ones((len(step.targets), n + 1))
+        b[:, :n] = -self.variogram_function(parameters, step.target_distances)
+        # valores exactos en puntos que coinciden con puntos conocidos
+        b[:, :n][np.absolute(step.target_distances) <= self.eps] = 0.0
+
+        factor = (lu_factor(a), b)
+        # se factoriza fuera del candado, si otro hilo se adelantó basta con reemplazarla
+        with self.lock:
+            self.factors[key] = factor
+            self.factors.move_to_end(key)
+            while len(self.factors) > self.cache_size:
+                self.factors.popitem(last=False)
+        return factor
+
+    def solve(
+            self, index: int, values: np.ndarray,
+            parameters: Optional[Sequence[Optional[Tuple[float, ...]]]] = None) -> Tuple[np.ndarray, list]:
+        '''
+        Estima los valores de la malla del paso `index` para cada fila de `values`.
+
+        Como la matriz de kriging es simétrica, en lugar de resolver
+        un sistema por punto de la malla se resuelve uno solo por vector
+        de valores (forma dual) y se multiplica por la matriz hacia la malla.
+        Los vectores con el mismo variograma se resuelven juntos.
+
+        :param values: Arreglo de forma (vectores, puntos conocidos).
+
+        :param parameters: Parámetros del variograma de cada fila;
+            a las filas sin parámetros se les ajusta el suyo, ver `fit_variogram`.
 
-        xpoints, ypoints = get_segments(xcoords, k), get_segments(ycoords, k)
-        # ejecutar método de kriging
-        zvalues, _ = krige.execute('grid', xpoints, ypoints)
+        :returns: Arreglo de forma (vectores, puntos de la malla) y parámetros
+            usados en cada fila, `None` en las filas constantes.
+        '''
+        step = self.steps[index]
+        estimated = np.empty((len(values), len(step.targets)))
+        used: List[Optional[Tuple[float, ...]]] = [None] * len(values)
 
-        # usar cada celda de la malla generada como punto estimado
-        xcoords = [x for y, x in product(ypoints, xpoints)]
-        ycoords = [y for y, x in product(ypoints, xpoints)]
-        zvalues = list(chain.from_iterable(zvalues))
+        # con valores constantes no hay variograma que ajustar,
+        # la malla estimada es la misma constante; se tolera el redondeo
+        # de un paso anterior que estimó una constante
+        scale = np.maximum(np.amax(np.absolute(values), axis=1), 1.0)
+        constant = np.ptp(values, axis=1) <= self.eps * scale
+        estimated[constant] = values[constant, :1]
 
+        # agrupar filas por parámetros de variograma
+        groups = OrderedDict()
+        for row in np.flatnonzero(~constant):
+            rowparameters = parameters[row] if parameters is not None else None
+            if rowparameters is None:
+                rowparameters = self.fit_variogram(step, values[row:row + 1])
+            used[row] = rowparameters
+            groups.setdefault(rowparameters, list()).append(row)
+
+        for rowparameters, rows in groups.items():
+            lu, b = self.get_factor(index, rowparameters)
+            rhs = np.zeros((len(step.sources) + 1, len(rows)))
+            rhs[:-1] = values[rows].T
+            estimated[rows] = (b @ lu_solve(lu, rhs)).T
+        return estimated, used
+
+    def run_steps(
+            self, values: np.ndarray,
+            variograms: Optional[Sequence[Sequence[Optional[Tuple[float, ...]]]]] = None) -> np.ndarray:
+        '''
+        Aplica todos los pasos de la malla recursiva a las filas de `values`.
+
+        :param variograms: Parámetros del variograma de cada paso y campo, ver `fit_variograms`.
+            Con `n` campos, la fila `i` usa el del campo `i % n`.
+
+        :returns: Valores de la malla final.
+        '''
+        for index in range(len(self.steps)):
+            parameters = None
+            if variograms is not None:
+                fields = variograms[index]
+                parameters = [fields[row % len(fields)] for row in range(len(values))]
+            values, _ = self.solve(index, values, parameters)
+        return values
+
+    def fit_variograms(self, zblock: Sequence) -> tuple:
+        '''
+        Ajusta el variograma de cada paso y campo a todos los vectores de `zblock`,
+        por ejemplo las 24 horas de un día, para interpolar después cada vector
+        con `interpolate(zvalues, variograms)` reutilizando las factorizaciones.
+
+        :param zblock: Arreglo de forma (vectores, estaciones) de un solo campo
+            o (vectores, campos, estaciones), ejemplo: (horas, [velocidad, dirección], estaciones).
+
+        :returns: Por cada paso, los parámetros del variograma de cada campo,
+            `None` si todos los vectores del campo son constantes en ese paso.
+        '''
+        block = np.asarray(zblock, dtype=float)
+        fields = block.shape[1] if block.ndim == 3 else 1
+        values = block.reshape(-1, block.shape[-1])
+
+        variograms = list()
+        for index, step in enumerate(self.steps):
+            scale = np.maximum(np.amax(np.absolute(values), axis=1), 1.0)
+            varying = np.ptp(values, axis=1) > self.eps * scale
+            parameters = list()
+            for field in range(fields):
+                rows = np.flatnonzero(varying[field::fields]) * fields + field
+                parameters.append(self.fit_variogram(step, values[rows]) if rows.size > 0 else None)
+            variograms.append(tuple(parameters))
+            values, _ = self.solve(index, values, [parameters[row % fields] for row in range(len(values))])
+        return tuple(variograms)
+
+    def interpolate_many(
+            self, zblock: Sequence,
+            variograms: Optional[Sequence] = None) -> Tuple[List[float], List[float], np.ndarray]:
+        '''
+        Interpola varios vectores de valores de las mismas estaciones a la vez,
+        por ejemplo varios contaminantes o campos de viento de varias horas.
+
+        :param zblock: Arreglo cuya última dimensión son las estaciones,
+            ejemplo: (campos, estaciones) o (horas, campos, estaciones).
+
+        :param variograms: Parámetros del variograma de cada paso y campo
+            (penúltima dimensión de `zblock`, o uno para todos los vectores),
+            ver `fit_variograms`; si no se especifican se ajusta uno a cada vector.
+
+        :returns: Coordenadas x, y de la malla final y arreglo de valores
+            con las mismas dimensiones iniciales que `zblock` y la malla al final.
+        '''
+        block = np.asarray(zblock, dtype=float)
+        values = self.run_steps(block.reshape(-1, block.shape[-1]), variograms)
+
+        targets = self.steps[-1].targets
+        return targets[:, 0].tolist(), targets[:, 1].tolist(), values.reshape(block.shape[:-1] + (-1,))
+
+    def interpolate(
+            self, zvalues: Sequence,
+            variograms: Optional[Sequence] = None) -> Tuple[List[float], List[float], List[float]]:
+        '''
+        Interpola los valores `zvalues` de las estaciones en la malla recursiva.
+
+        :param variograms: Parámetros del variograma de cada paso, ver `fit_variograms`.
+
+        :returns: Coordenadas x, y y valores de la malla final.
+        '''
+        xpoints, ypoints, zpoints = self.interpolate_many(zvalues, variograms)
+        return xpoints, ypoints, zpoints.tolist()
+
+# motores por geometría, para no recalcular distancias entre llamadas
+_engines = dict()
+_engines_lock = threading.Lock()
+
+def get_engine(xcoords: Sequence, ycoords: Sequence, gridrange: range) -> KrigingEngine:
+    '''
+    :returns: `KrigingEngine` de las coordenadas y malla, creado solo la primera vez.
+    '''
+    key = (
+        tuple(np.asarray(xcoords, dtype=float)),
+        tuple(np.asarray(ycoords, dtype=float)),
+        tuple(gridrange)
+    )
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = KrigingEngine(xcoords, ycoords, gridrange)
+        return _engines[key]
+
+def interpolate(
+        xcoords: Sequence, ycoords: Sequence, zvalues: Sequence, gridrange: range,
+        variograms: Optional[Sequence] = None) -> Tuple[List[float], List[float], List[float]]:
+    '''
+    Interpola las coordenadas (`xcoords`, `ycoords`) con valores `zvalues` para estimar puntos
+    usando un rango `gridrange` en forma de malla recursiva.
+
+    :param variograms: Parámetros del variograma de cada paso, ver `KrigingEngine.fit_variograms`.
+    '''
     # retornar 1600 coordenadas (malla 40x40)
-    return xcoords, ycoords, zvalues
+    return get_engine(xcoords, ycoords, gridrange).interpolate(zvalues, variograms)
+
+def interpolate_fields(
+        xcoords: Sequence, ycoords: Sequence, zblock: Sequence, gridrange: range,
+        variograms: Optional[Sequence] = None) -> Tuple[List[float], List[float], np.ndarray]:
+    '''
+    Igual que `interpolate` pero para varios vectores de valores de las mismas
+    coordenadas en una sola llamada, ver `KrigingEngine.interpolate_many`.
+    '''
+    return get_engine(xcoords, ycoords, gridrange).interpolate_many(zblock, variograms)
@@ -0,0 +1,267 @@
+'''
+Opciones para guardar las figuras de los mapas en archivos HTML más ligeros:
+redondeo de valores, arreglos numéricos codificados en binario (base64)
+y plotly.js externo en lugar de incluirlo en cada archivo.
+
+También contiene `FigureWriter`, que escribe el HTML de una figura animada
+cuadro por cuadro, sin construir ni validar la figura completa en memoria.
+'''
+
+import base64
+import json
+import uuid
+import webbrowser
+from numbers import Real
+from pathlib import Path
+from typing import Any, List, NamedTuple, Optional, Union
+
+import numpy as np
+import plotly.graph_objects as go
+from plotly.io.json import to_json_plotly
+from plotly.io._utils import plotly_cdn_url
+from plotly.offline import get_plotlyjs
+
+from profiling import span
+
+# llaves cuyos valores se muestran como texto, se redondean pero no se codifican
+TEXT_KEYS = {'text', 'hovertext'}
+# llaves que no son arreglos de datos y se dejan intactas
+SKIP_KEYS = {'geojson'}
+
+class OutputOptions(NamedTuple):
+    '''
+    Opciones de salida de las figuras.
+
+    :param precision: Decimales a los que se redondean coordenadas y valores,
+        `None` para no redondear.
+
+    :param binary: Codificar los arreglos numéricos como buffers tipados en base64
+        (soportado desde plotly.js 2.28) en lugar de listas de texto JSON.
+
+    :param plotlyjs: Cómo incluir plotly.js, igual que `include_plotlyjs`
+        de `plotly.io.write_html`: `True` lo incluye en el archivo,
+        'cdn' lo referencia en línea, 'directory' lo guarda junto al HTML,
+        o una ruta o URL terminada en '.js'.
+
+    :param format: 'html' para una página que dibuja la figura,
+        o 'json' para solo la figura (llaves 'data', 'layout' y 'frames'),
+        que puede dibujarse con `Plotly.newPlot` desde otra página.
+
+    :param auto_open: Abrir el HTML en el navegador al terminar.
+    '''
+    precision: Optional[int] = None
+    binary: bool = False
+    plotlyjs: Union[bool, str] = True
+    format: str = 'html'
+    auto_open: bool = True
+
+# formatos de salida de `FigureWriter`
+FORMATS = ('html', 'json')
+
+def is_numeric_array(value: Any) -> bool:
+    '''
+    Revisa si `value` es una lista o arreglo no vacío de solo números (sin booleanos).
+    '''
+    if isinstance(value, np.ndarray):
+        return value.size > 0 and value.dtype.kind in 'iuf'
+    if isinstance(value, (list, tuple)) and value:
+        return all(
+            isinstance(item, Real) and not isinstance(item, (bool, np.bool_))
+            for item in value
+        )
+    return False
+
+def encode_array(array: np.ndarray) -> dict:
+    '''
+    Codifica un arreglo numérico como buffer tipado de plotly.js.
+    '''
+    if array.dtype.kind in 'iu':
+        array = array.astype(np.int32)
+        dtype = 'i4'
+    else:
+        array = array.astype(np.float32)
+        dtype = 'f4'
+    # plotly.js espera los bytes en little-endian
+    data = array.astype(array.dtype.newbyteorder('<')).tobytes()
+    return {'dtype': dtype, 'bdata': base64.b64encode(data).decode('ascii')}
+
+def compact_value(value: Any, options: OutputOptions, key: str = '') -> Any:
+    '''
+    Redondea y codifica recursivamente los arreglos numéricos de `value`.
+    '''
+    if isinstance(value, dict):
+        return {
+            k: v if k in SKIP_KEYS else compact_value(v, options, k)
+            for k, v in value.items()
+        }
+
+    if is_numeric_array(value):
+        array = np.asarray(value)
+        if options.precision is not None and array.dtype.kind == 'f':
+            array = array.round(options.precision)
+        if options.binary and key not in TEXT_KEYS:
+            return encode_array(array)
+        return array.tolist()
+
+    if isinstance(value, (list, tuple)):
+        return [compact_value(item, options, key) for item in value]
+
+    if options.precision is not None and isinstance(value, float):
+        return round(value, options.precision)
+    return value
+
+# configuración de plotly.js antes de cargarlo, igual que `plotly.io.to_html`
+PLOTLY_CONFIG_SCRIPT = (
+    '<script type="text/javascript">'
+    "window.PlotlyConfig = {MathJaxConfig: 'local'};"
+    '</script>'
+)
+
+def get_plotlyjs_tag(plotlyjs: Union[bool, str]) -> str:
+    '''
+    Etiqueta HTML que carga plotly.js según `OutputOptions.plotlyjs`.
+    '''
+    if isinstance(plotlyjs, str):
+        if plotlyjs.lower() == 'cdn':
+            src = plotly_cdn_url()
+        elif plotlyjs.lower() == 'directory':
+            src = 'plotly.min.js'
+        elif plotlyjs.endswith('.js'):
+            src = plotlyjs
+        else:
+            raise ValueError(f'Valor inválido para incluir plotly.js: {plotlyjs}')
+        return f'{PLOTLY_CONFIG_SCRIPT}\n<script charset="utf-8" src="{src}"></script>'
+
+    if plotlyjs:
+        return f'{PLOTLY_CONFIG_SCRIPT}\n<script type="text/javascript">{get_plotlyjs()}</script>'
+    return ''
+
+class FigureWriter:
+    '''
+    Escribe una figura animada en un archivo HTML (o JSON, ver `OutputOptions.format`)
+    conforme se generan sus cuadros.
+
+    `plotly.io.write_html` necesita la figura completa: valida cada propiedad
+    de cada cuadro y serializa todo en una sola cadena. Aquí cada cuadro
+    se serializa y se escribe en cuanto se agrega, sin validarlo,
+    así que solo debe usarse con cuadros generados por este paquete.
+    La traza base y el diseño, que son uno solo, sí se validan al final.
+
+    El HTML resultante es equivalente al de `plotly.offline.plot`:
+    primero se definen los cuadros y al final se llama a `Plotly.newPlot`,
+    `Plotly.addFrames` y `Plotly.animate`.
+
+    Uso::
+
+        with FigureWriter(filepath, options) as writer:
+            for frame in frames:
+                writer.add_frame(frame)
+            writer.finish(data, layout)
+    '''
+    def __init__(self, filepath: str, options: Optional[OutputOptions] = None) -> None:
+        '''
+        :param filepath: Ruta del archivo HTML o JSON.
+
+        :param options: Opciones de salida, por defecto ninguna modificación.
+        '''
+        self.path = Path(filepath)
+        self.options = options if options is not None else OutputOptions()
+        if self.options.format not in FORMATS:
+            raise ValueError(f'Formato de salida inválido: {self.options.format}')
+        self.html = self.options.format == 'html'
+        self.compact = self.options.precision is not None or self.options.binary
+        self.divid = str(uuid.uuid4())
+        self.count = 0
+        self.file = None
+
+    def __enter__(self) -> 'FigureWriter':
+        self.file = open(self.path, 'w', encoding='utf-8')
+        if not self.html:
+            # los cuadros se conocen antes que la traza base y el diseño
+            self.file.write('{"frames": [\n')
+            return self
+        self.file.write(
+            '<html>\n<head><meta charset="utf-8" /></head>\n<body>\n<div>\n'
+            f'{get_plotlyjs_tag(self.options.plotlyjs)}\n'
+            f'<div id="{self.divid}" class="plotly-graph-div" style="height:100%; width:100%;"></div>\n'
+            '<script type="text/javascript">\n'
+            'window.PLOTLYENV=window.PLOTLYENV || {};\n'
+            'var frames = [\n'
+        )
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # si no se llamó a `finish`, por un error o por no haber cuadros,
+        # no dejar un archivo incompleto
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.path.unlink()
+
+    def add_frame(self, frame: dict) -> None:
+        '''
+        Serializa y escribe un cuadro de animación.
+
+        :param frame: Cuadro con llaves 'name' y 'data', las trazas de 'data'
+            deben usar propiedades anidadas (`marker=dict(...)`),
+            no la forma abreviada `marker_opacity`.
+        '''
+        with span('write'):
+            if self.compact:
+                frame = dict(frame, data=compact_value(frame.get('data', list()), self.options))
+            if self.count > 0:
+                self.file.write(',\n')
+            self.file.write(to_json_plotly(frame))
+        self.count += 1
+
+    def finish(self, data: List[dict], layout: Union[go.Layout, dict]) -> None:
+        '''
+        Escribe la traza base y el diseño, cierra el archivo
+        y, si es HTML, lo abre en el navegador.
+
+        :param data: Trazas iniciales de la figura.
+
+        :param layout: Diseño de la figura, incluyendo deslizador y botones.
+        '''
+        with span('write', frames=self.count):
+            # validar solo la figura base, esto también le aplica la plantilla por defecto;
+            # el GeoJSON se aparta porque validarlo lo copia completo dos veces
+            skipped = [{k: trace[k] for k in SKIP_KEYS if k in trace} for trace in data]
+            data = [{k: v for k, v in trace.items() if k not in SKIP_KEYS} for trace in data]
+            figure = go.Figure(data=data, layout=layout).to_dict()
+            data = figure['data']
+            if self.compact:
+                data = compact_value(data, self.options)
+            data = [dict(trace, **extra) for trace, extra in zip(data, skipped)]
+
+            if not self.html:
+                self.file.write(
+                    f'\n],\n"data": {to_json_plotly(data)},\n'
+                    f'"layout": {to_json_plotly(figure["layout"])}\n}}'
+                )
+                self.file.close()
+                self.file = None
+                return
+
+            self.file.write(
+                '\n];\n'
+                f'if (document.getElementById("{self.divid}")) {{\n'
+                f'    Plotly.newPlot("{self.divid}", {to_json_plotly(data)}, '
+                f'{to_json_plotly(figure["layout"])}, {json.dumps({"responsive": True})})'
+            )
+            if self.count > 0:
+                self.file.write(
+                    f'.then(function(){{ Plotly.addFrames("{self.divid}", frames); }})'
+                    f'.then(function(){{ Plotly.animate("{self.divid}", null); }})'
+                )
+            self.file.write(';\n}\n</script>\n</div>\n</body>\n</html>')
+            self.file.close()
+            self.file = None
+
+            if isinstance(self.options.plotlyjs, str) and self.options.plotlyjs.lower() == 'directory':
+                bundle = self.path.parent / 'plotly.min.js'
+                if not bundle.exists():
+                    bundle.write_text(get_plotlyjs(), encoding='utf-8')
+
+        if self.options.auto_open:
+            webbrowser.open(self.path.absolute().as_uri())
@@ -0,0 +1,202 @@
+'''
+Medición de las etapas de los mapas (lectura, filtrado, semanas epidemiológicas,
+agregación, kriging, cuadros y escritura) sin usar un perfilador.
+
+Cada etapa se envuelve en un intervalo con nombre (`span`). Mientras la medición
+no esté activa los intervalos no hacen nada, así que pueden quedarse en el código.
+Con `enable` se empiezan a registrar y con `dump` se guardan en un archivo JSON:
+
+    enable()
+    with span('read') as record:
+        entries = read_entries(...)
+        record['rows'] = len(entries)
+    dump('perfil.json')
+
+Los intervalos pueden anidarse, ejemplo: 'write' dentro de 'frame'.
+El tiempo de un intervalo incluye el de los anidados; los registros ('rows')
+de un intervalo anidado dentro de otro que también los reporta ya están
+contados en el externo, así que el resumen solo suma los del más externo.
+
+Los intervalos de los procesos de `ProcessPoolExecutor` no se registran,
+solo los del proceso principal.
+'''
+
+import json
+import os
+import platform
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import count
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar('T')
+
+# intervalos terminados y pila de los que están abiertos
+_spans: List[Dict[str, Any]] = list()
+_stack: List[Dict[str, Any]] = list()
+# ids de los intervalos, nunca se repiten aunque se descarte alguno
+_ids = count()
+_enabled = False
+# momento en que se activó la medición, los inicios son relativos a él
+_origin = 0.0
+
+def get_rss() -> Optional[int]:
+    '''
+    :returns: Memoria residente actual del proceso en bytes,
+        o `None` si el sistema no la expone en /proc.
+    '''
+    try:
+        with open('/proc/self/statm') as file:
+            pages = int(file.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+def get_peak_rss() -> Optional[int]:
+    '''
+    :returns: Memoria residente máxima del proceso en bytes,
+        o `None` en sistemas sin el módulo `resource` (Windows).
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS la reporta en bytes, Linux en KB
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def enable() -> None:
+    '''
+    Activa el registro de intervalos, descartando los anteriores.
+    '''
+    global _enabled, _origin, _ids
+    _spans.clear()
+    _stack.clear()
+    _ids = count()
+    _enabled = True
+    _origin = time.perf_counter()
+
+def disable() -> None:
+    '''
+    Desactiva el registro de intervalos, conservando los registrados.
+    '''
+    global _enabled
+    _enabled = False
+
+def is_enabled() -> bool:
+    '''
+    Revisa si se están registrando los intervalos.
+    '''
+    return _enabled
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    '''
+    Mide el bloque de código que envuelve: tiempo real, tiempo de CPU
+    y cambio de memoria residente.
+
+    :param name: Nombre de la etapa, ejemplo: 'read'.
+
+    :param attributes: Datos extra del intervalo, ejemplo: `source='cache'`.
+
+    :returns: Diccionario del intervalo, para agregarle datos dentro del bloque,
+        por ejemplo `record['rows'] = len(entries)`.
+    '''
+    record = dict(attributes)
+    if not _enabled:
+        yield record
+        return
+
+    parent = _stack[-1]['id'] if _stack else None
+    record.update(id=next(_ids), name=name, parent=parent)
+    _stack.append(record)
+
+    rss = get_rss()
+    cpu = time.process_time()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        wall = time.perf_counter() - start
+        record['start'] = round(start - _origin, 6)
+        record['wall'] = round(wall, 6)
+        record['cpu'] = round(time.process_time() - cpu, 6)
+        after = get_rss()
+        record['rss_delta'] = after - rss if rss is not None and after is not None else None
+        _stack.pop()
+        if not record.pop('discard', False):
+            _spans.append(record)
+
+def timed(name: str, iterable: Iterable[T], **attributes: Any) -> Iterator[T]:
+    '''
+    Itera sobre `iterable` midiendo como intervalo el tiempo de obtener cada elemento,
+    sin incluir el de procesarlo, útil con generadores y `Executor.map`.
+    '''
+    iterator = iter(iterable)
+    end = object()
+    while True:
+        with span(name, **attributes) as record:
+            item = next(iterator, end)
+            # la última llamada solo indica que ya no hay elementos
+            record['discard'] = item is end
+        if item is end:
+            return
+        yield item
+
+def summarize(spans: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    '''
+    Agrupa los intervalos por nombre.
+
+    :returns: Diccionario de nombre a conteo, tiempo real y de CPU totales
+        (incluyen los intervalos anidados) y registros totales,
+        en orden de primera aparición. Los registros de un intervalo
+        dentro de otro que también los reporta no se suman.
+    '''
+    byid = {record['id']: record for record in spans}
+
+    def is_outermost(record: Dict[str, Any]) -> bool:
+        parent = byid.get(record['parent'])
+        while parent is not None:
+            if parent.get('rows') is not None:
+                return False
+            parent = byid.get(parent['parent'])
+        return True
+
+    summary: Dict[str, Dict[str, Any]] = OrderedDict()
+    for record in sorted(spans, key=lambda record: record['start']):
+        total = summary.setdefault(record['name'], {'count': 0, 'wall': 0.0, 'cpu': 0.0, 'rows': 0})
+        total['count'] += 1
+        total['wall'] += record['wall']
+        total['cpu'] += record['cpu']
+        if is_outermost(record):
+            total['rows'] += record.get('rows') or 0
+    for total in summary.values():
+        total['wall'] = round(total['wall'], 6)
+        total['cpu'] = round(total['cpu'], 6)
+    return summary
+
+def get_trace() -> Dict[str, Any]:
+    '''
+    :returns: Traza con los intervalos registrados ordenados por inicio,
+        su resumen por nombre y datos del proceso.
+    '''
+    spans = sorted(_spans, key=lambda record: record['start'])
+    return {
+        'argv': sys.argv,
+        'python': platform.python_version(),
+        'pid': os.getpid(),
+        'peak_rss': get_peak_rss(),
+        'summary': summarize(spans),
+        'spans': spans,
+    }
+
+def dump(filepath: str) -> None:
+    '''
+    Guarda la traza en un archivo JSON.
+    Los tiempos están en segundos y la memoria en bytes.
+    '''
+    with open(filepath, 'w') as file:
+        json.dump(get_trace(), file, indent=2, default=str)
+    print(f'{filepath}: Perfil guardado', flush=True)
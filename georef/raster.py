@@ -0,0 +1,210 @@
+'''
+Archivo binario con las mallas interpoladas de cada hora de un mapa de calor,
+para analizarlas después sin volver a interpolar.
+
+Formato, en little-endian:
+
+- `MAGIC` (8 bytes) y la longitud del encabezado (4 bytes).
+- Encabezado JSON: contaminante, método de interpolación, límites de la red
+  de estaciones y, por malla, sus campos, filas y columnas
+  (ver `GridWriter.get_header`). Se rellena con espacios hasta múltiplo de 64 bytes.
+- Un registro de tamaño fijo por hora (ver `get_record_dtype`):
+  fecha en nanosegundos, límites de la malla de la hora
+  (xmin, ymin, xmax, ymax) y los valores de cada malla como `float32`
+  de forma (campos, filas, columnas).
+
+Las horas se agregan al final conforme se interpolan, así el archivo se escribe
+sin tener todas las mallas en memoria, y se lee con `numpy.memmap`:
+`GridCube(filepath).get_grid('pollutant', hours)` regresa una vista
+(horas, campos, filas, columnas) que solo lee del disco las horas que se usan.
+
+La fila 0 de cada malla es la latitud mínima y la columna 0 la longitud mínima,
+igual que el orden de los puntos de `kriging.KrigingEngine`.
+'''
+
+import json
+import os
+import struct
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'GEOGRID1'
+# firma y longitud del encabezado
+PREFIX = struct.Struct('<8sI')
+# alineación del inicio de los registros
+ALIGNMENT = 64
+
+def get_record_dtype(grids: Dict[str, Dict[str, Any]]) -> np.dtype:
+    '''
+    :param grids: Campos, filas y columnas de cada malla, ver `GridWriter.get_header`.
+
+    :returns: Tipo de los registros de cada hora.
+    '''
+    fields = [('timestamp', '<i8'), ('bounds', '<f8', (4,))]
+    for name, grid in grids.items():
+        fields.append((name, '<f4', (len(grid['fields']), grid['rows'], grid['cols'])))
+    return np.dtype(fields)
+
+class GridWriter:
+    '''
+    Escribe las mallas de cada hora al archivo conforme se agregan.
+    Se escribe a un temporal que al cerrar sin errores reemplaza a `filepath`.
+
+        with GridWriter(filepath, 'PM10', 'kriging', bounds, (40, 20)) as writer:
+            for hour, grids in ...:
+                writer.add_hour(hour, grids)
+    '''
+    def __init__(
+            self, filepath: str, pollutant: str, method: str,
+            bounds: Sequence[float], sizes: Tuple[int, int]) -> None:
+        '''
+        :param pollutant: Nombre del contaminante.
+
+        :param method: Método de interpolación de las mallas.
+
+        :param bounds: Límites de la red de estaciones (xmin, ymin, xmax, ymax).
+
+        :param sizes: Filas (y columnas) de las mallas del contaminante y del viento.
+        '''
+        self.filepath = filepath
+        self.temppath = f'{filepath}.{os.getpid()}.tmp'
+        self.pollutant = pollutant
+        self.method = method
+        self.bounds = [float(bound) for bound in bounds]
+        pollution_size, wind_size = sizes
+        self.grids = {
+            'pollutant': {'fields': [pollutant], 'rows': pollution_size, 'cols': pollution_size},
+            'wind': {'fields': ['velocity', 'direction'], 'rows': wind_size, 'cols': wind_size},
+        }
+        self.dtype = get_record_dtype(self.grids)
+        self.hours = 0
+        self.file = None
+
+    def get_header(self) -> Dict[str, Any]:
+        '''
+        :returns: Metadatos del archivo.
+        '''
+        return {
+            'pollutant': self.pollutant,
+            'method': self.method,
+            'bounds': self.bounds,
+            'grids': self.grids,
+        }
+
+    def __enter__(self) -> 'GridWriter':
+        header = json.dumps(self.get_header()).encode('utf-8')
+        # rellenar para que los registros empiecen alineados
+        padding = -(PREFIX.size + len(header)) % ALIGNMENT
+        header += b' ' * padding
+
+        self.file = open(self.temppath, 'wb')
+        self.file.write(PREFIX.pack(MAGIC, len(header)))
+        self.file.write(header)
+        return self
+
+    def add_hour(self, hour: Union[np.datetime64, pd.Timestamp], grids: tuple) -> None:
+        '''
+        Agrega las mallas de una hora al final del archivo.
+
+        :param grids: Mallas de `heatmap.get_hour_grids`:
+            x, y y valores del contaminante y x, y y (velocidad, dirección) del viento.
+        '''
+        xpollution, ypollution, zpollution, _, _, zwind = grids
+        record = np.zeros(1, dtype=self.dtype)
+        record['timestamp'] = pd.Timestamp(hour).value
+        record['bounds'] = (min(xpollution), min(ypollution), max(xpollution), max(ypollution))
+        record['pollutant'] = np.reshape(zpollution, self.dtype['pollutant'].shape)
+        record['wind'] = np.reshape(zwind, self.dtype['wind'].shape)
+        self.file.write(record.tobytes())
+        self.hours += 1
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.temppath, self.filepath)
+        else:
+            os.remove(self.temppath)
+
+class GridCube:
+    '''
+    Lector de un archivo de mallas. Los registros se abren con `numpy.memmap`,
+    así solo se leen del disco las horas y mallas que se usan.
+    '''
+    def __init__(self, filepath: str) -> None:
+        with open(filepath, 'rb') as file:
+            magic, length = PREFIX.unpack(file.read(PREFIX.size))
+            if magic != MAGIC:
+                raise ValueError(f'{filepath}: no es un archivo de mallas')
+            self.header = json.loads(file.read(length))
+
+        self.filepath = filepath
+        self.pollutant: str = self.header['pollutant']
+        self.method: str = self.header['method']
+        self.bounds: List[float] = self.header['bounds']
+        self.grids: Dict[str, Dict[str, Any]] = self.header['grids']
+        self.dtype = get_record_dtype(self.grids)
+
+        offset = PREFIX.size + length
+        # un último registro incompleto (archivo que se está escribiendo) no se lee
+        hours = (os.path.getsize(filepath) - offset) // self.dtype.itemsize
+        if hours > 0:
+            self.records = np.memmap(filepath, dtype=self.dtype, mode='r', offset=offset, shape=(hours,))
+        else:
+            # no se puede mapear un archivo sin registros
+            self.records = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def timestamps(self) -> pd.DatetimeIndex:
+        '''
+        Fechas de todas las horas, en orden.
+        '''
+        return pd.DatetimeIndex(np.asarray(self.records['timestamp']).astype('datetime64[ns]'))
+
+    def get_hours(self, start: Optional[str] = None, end: Optional[str] = None) -> slice:
+        '''
+        :param start: Fecha inicial, incluida, ejemplo: '2018-12-01'.
+
+        :param end: Fecha final, excluida, ejemplo: '2019-01-01'.
+
+        :returns: Índices de las horas entre `start` y `end`, para `get_grid` o `get_field`.
+        '''
+        timestamps = self.timestamps
+        first = 0 if start is None else timestamps.searchsorted(pd.Timestamp(start))
+        last = len(timestamps) if end is None else timestamps.searchsorted(pd.Timestamp(end))
+        return slice(int(first), int(last))
+
+    def get_grid(self, name: str, hours: Union[slice, int, Sequence[int]] = slice(None)) -> np.ndarray:
+        '''
+        :param name: Nombre de la malla, 'pollutant' o 'wind'.
+
+        :param hours: Índices de las horas, ver `get_hours`.
+
+        :returns: Vista de forma (horas, campos, filas, columnas),
+            sin leer las horas hasta que se usan.
+        '''
+        return self.records[name][hours]
+
+    def get_field(self, field: str, hours: Union[slice, int, Sequence[int]] = slice(None)) -> np.ndarray:
+        '''
+        :param field: Nombre del campo: el contaminante, 'velocity' o 'direction'.
+
+        :returns: Vista de forma (horas, filas, columnas) del campo.
+        '''
+        for name, grid in self.grids.items():
+            if field in grid['fields']:
+                return self.get_grid(name, hours)[..., grid['fields'].index(field), :, :]
+        raise KeyError(f'{self.filepath}: no tiene el campo {field!r}')
+
+    def get_coordinates(self, name: str, hour: int) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        :returns: Longitudes de las columnas y latitudes de las filas
+            de la malla `name` en la hora `hour`.
+        '''
+        xmin, ymin, xmax, ymax = self.records['bounds'][hour]
+        grid = self.grids[name]
+        return np.linspace(xmin, xmax, grid['cols']), np.linspace(ymin, ymax, grid['rows'])
@@ -2,11 +2,29 @@
 Funciones que leen los archivos CSV de esta carpeta (recursos).
 '''
 
+import os
+from math import copysign
+from typing import Optional, Iterable, List
+
 import pandas as pd
 
+from profiling import span
+from settings import CACHE_DIR, DEFAULT_CHUNKSIZE
+from watermark import get_appended_offset, make_watermark, read_appended, read_watermark, write_watermark
+
 ## las columnas de IDs de los CSV se leen como string
 ## porque el archivo GeoJSON así los tiene
 
+
+# claves y nombres de los municipios del AMM
+AMM_MUNICS_PATH = 'resources/AMM_MUNICS.csv'
+
+# archivo de datos de calidad del aire y su almacén particionado por mes
+AIR_QUALITY_PATH = 'resources/filled.csv'
+AIR_QUALITY_STORE = f'{CACHE_DIR}/filled'
+# formato de fecha y hora de los registros de calidad del aire
+AIR_QUALITY_STRFDT = '%d-%b-%y %H'
+
 def read_amm_municipalities() -> pd.DataFrame:
     '''
     Lee el archivo AMM_MUNICS.csv, el cual contiene
@@ -16,26 +34,409 @@ def read_amm_municipalities() -> pd.DataFrame:
         [MUNIC, NOM_MUN]
     '''
     return pd.read_csv(
-        'resources/AMM_MUNICS.csv',
+        AMM_MUNICS_PATH,
         dtype={'MUNIC': str},
         encoding='utf-8'
     )
 
-def read_entries(year: int, cie_column: str = 'DIAG_INI') -> pd.DataFrame:
+def get_entries_path(year: int) -> str:
     '''
-    Lee el archivo EGRESO_`year`.csv.
+    :returns: Ruta del archivo EGRESO_`year`.csv.
+    '''
+    return f'resources/EGRESO_{year}.csv'
+
+def get_entries_cache_path(year: int, cie_column: str = 'DIAG_INI') -> str:
+    '''
+    :returns: Ruta del caché columnar del archivo EGRESO_`year`.csv.
+    '''
+    return f'{CACHE_DIR}/EGRESO_{year}_{cie_column}.parquet'
+
+def get_entries_source(year: int, cie_column: str = 'DIAG_INI') -> str:
+    '''
+    :returns: Ruta del archivo original de egresos del año:
+        el CSV, o su caché columnar si el CSV ya no existe.
+    '''
+    csvpath = get_entries_path(year)
+    return csvpath if os.path.exists(csvpath) else get_entries_cache_path(year, cie_column)
+
+def is_entries_cache_fresh(year: int, cie_column: str = 'DIAG_INI') -> bool:
+    '''
+    Revisa si existe el caché del año y si es más reciente que su CSV.
 
     :param year: año del nombre del archivo.
 
     :param cie_column: nombre de la columna de CIE, varía por archivos.
+    '''
+    cachepath = get_entries_cache_path(year, cie_column)
+    if not os.path.exists(cachepath):
+        return False
 
-    :returns: `DataFrame` con todos los registros, en columnas:
-        [INGRE, ENTIDAD, MUNIC, `cie_column`]
+    csvpath = get_entries_path(year)
+    # si el CSV ya no existe, el caché es la única fuente
+    if not os.path.exists(csvpath):
+        return True
+    return os.path.getmtime(cachepath) >= os.path.getmtime(csvpath)
+
+def filter_entries(
+        entries: pd.DataFrame, cie_column: str = 'DIAG_INI',
+        entity: Optional[str] = None, munics: Optional[Iterable[str]] = None,
+        cie: Optional[str] = None) -> pd.DataFrame:
+    '''
+    Filtra registros de ingresos por entidad, municipios y prefijo de CIE.
+    Los filtros con valor `None` no se aplican.
+
+    :returns: `DataFrame` con los registros que cumplen todos los filtros.
+    '''
+    mask = pd.Series(True, index=entries.index)
+    if entity is not None:
+        mask &= entries['ENTIDAD'] == entity
+    if munics is not None:
+        mask &= entries['MUNIC'].isin(list(munics))
+    if cie is not None:
+        mask &= entries[cie_column].str.startswith(cie)
+    return entries[mask]
+
+def build_entries_cache(year: int, cie_column: str = 'DIAG_INI', row_group_size: int = 50_000) -> str:
+    '''
+    Convierte el archivo EGRESO_`year`.csv en un caché columnar Parquet,
+    con tipos ya convertidos y columnas codificadas por diccionario.
+
+    Los registros se ordenan por entidad, municipio y letra de CIE
+    para que las estadísticas de cada grupo de filas permitan
+    descartar grupos completos al leer con filtros.
+
+    :param year: año del nombre del archivo.
+
+    :param cie_column: nombre de la columna de CIE, varía por archivos.
+
+    :param row_group_size: número de registros por grupo de filas.
+
+    :returns: Ruta del archivo de caché creado.
     '''
     columns = ['INGRE', 'ENTIDAD', 'MUNIC', cie_column]
-    # leer todos los registros del año especificado
-    return pd.read_csv(
-        f'resources/EGRESO_{year}.csv',
+    entries = pd.read_csv(
+        get_entries_path(year),
         usecols=columns,
-        dtype={'ENTIDAD': str, 'MUNIC': str, 'INGRE': str}
+        dtype={'ENTIDAD': str, 'MUNIC': str, 'INGRE': str, cie_column: str}
     ).dropna()
+
+    entries['INGRE'] = pd.to_datetime(entries['INGRE'])
+    # columna derivada para filtrar por letra de CIE sin leer el código completo
+    entries['LETRA_CIE'] = entries[cie_column].str[0].astype('category')
+    entries = entries.sort_values(['ENTIDAD', 'MUNIC', 'LETRA_CIE'], ignore_index=True)
+
+    cachepath = get_entries_cache_path(year, cie_column)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    entries.to_parquet(
+        cachepath,
+        engine='pyarrow',
+        index=False,
+        row_group_size=row_group_size,
+        use_dictionary=True
+    )
+    return cachepath
+
+def read_entries_cache(
+        year: int, cie_column: str = 'DIAG_INI',
+        entity: Optional[str] = None, munics: Optional[Iterable[str]] = None,
+        cie: Optional[str] = None) -> pd.DataFrame:
+    '''
+    Lee el caché columnar del año, decodificando solo los grupos de filas
+    que pueden cumplir los filtros de entidad, municipios y letra de CIE.
+
+    :returns: `DataFrame` con los registros filtrados, en columnas:
+        [INGRE, ENTIDAD, MUNIC, `cie_column`]
+    '''
+    filters = []
+    if entity is not None:
+        filters.append(('ENTIDAD', '==', entity))
+    if munics is not None:
+        filters.append(('MUNIC', 'in', list(munics)))
+    # solo se puede descartar por letra, el resto del prefijo se filtra después
+    if cie is not None:
+        filters.append(('LETRA_CIE', '==', cie[0]))
+
+    entries = pd.read_parquet(
+        get_entries_cache_path(year, cie_column),
+        engine='pyarrow',
+        columns=['INGRE', 'ENTIDAD', 'MUNIC', cie_column],
+        filters=filters if filters else None
+    )
+    if cie is not None and len(cie) > 1:
+        with span('filter', source='cache') as record:
+            record['rows'] = len(entries)
+            entries = filter_entries(entries, cie_column, cie=cie)
+    return entries
+
+def stream_entries(
+        filepath: str, cie_column: str = 'DIAG_INI',
+        entity: Optional[str] = None, munics: Optional[Iterable[str]] = None,
+        cie: Optional[str] = None, chunksize: int = DEFAULT_CHUNKSIZE) -> pd.DataFrame:
+    '''
+    Lee un CSV de egresos por bloques de `chunksize` registros y aplica los filtros
+    a cada bloque, así solo se conservan en memoria los registros filtrados
+    y un bloque a la vez. Sirve también para archivos de varios años concatenados.
+
+    La memoria máxima estimada (bloque actual más registros conservados)
+    se guarda en `DataFrame.attrs['peak_memory']`, en bytes.
+
+    :param filepath: ruta del archivo CSV.
+
+    :param chunksize: número de registros por bloque.
+
+    :returns: `DataFrame` con los registros filtrados, en columnas:
+        [INGRE, ENTIDAD, MUNIC, `cie_column`]
+    '''
+    if chunksize <= 0:
+        raise ValueError(f'Registros por bloque inválidos: {chunksize!r}')
+
+    columns = ['INGRE', 'ENTIDAD', 'MUNIC', cie_column]
+    # convertir una sola vez para no hacerlo en cada bloque
+    munics = list(munics) if munics is not None else None
+
+    chunks = list()
+    # bytes de los registros conservados y máximo observado
+    kept, peak = 0, 0
+    reader = pd.read_csv(
+        filepath,
+        usecols=columns,
+        dtype={'ENTIDAD': str, 'MUNIC': str, 'INGRE': str},
+        chunksize=chunksize
+    )
+    for chunk in reader:
+        chunkbytes = chunk.memory_usage(deep=True).sum()
+        with span('filter', source='csv', rows=len(chunk)):
+            filtered = filter_entries(chunk.dropna(), cie_column, entity, munics, cie)
+            # copiar para no mantener referencia al bloque completo
+            filtered = filtered.copy()
+        chunks.append(filtered)
+
+        kept += filtered.memory_usage(deep=True).sum()
+        peak = max(peak, chunkbytes + kept)
+
+    if chunks:
+        entries = pd.concat(chunks, ignore_index=True)
+    else:
+        entries = pd.DataFrame(columns=columns)
+    # al concatenar se tienen los bloques filtrados y el resultado a la vez
+    peak = max(peak, 2 * kept)
+    entries.attrs['peak_memory'] = int(peak)
+
+    print(f'{filepath}: Memoria máxima estimada {peak / 2**20:.1f} MB', flush=True)
+    return entries
+
+def read_entries(
+        year: int, cie_column: str = 'DIAG_INI',
+        entity: Optional[str] = None, munics: Optional[Iterable[str]] = None,
+        cie: Optional[str] = None, chunksize: int = DEFAULT_CHUNKSIZE) -> pd.DataFrame:
+    '''
+    Lee el archivo EGRESO_`year`.csv.
+    Si existe un caché columnar actualizado del año, lo usa en su lugar;
+    si no, lee el CSV por bloques filtrando cada uno.
+
+    :param year: año del nombre del archivo.
+
+    :param cie_column: nombre de la columna de CIE, varía por archivos.
+
+    :param entity: clave de entidad para filtrar, ejemplo: '19' (Nuevo León).
+
+    :param munics: claves de municipios para filtrar.
+
+    :param cie: prefijo de CIE para filtrar, ejemplo: 'O'.
+
+    :param chunksize: número de registros por bloque al leer el CSV.
+
+    :returns: `DataFrame` con los registros filtrados, en columnas:
+        [INGRE, ENTIDAD, MUNIC, `cie_column`]
+    '''
+    cached = is_entries_cache_fresh(year, cie_column)
+    with span('read', year=year, source='cache' if cached else 'csv') as record:
+        if cached:
+            entries = read_entries_cache(year, cie_column, entity, munics, cie)
+        else:
+            entries = stream_entries(
+                get_entries_path(year), cie_column,
+                entity, munics, cie, chunksize
+            )
+        record['rows'] = len(entries)
+    return entries
+
+def read_stations() -> pd.DataFrame:
+    '''
+    Lee el archivo estaciones.dat y convierte las coordenadas
+    de grados, minutos y segundos (GMS) a grados decimales.
+
+    :returns: `DataFrame` con las estaciones en columnas:
+        [station, lat, lon]
+    '''
+    coords = pd.read_csv('resources/estaciones.dat')
+    # iterar sobre índice y datos de cada fila
+    for i, r in coords.iterrows():
+        # signo de latitud: + Norte, - Sur
+        sign = copysign(1, r.iloc[0])
+        # calcular coordenadas decimales a partir de GMS
+        coords.loc[i, 'lat'] = sign * (abs(r.iloc[0]) + r.iloc[1] / 60 + r.iloc[2] / 3600)
+
+        # signo de longitud: + Este, - Oeste
+        sign = copysign(1, r.iloc[3])
+        # calcular coordenadas decimales a partir de GMS
+        coords.loc[i, 'lon'] = sign * (abs(r.iloc[3]) + r.iloc[4] / 60 + r.iloc[5] / 3600)
+
+    # eliminar columnas GMS y abreviatura
+    return coords[['station', 'lat', 'lon']]
+
+def get_air_quality_index_path() -> str:
+    '''
+    :returns: Ruta del índice del almacén de calidad del aire.
+    '''
+    return f'{AIR_QUALITY_STORE}/index.csv'
+
+def get_air_quality_watermark_path() -> str:
+    '''
+    :returns: Ruta de la marca de agua de filled.csv en el almacén, ver `update_air_quality_store`.
+    '''
+    return f'{AIR_QUALITY_STORE}/watermark.json'
+
+def is_air_quality_store_fresh() -> bool:
+    '''
+    Revisa si existe el almacén de calidad del aire y si es más reciente que filled.csv.
+    '''
+    indexpath = get_air_quality_index_path()
+    if not os.path.exists(indexpath):
+        return False
+    if not os.path.exists(AIR_QUALITY_PATH):
+        return True
+    return os.path.getmtime(indexpath) >= os.path.getmtime(AIR_QUALITY_PATH)
+
+def build_air_quality_store(row_group_size: int = 24 * 13) -> str:
+    '''
+    Convierte filled.csv en un almacén Parquet con una partición por mes,
+    con las fechas ya convertidas y registros ordenados por fecha,
+    más un índice con el rango de fechas de cada partición.
+
+    :param row_group_size: número de registros por grupo de filas,
+        por defecto un día de las 13 estaciones.
+
+    :returns: Ruta del índice creado.
+    '''
+    # marcar antes de leer: si se agregan registros durante la lectura,
+    # la próxima actualización los vuelve a leer y reemplaza los repetidos
+    mark = make_watermark(AIR_QUALITY_PATH)
+    dataframe = pd.read_csv(AIR_QUALITY_PATH)
+    dataframe['timestamp'] = pd.to_datetime(dataframe['timestamp'], format=AIR_QUALITY_STRFDT)
+    dataframe['station'] = dataframe['station'].astype('category')
+    dataframe = dataframe.sort_values(['timestamp', 'station'], ignore_index=True)
+
+    os.makedirs(AIR_QUALITY_STORE, exist_ok=True)
+    index = list()
+    for month, partition in dataframe.groupby(dataframe['timestamp'].dt.strftime('%Y-%m')):
+        filename = f'{month}.parquet'
+        partition.to_parquet(
+            f'{AIR_QUALITY_STORE}/{filename}',
+            engine='pyarrow',
+            index=False,
+            row_group_size=row_group_size
+        )
+        index.append({
+            'file': filename,
+            'start': partition['timestamp'].iloc[0],
+            'end': partition['timestamp'].iloc[-1],
+            'rows': len(partition)
+        })
+
+    # el índice se escribe al final, así un almacén a medias no se considera válido
+    indexpath = get_air_quality_index_path()
+    pd.DataFrame(index).to_csv(indexpath, index=False)
+    write_watermark(get_air_quality_watermark_path(), mark)
+    return indexpath
+
+def update_air_quality_store(row_group_size: int = 24 * 13) -> str:
+    '''
+    Agrega al almacén solo los registros que se agregaron al final de filled.csv
+    desde la última vez que se creó o actualizó, reescribiendo únicamente
+    las particiones de los meses de esos registros.
+    Un registro con la misma fecha y estación que uno del almacén lo reemplaza.
+
+    Si el almacén no existe o filled.csv cambió en otra parte
+    (no solo creció), se crea de nuevo con `build_air_quality_store`.
+
+    :param row_group_size: número de registros por grupo de filas.
+
+    :returns: Ruta del índice.
+    '''
+    indexpath = get_air_quality_index_path()
+    markpath = get_air_quality_watermark_path()
+    offset = None
+    if os.path.exists(indexpath):
+        offset = get_appended_offset(AIR_QUALITY_PATH, read_watermark(markpath))
+    if offset is None:
+        print(f'{AIR_QUALITY_PATH}: Creando almacén particionado...', flush=True)
+        return build_air_quality_store(row_group_size)
+
+    with span('read', source='appended') as record:
+        appended, end = read_appended(AIR_QUALITY_PATH, offset)
+        record['rows'] = len(appended)
+    print(f'{AIR_QUALITY_PATH}: {len(appended)} registros nuevos', flush=True)
+
+    index = pd.read_csv(indexpath, parse_dates=['start', 'end']).set_index('file')
+    if not appended.empty:
+        appended['timestamp'] = pd.to_datetime(appended['timestamp'], format=AIR_QUALITY_STRFDT)
+        for month, rows in appended.groupby(appended['timestamp'].dt.strftime('%Y-%m')):
+            filename = f'{month}.parquet'
+            filepath = f'{AIR_QUALITY_STORE}/{filename}'
+            if os.path.exists(filepath):
+                rows = pd.concat([pd.read_parquet(filepath, engine='pyarrow'), rows], ignore_index=True)
+            partition = (rows
+                .astype({'station': str})
+                .drop_duplicates(['timestamp', 'station'], keep='last')
+                .astype({'station': 'category'})
+                .sort_values(['timestamp', 'station'], ignore_index=True))
+            partition.to_parquet(filepath, engine='pyarrow', index=False, row_group_size=row_group_size)
+            index.loc[filename] = [partition['timestamp'].iloc[0], partition['timestamp'].iloc[-1], len(partition)]
+
+    # reescribir el índice aunque no haya registros nuevos, así el almacén queda más reciente que el CSV
+    index.sort_index().reset_index().to_csv(indexpath, index=False)
+    write_watermark(markpath, make_watermark(AIR_QUALITY_PATH, end))
+    return indexpath
+
+def read_air_quality(start: pd.Timestamp, end: pd.Timestamp, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    '''
+    Lee los registros de calidad del aire con fecha en [`start`, `end`).
+    Si existe el almacén actualizado, solo lee las particiones del rango
+    (con memoria mapeada); si no, lee filled.csv completo.
+
+    :param start: Fecha y hora inicial, incluida.
+
+    :param end: Fecha y hora final, excluida.
+
+    :param columns: Columnas a leer, además de `timestamp`. Por defecto todas.
+
+    :returns: `DataFrame` con `timestamp` de tipo datetime, ordenado por fecha.
+    '''
+    if columns is not None:
+        columns = ['timestamp'] + [column for column in columns if column != 'timestamp']
+
+    if not is_air_quality_store_fresh():
+        dataframe = pd.read_csv(AIR_QUALITY_PATH, usecols=columns)
+        dataframe['timestamp'] = pd.to_datetime(dataframe['timestamp'], format=AIR_QUALITY_STRFDT)
+        selected = dataframe[(dataframe['timestamp'] >= start) & (dataframe['timestamp'] < end)]
+        return selected.sort_values('timestamp', kind='stable', ignore_index=True)
+
+    index = pd.read_csv(get_air_quality_index_path(), parse_dates=['start', 'end'])
+    # particiones cuyo rango se traslapa con el pedido
+    files = index.loc[(index['start'] < end) & (index['end'] >= start), 'file']
+
+    partitions = [
+        pd.read_parquet(
+            f'{AIR_QUALITY_STORE}/{filename}',
+            engine='pyarrow',
+            columns=columns,
+            filters=[('timestamp', '>=', start), ('timestamp', '<', end)],
+            memory_map=True
+        )
+        for filename in files
+    ]
+    if not partitions:
+        empty = pd.DataFrame(columns=columns if columns else ['timestamp'])
+        return empty.astype({'timestamp': 'datetime64[ns]'})
+    return pd.concat(partitions, ignore_index=True)
@@ -0,0 +1,225 @@
+'''
+Caché en disco de resultados intermedios: conteos de ingresos del AMM
+y mallas interpoladas por kriging de cada hora.
+
+Cada resultado se guarda con una llave que resume sus entradas:
+la huella de los archivos que se leyeron (o los datos mismos)
+y los parámetros del cálculo. Si una entrada cambia, cambia la llave
+y el resultado anterior simplemente deja de usarse, así que no hace falta
+invalidar nada para que los resultados sean correctos.
+
+El tamaño de la carpeta se limita borrando los resultados usados
+hace más tiempo (LRU), ver `evict`; la CLI lo aplica al terminar cada mapa.
+`clear` borra todos.
+'''
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from profiling import span
+from settings import RESULTS_DIR, RESULTS_MAX_BYTES
+
+# cambiar si cambia el formato o el cálculo de algún resultado guardado
+FORMAT_VERSION = 4
+# bytes del inicio y del final de cada archivo que se incluyen en su huella
+SAMPLE_BYTES = 2**20
+
+# variable de entorno para que los procesos hijos tampoco lean resultados guardados
+RECOMPUTE_ENV = 'GEOREF_RECOMPUTE'
+
+# si es `False` no se leen resultados guardados, pero sí se guardan los nuevos
+use_saved = os.environ.get(RECOMPUTE_ENV) != '1'
+
+def set_use_saved(value: bool) -> None:
+    '''
+    Define si se leen los resultados guardados, en este proceso
+    y en los que cree después (por ejemplo, un `ProcessPoolExecutor`).
+    '''
+    global use_saved
+    use_saved = value
+    os.environ[RECOMPUTE_ENV] = '0' if value else '1'
+
+def fingerprint_file(filepath: str) -> str:
+    '''
+    Huella de un archivo: tamaño, fecha de modificación y el contenido
+    de su primer y último MB. No lee el archivo completo,
+    que para los CSV de egresos tardaría casi lo mismo que procesarlo.
+    '''
+    stat = os.stat(filepath)
+    digest = hashlib.sha256(f'{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    with open(filepath, 'rb') as file:
+        digest.update(file.read(SAMPLE_BYTES))
+        if stat.st_size > SAMPLE_BYTES:
+            file.seek(max(SAMPLE_BYTES, stat.st_size - SAMPLE_BYTES))
+            digest.update(file.read())
+    return digest.hexdigest()
+
+def fingerprint_bytes(*buffers: bytes) -> str:
+    '''
+    Huella del contenido de `buffers`, por ejemplo `numpy.ndarray.tobytes()`.
+    '''
+    digest = hashlib.sha256()
+    for buffer in buffers:
+        digest.update(buffer)
+    return digest.hexdigest()
+
+def make_key(namespace: str, files: Iterable[str] = (), **params: Any) -> str:
+    '''
+    Crea la llave de un resultado.
+
+    :param namespace: Tipo de resultado, ejemplo: 'amm_entries'.
+
+    :param files: Archivos de entrada, se usa su huella.
+
+    :param params: Parámetros del cálculo, deben poder convertirse a JSON.
+
+    :returns: Llave hexadecimal.
+    '''
+    content = {
+        'version': FORMAT_VERSION,
+        'namespace': namespace,
+        'files': [fingerprint_file(filepath) for filepath in files],
+        'params': params,
+    }
+    encoded = json.dumps(content, sort_keys=True, default=str).encode()
+    return f'{namespace}-{hashlib.sha256(encoded).hexdigest()}'
+
+def get_path(key: str) -> str:
+    '''
+    :returns: Ruta del archivo del resultado `key`.
+    '''
+    return os.path.join(RESULTS_DIR, f'{key}.pickle')
+
+def load(key: str) -> Optional[Any]:
+    '''
+    Lee el resultado `key` y lo marca como usado recientemente.
+
+    :returns: El resultado, o `None` si no existe, no se pudo leer
+        o `use_saved` es `False`.
+    '''
+    if not use_saved:
+        return None
+    filepath = get_path(key)
+    try:
+        with open(filepath, 'rb') as file:
+            value = pickle.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # guardado por otra versión de las librerías, o incompleto
+        remove(filepath)
+        return None
+    # la fecha de modificación es la del último uso, para `evict`
+    try:
+        os.utime(filepath)
+    except OSError:
+        pass
+    return value
+
+def exists(key: str) -> bool:
+    '''
+    :returns: Si `load(key)` leería un resultado guardado, sin leerlo.
+    '''
+    return use_saved and os.path.exists(get_path(key))
+
+def store(key: str, value: Any) -> None:
+    '''
+    Guarda el resultado `key`. Se escribe a un archivo temporal y luego
+    se renombra, así otros procesos nunca leen un resultado a medias.
+    '''
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    filepath = get_path(key)
+    # un temporal por proceso e hilo, los hilos del servidor pueden guardar la misma llave
+    temppath = f'{filepath}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temppath, 'wb') as file:
+        pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temppath, filepath)
+
+def cached(key: str, compute: Callable[[], Any]) -> Any:
+    '''
+    :returns: El resultado guardado con llave `key`,
+        o el de `compute()` si no existe, guardándolo.
+    '''
+    with span('results', namespace=key.rsplit('-', 1)[0]) as record:
+        value = load(key)
+        record['hit'] = value is not None
+        if value is None:
+            value = compute()
+            store(key, value)
+    return value
+
+def remove(filepath: str) -> None:
+    '''
+    Borra un archivo, aunque otro proceso ya lo haya borrado.
+    '''
+    try:
+        os.remove(filepath)
+    except FileNotFoundError:
+        pass
+
+def list_results() -> List[Tuple[str, int, float]]:
+    '''
+    :returns: Ruta, tamaño en bytes y fecha de último uso de cada resultado,
+        del usado hace más tiempo al más reciente.
+    '''
+    if not os.path.isdir(RESULTS_DIR):
+        return list()
+    entries = list()
+    for entry in os.scandir(RESULTS_DIR):
+        if not entry.name.endswith('.pickle'):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((entry.path, stat.st_size, stat.st_mtime))
+    return sorted(entries, key=lambda entry: entry[2])
+
+def get_usage() -> Dict[str, Dict[str, int]]:
+    '''
+    :returns: Número de resultados y bytes por tipo de resultado.
+    '''
+    usage: Dict[str, Dict[str, int]] = dict()
+    for filepath, size, _ in list_results():
+        namespace = os.path.basename(filepath).rsplit('-', 1)[0]
+        total = usage.setdefault(namespace, {'count': 0, 'bytes': 0})
+        total['count'] += 1
+        total['bytes'] += size
+    return usage
+
+def evict(max_bytes: int = RESULTS_MAX_BYTES) -> int:
+    '''
+    Borra los resultados usados hace más tiempo hasta que la carpeta
+    ocupe a lo más `max_bytes`. También borra temporales abandonados.
+
+    :returns: Número de resultados borrados.
+    '''
+    if os.path.isdir(RESULTS_DIR):
+        # temporales de procesos que terminaron con error hace más de una hora
+        for entry in os.scandir(RESULTS_DIR):
+            if entry.name.endswith('.tmp') and entry.stat().st_mtime < time.time() - 3600:
+                remove(entry.path)
+
+    entries = list_results()
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for filepath, size, _ in entries:
+        if total <= max_bytes:
+            break
+        remove(filepath)
+        total -= size
+        removed += 1
+    return removed
+
+def clear() -> int:
+    '''
+    Borra todos los resultados guardados.
+
+    :returns: Número de resultados borrados.
+    '''
+    return evict(0)
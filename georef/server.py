@@ -0,0 +1,350 @@
+'''
+Servidor HTTP local que genera los mapas bajo pedido, por ejemplo para un tablero.
+
+Cada ejecución de la CLI importa las librerías y vuelve a leer municipios,
+GeoJSON, estaciones y conteos de ingresos antes de calcular el mapa.
+El servidor los conserva en memoria entre peticiones, junto con un grupo
+de procesos para el kriging, cuyos procesos a su vez conservan sus motores
+de kriging (ver `kriging.get_engine`). Así cada petición solo cuesta
+el cálculo de su mapa.
+
+Rutas (todas con GET):
+
+- `/choropleth?year=2018&cie=J` mapa coroplético, parámetro opcional `detail`.
+- `/heatmap?pollutant=PM10&date=15-Dec-18` mapa de calor, parámetros opcionales
+  `end` (fecha final incluida, a lo más `MAX_DAYS` días), `stride`
+  y `method` (`kriging`, `idw` o `nearest`, ver `interpolation`).
+- `/plotly.min.js` la librería que cargan los mapas en HTML.
+
+Parámetros comunes: `format=html|json`, `precision=N` y `binary=1`,
+igual que en la CLI. Con `format=json` se regresa solo la figura
+(llaves 'data', 'layout' y 'frames'), para dibujarla con `Plotly.newPlot`.
+Los errores se regresan como JSON con llave 'error'.
+
+Ejemplo: `georef serve -t token.txt` y abrir
+http://127.0.0.1:8000/choropleth?year=2018&cie=J
+'''
+
+import json
+import os
+import shutil
+import string
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import Executor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+from plotly.offline import get_plotlyjs
+
+from choropleth import update_amm_entries, render_entries_choropleth, EntriesCube
+from filter_geojson import read_amm_geojson, DETAIL_LEVELS
+from heatmap import read_day, build_frames, write_heatmap, create_executor, DATE_FORMAT
+from output import OutputOptions, FORMATS
+from readers import (
+    read_stations, get_entries_path, get_entries_source,
+    get_air_quality_index_path, is_air_quality_store_fresh, update_air_quality_store
+)
+from settings import INTERPOLATION_METHODS
+import results
+
+# contaminantes que se pueden graficar, igual que en la CLI
+POLLUTANTS = 'CO,NO,NO2,NOX,O3,PM10,PM2_5'.split(',')
+# días máximos de un mapa de calor, todos sus registros se leen a la vez
+MAX_DAYS = 31
+# ruta de plotly.js, los mapas en HTML la cargan del mismo servidor
+PLOTLYJS_ROUTE = '/plotly.min.js'
+
+CONTENT_TYPES = {
+    'html': 'text/html; charset=utf-8',
+    'json': 'application/json',
+}
+
+class RequestError(Exception):
+    '''
+    Error de una petición, se responde con `status` y el mensaje.
+    '''
+    def __init__(self, status: HTTPStatus, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+class MapServer(ThreadingHTTPServer):
+    '''
+    Servidor de mapas que conserva en memoria los datos compartidos entre peticiones.
+    Cada petición se atiende en su propio hilo.
+    '''
+    daemon_threads = True
+
+    def __init__(
+            self, address: Tuple[str, int], tokenfile: Optional[str] = None,
+            workers: Optional[int] = None) -> None:
+        '''
+        :param address: Host y puerto.
+
+        :param tokenfile: Archivo con token de Mapbox, sin él no se atienden mapas de calor.
+
+        :param workers: Procesos para el kriging, compartidos por todas las peticiones.
+            Por defecto el número de núcleos, con 1 se calcula en el hilo de cada petición.
+        '''
+        super().__init__(address, RequestHandler)
+        self.tokenfile = tokenfile
+
+        # datos que no cambian entre peticiones
+        self.stations = read_stations()
+        for detail in DETAIL_LEVELS:
+            read_amm_geojson(detail)
+        self.plotlyjs = get_plotlyjs().encode('utf-8')
+
+        self.executor: Optional[Executor] = create_executor(workers)
+        # conteos de ingresos de todas las letras de CIE por año,
+        # con el archivo y su fecha de modificación al calcularlos
+        self.entries: Dict[int, Tuple[Tuple[str, int], EntriesCube]] = dict()
+        self.entries_lock = threading.Lock()
+        self.store_lock = threading.Lock()
+        # los mapas se escriben aquí y se borran al responderlos
+        self.tempdir = tempfile.mkdtemp(prefix='georef-serve-')
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self.executor is not None:
+            self.executor.shutdown()
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def get_year_entries(self, year: int) -> EntriesCube:
+        '''
+        :returns: Cubo de conteos de ingresos del AMM de todas las letras de CIE de `year`,
+            calculados solo en la primera petición del año o si su archivo cambió;
+            si solo se le agregaron registros, solo se cuentan esos (ver `update_amm_entries`).
+        '''
+        source = get_entries_source(year)
+        if not os.path.exists(source):
+            raise RequestError(HTTPStatus.NOT_FOUND, f'No existe {get_entries_path(year)}')
+        version = (source, os.stat(source).st_mtime_ns)
+
+        # un solo cálculo a la vez, así dos peticiones del mismo año no lo repiten
+        with self.entries_lock:
+            cached = self.entries.get(year)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            entries = update_amm_entries(year)
+            self.entries[year] = (version, entries)
+        return entries
+
+    def get_temp_path(self, options: OutputOptions) -> str:
+        '''
+        :returns: Ruta única en la carpeta temporal para escribir un mapa.
+        '''
+        return os.path.join(self.tempdir, f'{uuid.uuid4().hex}.{options.format}')
+
+    def render_choropleth(self, year: int, cie: str, detail: str, options: OutputOptions) -> bytes:
+        '''
+        :returns: Contenido del mapa coroplético.
+        '''
+        cube = self.get_year_entries(year).select(cie)
+        if not cube.counts.any():
+            raise RequestError(HTTPStatus.NOT_FOUND, f'Sin ingresos de CIE {cie} en {year}')
+
+        filepath = self.get_temp_path(options)
+        render_entries_choropleth(cube, year, cie, filepath, detail, options)
+        return read_and_remove(filepath)
+
+    def render_heatmap(
+            self, pollutant: str, day: pd.Timestamp, days: int, stride: int,
+            options: OutputOptions, method: str = 'kriging') -> bytes:
+        '''
+        :returns: Contenido del mapa de calor de `days` días desde `day`.
+        '''
+        if self.tokenfile is None:
+            raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE, 'El servidor se inició sin token de Mapbox')
+
+        # registros nuevos de filled.csv, solo si ya existe el almacén
+        with self.store_lock:
+            if os.path.exists(get_air_quality_index_path()) and not is_air_quality_store_fresh():
+                update_air_quality_store()
+
+        dataset = read_day(pollutant, day, self.stations, stride, days)
+        if dataset.empty:
+            raise RequestError(HTTPStatus.NOT_FOUND, f'Sin registros de {pollutant} desde {day:%d-%b-%y}')
+
+        frames = build_frames(
+            dataset, pollutant,
+            (dataset[pollutant].min(), dataset[pollutant].max()),
+            (dataset['velocity'].min(), dataset['velocity'].max()),
+            # los métodos aproximados cuestan menos que enviar cada hora a otro proceso
+            self.executor if method == 'kriging' else None,
+            method
+        )
+        filepath = self.get_temp_path(options)
+        write_heatmap(frames, self.tokenfile, filepath, options)
+        return read_and_remove(filepath)
+
+def read_and_remove(filepath: str) -> bytes:
+    '''
+    :returns: Contenido del archivo, que se borra después de leerlo.
+    '''
+    try:
+        with open(filepath, 'rb') as file:
+            return file.read()
+    finally:
+        results.remove(filepath)
+
+def get_param(query: Dict[str, list], name: str, default: Optional[str] = None) -> str:
+    '''
+    :returns: Último valor del parámetro `name` de la petición.
+    '''
+    values = query.get(name)
+    if not values:
+        if default is None:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f'Falta el parámetro {name!r}')
+        return default
+    return values[-1]
+
+def get_int_param(query: Dict[str, list], name: str, default: Optional[int] = None) -> int:
+    '''
+    :returns: Valor entero del parámetro `name`, o `default` si no se especificó.
+    '''
+    value = get_param(query, name, None if default is None else str(default))
+    try:
+        return int(value)
+    except ValueError:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f'{name!r} debe ser entero: {value!r}')
+
+def get_date_param(query: Dict[str, list], name: str) -> pd.Timestamp:
+    '''
+    :returns: Fecha del parámetro `name`, con formato `'d-b-y'`.
+    '''
+    value = get_param(query, name)
+    try:
+        return pd.to_datetime(value, format=DATE_FORMAT)
+    except ValueError:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f'Fecha inválida: {value!r}, ejemplo: 1-Dec-18')
+
+def get_output_options(query: Dict[str, list]) -> OutputOptions:
+    '''
+    :returns: Opciones de salida de los parámetros comunes.
+        Los mapas no se abren en el navegador del servidor.
+    '''
+    output_format = get_param(query, 'format', 'html')
+    if output_format not in FORMATS:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f'Formato inválido: {output_format!r}')
+    return OutputOptions(
+        precision=get_int_param(query, 'precision') if 'precision' in query else None,
+        binary=get_param(query, 'binary', '0').lower() in ('1', 'true', 'yes'),
+        plotlyjs=PLOTLYJS_ROUTE,
+        format=output_format,
+        auto_open=False
+    )
+
+class RequestHandler(BaseHTTPRequestHandler):
+    '''
+    Atiende las peticiones de `MapServer`.
+    '''
+    server: MapServer
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == PLOTLYJS_ROUTE:
+            self.send_content(self.server.plotlyjs, 'application/javascript', cache=True)
+            return
+
+        start = time.perf_counter()
+        try:
+            if url.path == '/choropleth':
+                body, output_format = self.get_choropleth(query)
+            elif url.path == '/heatmap':
+                body, output_format = self.get_heatmap(query)
+            elif url.path == '/':
+                routes = {'routes': ['/choropleth', '/heatmap', PLOTLYJS_ROUTE]}
+                body, output_format = json.dumps(routes).encode(), 'json'
+            else:
+                raise RequestError(HTTPStatus.NOT_FOUND, f'Ruta desconocida: {url.path}')
+        except RequestError as error:
+            self.send_error_json(error.status, str(error))
+            return
+        except Exception as error:
+            traceback.print_exc()
+            self.send_error_json(HTTPStatus.INTERNAL_SERVER_ERROR, f'{type(error).__name__}: {error}')
+            return
+        finally:
+            # mantener el límite de tamaño de los resultados guardados
+            results.evict()
+
+        elapsed = (time.perf_counter() - start) * 1000
+        self.send_content(body, CONTENT_TYPES[output_format], timing=elapsed)
+
+    def get_choropleth(self, query: Dict[str, list]) -> Tuple[bytes, str]:
+        year = get_int_param(query, 'year')
+        cie = get_param(query, 'cie').upper()
+        if len(cie) != 1 or cie not in string.ascii_uppercase:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f'Letra de CIE inválida: {cie!r}')
+        detail = get_param(query, 'detail', 'full')
+        if detail not in DETAIL_LEVELS:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f'Nivel de detalle inválido: {detail!r}')
+        options = get_output_options(query)
+        return self.server.render_choropleth(year, cie, detail, options), options.format
+
+    def get_heatmap(self, query: Dict[str, list]) -> Tuple[bytes, str]:
+        pollutant = get_param(query, 'pollutant')
+        if pollutant not in POLLUTANTS:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f'Contaminante inválido: {pollutant!r}')
+        day = get_date_param(query, 'date')
+        end = get_date_param(query, 'end') if 'end' in query else day
+        days = (end - day).days + 1
+        if not 1 <= days <= MAX_DAYS:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"'end' debe estar entre 'date' y {MAX_DAYS} días después")
+        stride = get_int_param(query, 'stride', 1)
+        if stride < 1:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "'stride' debe ser mayor que 0")
+        method = get_param(query, 'method', 'kriging')
+        if method not in INTERPOLATION_METHODS:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f'Método de interpolación inválido: {method!r}')
+        options = get_output_options(query)
+        return self.server.render_heatmap(pollutant, day, days, stride, options, method), options.format
+
+    def send_content(
+            self, body: bytes, content_type: str, status: HTTPStatus = HTTPStatus.OK,
+            cache: bool = False, timing: Optional[float] = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if cache:
+            self.send_header('Cache-Control', 'public, max-age=86400')
+        if timing is not None:
+            # tiempo de cálculo del mapa, visible en las herramientas del navegador
+            self.send_header('Server-Timing', f'render;dur={timing:.1f}')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status: HTTPStatus, message: str) -> None:
+        body = json.dumps({'error': message}).encode()
+        self.send_content(body, CONTENT_TYPES['json'], status)
+
+def serve(host: str = '127.0.0.1', port: int = 8000, tokenfile: Optional[str] = None, workers: Optional[int] = None) -> None:
+    '''
+    Inicia el servidor de mapas hasta que se interrumpa con Ctrl+C.
+    Debe ejecutarse en el directorio que contiene la carpeta 'resources'.
+
+    :param host: Dirección en la que escucha, por defecto solo la máquina local.
+
+    :param port: Puerto.
+
+    :param tokenfile: Archivo con token de Mapbox, necesario para los mapas de calor.
+
+    :param workers: Procesos para el kriging.
+    '''
+    print('Cargando datos...', flush=True)
+    server = MapServer((host, port), tokenfile, workers)
+    print(f'Sirviendo mapas en http://{host}:{port}/ (Ctrl+C para terminar)', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
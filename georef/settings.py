@@ -0,0 +1,17 @@
+'''
+Valores por defecto compartidos por los módulos y la CLI.
+
+Este módulo no importa dependencias externas, así la CLI puede leerlos
+para sus argumentos sin cargar pandas, plotly ni pykrige.
+'''
+
+# carpeta para los archivos de caché (Parquet y resultados)
+CACHE_DIR = 'resources/cache'
+# registros por bloque al leer un CSV por partes
+DEFAULT_CHUNKSIZE = 200_000
+# carpeta de resultados intermedios guardados y su tamaño máximo
+RESULTS_DIR = f'{CACHE_DIR}/results'
+RESULTS_MAX_BYTES = 512 * 2**20
+# métodos de interpolación de los mapas de calor, ver `interpolation.get_engine`:
+# kriging ordinario (exacto) y distancia inversa o vecino más cercano (vistas previas)
+INTERPOLATION_METHODS = ('kriging', 'idw', 'nearest')
@@ -0,0 +1,189 @@
+'''
+Simplificación de geometrías GeoJSON que conserva la topología.
+
+Los polígonos de municipios vecinos comparten sus fronteras,
+si cada polígono se simplificara por separado aparecerían huecos
+y traslapes entre ellos. Por eso, como en TopoJSON, cada anillo se divide
+en arcos entre puntos de unión (donde se juntan tres o más fronteras)
+y cada arco se simplifica una sola vez con Douglas-Peucker,
+de modo que ambos lados de una frontera quedan idénticos.
+'''
+
+import copy
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+Point = Tuple[float, float]
+
+def quantize_ring(ring: List[List[float]], precision: int) -> List[Point]:
+    '''
+    Redondea las coordenadas de un anillo a `precision` decimales
+    y elimina los puntos consecutivos repetidos.
+    '''
+    points = list()
+    for x, y, *_ in ring:
+        point = (round(x, precision), round(y, precision))
+        if not points or points[-1] != point:
+            points.append(point)
+    return points
+
+def segment_distance(point: Point, start: Point, end: Point) -> float:
+    '''
+    Distancia euclidiana de `point` al segmento de `start` a `end`.
+    '''
+    px, py = point
+    sx, sy = start
+    ex, ey = end
+    dx, dy = ex - sx, ey - sy
+    length = dx * dx + dy * dy
+    if length == 0:
+        return ((px - sx) ** 2 + (py - sy) ** 2) ** 0.5
+
+    # proyección del punto sobre el segmento, limitada a sus extremos
+    t = max(0, min(1, ((px - sx) * dx + (py - sy) * dy) / length))
+    cx, cy = sx + t * dx, sy + t * dy
+    return ((px - cx) ** 2 + (py - cy) ** 2) ** 0.5
+
+def douglas_peucker(points: List[Point], tolerance: float) -> List[Point]:
+    '''
+    Simplifica una línea con el algoritmo de Douglas-Peucker,
+    conservando siempre el primer y último punto.
+    '''
+    if len(points) < 3:
+        return list(points)
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    # pila de tramos pendientes, en lugar de recursión
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        maxdist, index = 0, 0
+        for i in range(first + 1, last):
+            dist = segment_distance(points[i], points[first], points[last])
+            if dist > maxdist:
+                maxdist, index = dist, i
+        if maxdist > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+def find_junctions(rings: List[List[Point]]) -> Set[Point]:
+    '''
+    Encuentra los puntos donde se juntan tres o más fronteras,
+    es decir, los que tienen más de dos vecinos distintos.
+    '''
+    neighbors: Dict[Point, Set[Point]] = defaultdict(set)
+    for ring in rings:
+        # los anillos están cerrados, el último punto repite el primero
+        for i in range(len(ring) - 1):
+            neighbors[ring[i]].add(ring[i + 1])
+            neighbors[ring[i + 1]].add(ring[i])
+    return {point for point, adjacent in neighbors.items() if len(adjacent) > 2}
+
+def simplify_arc(arc: List[Point], tolerance: float, cache: Dict[Tuple[Point, ...], List[Point]]) -> List[Point]:
+    '''
+    Simplifica un arco una sola vez aunque aparezca en dos anillos,
+    recorriéndolo siempre en el mismo sentido para que ambos lados coincidan.
+    Un arco cerrado debe empezar en su punto menor, ver `simplify_ring`.
+    '''
+    reverse = arc[-1] < arc[0] or (arc[-1] == arc[0] and arc[-2] < arc[1])
+    key = tuple(reversed(arc)) if reverse else tuple(arc)
+    if key not in cache:
+        cache[key] = douglas_peucker(list(key), tolerance)
+    simplified = cache[key]
+    return simplified[::-1] if reverse else list(simplified)
+
+def simplify_ring(ring: List[Point], junctions: Set[Point], tolerance: float, cache: Dict[Tuple[Point, ...], List[Point]]) -> List[Point]:
+    '''
+    Divide un anillo cerrado en arcos entre uniones y simplifica cada arco.
+    '''
+    # quitar el punto de cierre para poder rotar el anillo
+    points = ring[:-1]
+    starts = [i for i, point in enumerate(points) if point in junctions]
+    if starts:
+        # empezar en una unión para que ningún arco la cruce
+        points = points[starts[0]:] + points[:starts[0]]
+        starts = [i - starts[0] for i in starts]
+    else:
+        # anillo sin uniones, ejemplo: un enclave y el hueco que deja en su vecino;
+        # empezar en su punto menor para que ambos lo recorran igual
+        # y se simplifique una sola vez
+        smallest = points.index(min(points))
+        points = points[smallest:] + points[:smallest]
+        starts = [0]
+
+    simplified = list()
+    bounds = starts + [len(points)]
+    closed = points + [points[0]]
+    for first, last in zip(bounds, bounds[1:]):
+        arc = closed[first:last + 1]
+        simplified.extend(simplify_arc(arc, tolerance, cache)[:-1])
+    simplified.append(simplified[0])
+
+    # un anillo válido necesita al menos 4 puntos
+    return simplified if len(simplified) >= 4 else ring
+
+def simplify_geojson(geojson: dict, tolerance: float, precision: int = 5) -> dict:
+    '''
+    Simplifica los polígonos de una colección de features GeoJSON,
+    conservando las fronteras compartidas entre ellos.
+
+    :param geojson: Diccionario GeoJSON con polígonos o multipolígonos.
+
+    :param tolerance: Distancia máxima (en grados) que se permite
+        desviar un arco simplificado del original.
+
+    :param precision: Decimales con los que se redondean las coordenadas.
+
+    :returns: Copia de `geojson` con geometrías simplificadas.
+    '''
+    simplified = copy.deepcopy(geojson)
+
+    # lista de polígonos (listas de anillos) de cada feature
+    polygons = list()
+    for feature in simplified['features']:
+        geometry = feature['geometry']
+        if geometry['type'] == 'Polygon':
+            polygons.append([geometry['coordinates']])
+        else:
+            polygons.append(geometry['coordinates'])
+
+    # redondear antes de buscar uniones, así los puntos compartidos coinciden
+    quantized = [
+        [[quantize_ring(ring, precision) for ring in polygon] for polygon in feature_polygons]
+        for feature_polygons in polygons
+    ]
+    junctions = find_junctions([
+        ring
+        for feature_polygons in quantized
+        for polygon in feature_polygons
+        for ring in polygon
+    ])
+
+    cache: Dict[Tuple[Point, ...], List[Point]] = dict()
+    for feature, feature_polygons in zip(simplified['features'], quantized):
+        coordinates = [
+            [
+                [list(point) for point in simplify_ring(ring, junctions, tolerance, cache)]
+                for ring in polygon
+            ]
+            for polygon in feature_polygons
+        ]
+        geometry = feature['geometry']
+        geometry['coordinates'] = coordinates[0] if geometry['type'] == 'Polygon' else coordinates
+
+    return simplified
+
+def count_vertices(geojson: dict) -> int:
+    '''
+    :returns: Número total de vértices en los polígonos de `geojson`.
+    '''
+    total = 0
+    for feature in geojson['features']:
+        geometry = feature['geometry']
+        polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+        total += sum(len(ring) for polygon in polygons for ring in polygon)
+    return total
@@ -0,0 +1,292 @@
+'''
+Unión espacial de puntos con los municipios del AMM: asigna a cada punto
+(estaciones, mallas de kriging o cualquier lote de coordenadas)
+la clave CVE_MUN del polígono que lo contiene.
+
+La prueba de punto en polígono es la de rayo horizontal (regla par-impar):
+un punto está dentro si un rayo hacia +x cruza un número impar de aristas
+del polígono, lo que también resuelve huecos y multipolígonos.
+Para no probar cada punto contra todas las aristas, `PolygonIndex` divide
+el rango de latitudes en franjas horizontales y guarda las aristas que
+toca cada franja: un rayo solo puede cruzar aristas de la franja de su punto.
+Los puntos se agrupan por franja y cada grupo se prueba en una sola operación
+vectorizada contra las aristas de su franja.
+
+AMM = Área Metropolitana de Monterrey
+'''
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from filter_geojson import read_amm_geojson
+from profiling import span
+
+# aristas promedio por franja al elegir el número de franjas
+EDGES_PER_BAND = 16
+MAX_BANDS = 4096
+# elementos máximos de la matriz punto × arista que se prueba a la vez
+BLOCK_SIZE = 2**22
+
+def get_rings(geometry: dict) -> List[np.ndarray]:
+    '''
+    :returns: Anillos (exteriores y huecos) de un `Polygon` o `MultiPolygon`
+        como arreglos de coordenadas (lon, lat).
+    '''
+    if geometry['type'] == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        raise ValueError(f'Geometría no soportada: {geometry["type"]}')
+    return [np.asarray(ring, dtype=np.float64)[:, :2] for polygon in polygons for ring in polygon]
+
+class PolygonIndex:
+    '''
+    Índice por franjas horizontales de las aristas de un conjunto de polígonos
+    que no se traslapan, para asignar lotes grandes de puntos a su polígono.
+
+    Uso::
+
+        index = PolygonIndex(geojson['features'])
+        positions = index.locate(lon, lat)  # -1 fuera de todos
+        munics = index.ids[positions]
+    '''
+    def __init__(self, features: Sequence[dict], id_key: Optional[str] = None, bands: Optional[int] = None) -> None:
+        '''
+        :param features: Features GeoJSON con geometrías `Polygon` o `MultiPolygon`.
+
+        :param id_key: Propiedad con la clave de cada feature,
+            si es `None` se usa su llave 'id'.
+
+        :param bands: Número de franjas, por defecto uno por cada
+            `EDGES_PER_BAND` aristas, hasta `MAX_BANDS`.
+        '''
+        self.ids = np.array([
+            feature['id'] if id_key is None else feature['properties'][id_key]
+            for feature in features
+        ])
+
+        starts, ends, owners = list(), list(), list()
+        for position, feature in enumerate(features):
+            for ring in get_rings(feature['geometry']):
+                # cerrar el anillo si el último punto no repite el primero
+                if not np.array_equal(ring[0], ring[-1]):
+                    ring = np.vstack([ring, ring[:1]])
+                starts.append(ring[:-1])
+                ends.append(ring[1:])
+                owners.append(np.full(len(ring) - 1, position))
+        start, end = np.concatenate(starts), np.concatenate(ends)
+        owner = np.concatenate(owners)
+
+        # un rayo horizontal nunca cruza una arista horizontal
+        sloped = start[:, 1] != end[:, 1]
+        start, end, owner = start[sloped], end[sloped], owner[sloped]
+
+        points = np.concatenate([start, end])
+        self.bounds = (*points.min(axis=0), *points.max(axis=0))
+        xmin, ymin, xmax, ymax = self.bounds
+
+        nbands = bands if bands is not None else min(MAX_BANDS, max(1, len(owner) // EDGES_PER_BAND))
+        self.nbands = nbands
+        self.height = (ymax - ymin) / nbands if ymax > ymin else 1.0
+
+        # franjas que toca cada arista, de la de su latitud menor a la de su mayor
+        lower = self.get_bands(np.minimum(start[:, 1], end[:, 1]))
+        upper = self.get_bands(np.maximum(start[:, 1], end[:, 1]))
+        spans = upper - lower + 1
+        edges = np.repeat(np.arange(len(owner)), spans)
+        # franja de cada repetición: la menor más su número de repetición
+        offsets = np.arange(len(edges)) - np.repeat(np.cumsum(spans) - spans, spans)
+        edgebands = np.repeat(lower, spans) + offsets
+
+        # aristas ordenadas por franja y, dentro de cada franja, por polígono
+        order = np.lexsort((owner[edges], edgebands))
+        edges, edgebands = edges[order], edgebands[order]
+        self.band_starts = np.concatenate([[0], np.cumsum(np.bincount(edgebands, minlength=nbands))])
+
+        # datos de cada arista en el orden del índice, como arreglos contiguos
+        self.y0 = start[edges, 1]
+        self.y1 = end[edges, 1]
+        self.x0 = start[edges, 0]
+        # cambio de longitud por unidad de latitud, para la intersección con el rayo
+        self.slope = (end[edges, 0] - start[edges, 0]) / (end[edges, 1] - start[edges, 1])
+        self.owner = owner[edges]
+
+    def get_bands(self, y: np.ndarray) -> np.ndarray:
+        '''
+        :returns: Franja de cada latitud, limitada al rango del índice.
+        '''
+        bands = np.floor((y - self.bounds[1]) / self.height).astype(np.int64)
+        return np.clip(bands, 0, self.nbands - 1)
+
+    def locate(self, x: Sequence[float], y: Sequence[float]) -> np.ndarray:
+        '''
+        Busca el polígono que contiene a cada punto.
+
+        :param x: Longitudes.
+
+        :param y: Latitudes.
+
+        :returns: Posición del polígono de cada punto en `ids`, o -1 si no está en ninguno.
+        '''
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        result = np.full(len(x), -1, dtype=np.int64)
+
+        xmin, ymin, xmax, ymax = self.bounds
+        candidates = np.flatnonzero((x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax))
+        if len(candidates) == 0:
+            return result
+
+        # agrupar los puntos por franja
+        bands = self.get_bands(y[candidates])
+        order = np.argsort(bands, kind='stable')
+        candidates, bands = candidates[order], bands[order]
+        present, first = np.unique(bands, return_index=True)
+        last = np.append(first[1:], len(candidates))
+
+        for band, i, j in zip(present, first, last):
+            lo, hi = self.band_starts[band], self.band_starts[band + 1]
+            if lo == hi:
+                continue
+            # límites de los polígonos dentro de las aristas de la franja
+            owners = self.owner[lo:hi]
+            changes = np.flatnonzero(np.diff(owners)) + 1
+            segments = np.concatenate([[0], changes])
+            segment_owners = owners[segments]
+
+            # en bloques, para limitar la memoria de la matriz punto × arista
+            step = max(1, BLOCK_SIZE // (hi - lo))
+            for k in range(i, j, step):
+                points = candidates[k:min(j, k + step)]
+                px = x[points, None]
+                py = y[points, None]
+                # la arista cruza la latitud del punto (intervalo semiabierto,
+                # así un vértice compartido se cuenta una sola vez)
+                straddles = (self.y0[lo:hi] > py) != (self.y1[lo:hi] > py)
+                crossing = self.x0[lo:hi] + (py - self.y0[lo:hi]) * self.slope[lo:hi]
+                crosses = straddles & (px < crossing)
+                # paridad de cruces de cada polígono
+                inside = np.logical_xor.reduceat(crosses, segments, axis=1)
+                found = inside.any(axis=1)
+                result[points[found]] = segment_owners[inside[found].argmax(axis=1)]
+        return result
+
+# índice de cada nivel de detalle, con el GeoJSON con el que se creó
+_indexes: Dict[str, Tuple[dict, PolygonIndex]] = dict()
+
+def get_amm_index(detail: str = 'full') -> PolygonIndex:
+    '''
+    :returns: Índice de los municipios del AMM con claves CVE_MUN,
+        creado una sola vez mientras el GeoJSON no cambie.
+    '''
+    geojson = read_amm_geojson(detail)
+    cached = _indexes.get(detail)
+    # `read_amm_geojson` regresa el mismo diccionario mientras el archivo no cambie
+    if cached is not None and cached[0] is geojson:
+        return cached[1]
+    index = PolygonIndex(geojson['features'], id_key='CVE_MUN')
+    _indexes[detail] = (geojson, index)
+    return index
+
+def assign_munics(x: Sequence[float], y: Sequence[float], detail: str = 'full') -> pd.Categorical:
+    '''
+    Asigna cada punto al municipio del AMM que lo contiene.
+
+    :param x: Longitudes.
+
+    :param y: Latitudes.
+
+    :param detail: Nivel de detalle de los polígonos, ver `filter_geojson.DETAIL_LEVELS`.
+
+    :returns: Clave CVE_MUN de cada punto, nula fuera del AMM.
+    '''
+    index = get_amm_index(detail)
+    with span('join', rows=len(x)):
+        positions = index.locate(x, y)
+    return pd.Categorical.from_codes(positions, categories=index.ids)
+
+def assign_stations(stations: pd.DataFrame, detail: str = 'full') -> pd.DataFrame:
+    '''
+    :param stations: Coordenadas de estaciones, ver `readers.read_stations`.
+
+    :returns: `stations` con columna MUNIC, el municipio de cada estación.
+    '''
+    return stations.assign(MUNIC=assign_munics(stations['lon'], stations['lat'], detail))
+
+def average_by_munic(
+        x: Sequence[float], y: Sequence[float], values: np.ndarray,
+        detail: str = 'full') -> pd.DataFrame:
+    '''
+    Promedia valores de puntos por municipio.
+
+    :param values: Valores de cada punto, o arreglo de (columnas × puntos)
+        para promediar varias series de los mismos puntos a la vez,
+        por ejemplo una hora por columna.
+
+    :returns: `DataFrame` indexado por MUNIC con el promedio de cada serie
+        (columnas 0, 1, ...) y la columna `points` con los puntos de cada municipio.
+        Solo incluye municipios con al menos un punto.
+    '''
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    munics = assign_munics(x, y, detail)
+    frame = pd.DataFrame(values.T)
+    frame['MUNIC'] = munics
+    grouped = frame.groupby('MUNIC', observed=True)
+    averages = grouped.mean()
+    averages['points'] = grouped.size()
+    return averages
+
+def average_pollutant_by_munic(
+        pollutant: str, date: str, detail: str = 'full', stride: int = 1) -> pd.DataFrame:
+    '''
+    Promedio por hora y municipio de la malla de kriging de un contaminante,
+    por ejemplo para unirlo con los ingresos del mapa coroplético.
+    Las mallas se toman de los resultados guardados si ya se interpolaron.
+
+    :param pollutant: Nombre del contaminante.
+
+    :param date: Fecha en formato `'d-b-y'`, ejemplo: '1-Dec-18'.
+
+    :param detail: Nivel de detalle de los polígonos.
+
+    :param stride: Solo se promedian las horas múltiplo de `stride`.
+
+    :returns: `DataFrame` con columnas [timestamp, MUNIC, NOM_MUN, `pollutant`, points].
+    '''
+    # importar aquí, el mapa de calor no es necesario para unir puntos
+    from heatmap import read_day, get_day_variograms, get_hour_grids, split_hours, DATE_FORMAT
+    from readers import read_amm_municipalities, read_stations
+
+    day = pd.to_datetime(date, format=DATE_FORMAT)
+    dataset = read_day(pollutant, day, read_stations(), stride)
+    variograms = get_day_variograms(split_hours(dataset), dataset, pollutant)
+
+    averages = list()
+    # las mallas de las horas con las mismas estaciones tienen las mismas coordenadas,
+    # así que las horas se agrupan por malla y cada malla se asigna una sola vez
+    grids: Dict[bytes, Tuple[list, list, list]] = dict()
+    for hour, data in dataset.groupby('timestamp'):
+        xpollution, ypollution, zpollution, *_ = get_hour_grids(data, pollutant, variograms=variograms)
+        key = np.asarray([xpollution, ypollution]).tobytes()
+        grid = grids.setdefault(key, (xpollution, ypollution, list()))
+        grid[2].append((hour, zpollution))
+
+    for xpollution, ypollution, hours in grids.values():
+        timestamps = [hour for hour, _ in hours]
+        hourly = average_by_munic(xpollution, ypollution, [values for _, values in hours], detail)
+        hourly.columns = timestamps + ['points']
+        averages.append(hourly
+            .melt(id_vars='points', var_name='timestamp', value_name=pollutant, ignore_index=False)
+            .reset_index())
+
+    munics = read_amm_municipalities()
+    if not averages:
+        return pd.DataFrame(columns=['timestamp', 'MUNIC', 'NOM_MUN', pollutant, 'points'])
+    averages = pd.concat(averages, ignore_index=True).astype({'MUNIC': str, 'timestamp': 'datetime64[ns]'})
+    # municipios del GeoJSON que no están en AMM_MUNICS.csv se conservan sin nombre
+    averages = averages.merge(munics, on='MUNIC', how='left')
+    return (averages[['timestamp', 'MUNIC', 'NOM_MUN', pollutant, 'points']]
+        .sort_values(['timestamp', 'MUNIC'], ignore_index=True))
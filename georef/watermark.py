@@ -0,0 +1,126 @@
+'''
+Marcas de agua de archivos CSV a los que solo se les agregan registros al final,
+como filled.csv (un registro por hora) o EGRESO_{año}.csv (por lotes).
+
+Una marca guarda hasta qué byte se procesó el archivo y una huella de su contenido
+antes de ese byte. Si en la siguiente ejecución la huella coincide, el archivo
+solo creció y basta con leer los registros a partir de la marca;
+si no coincide (el archivo se reescribió o se recortó), hay que procesarlo completo.
+
+    mark = read_watermark(markpath)
+    offset = get_appended_offset(filepath, mark)
+    if offset is None:
+        ...  # procesar el archivo completo
+        mark = make_watermark(filepath)
+    else:
+        new, end = read_appended(filepath, offset)
+        ...  # procesar solo `new`
+        mark = make_watermark(filepath, end)
+    write_watermark(markpath, mark)
+'''
+
+import hashlib
+import io
+import json
+import os
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+# bytes del inicio y de antes de la marca que se incluyen en la huella
+SAMPLE_BYTES = 2**16
+
+def get_complete_size(filepath: str) -> int:
+    '''
+    :returns: Bytes del archivo hasta su último salto de línea, así no se cuenta
+        un registro que se está escribiendo en este momento.
+    '''
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as file:
+        position = size
+        while position > 0:
+            start = max(0, position - SAMPLE_BYTES)
+            file.seek(start)
+            block = file.read(position - start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            position = start
+    return 0
+
+def get_digest(filepath: str, offset: int) -> str:
+    '''
+    :returns: Huella del contenido del archivo antes del byte `offset`:
+        su tamaño, su inicio (encabezado) y los bytes justo antes de `offset`.
+    '''
+    digest = hashlib.sha256(str(offset).encode())
+    with open(filepath, 'rb') as file:
+        digest.update(file.read(min(offset, SAMPLE_BYTES)))
+        file.seek(max(0, offset - SAMPLE_BYTES))
+        digest.update(file.read(min(offset, SAMPLE_BYTES)))
+    return digest.hexdigest()
+
+def make_watermark(filepath: str, offset: Optional[int] = None) -> Dict[str, Any]:
+    '''
+    :param offset: Byte hasta el que se procesó el archivo,
+        por defecto hasta su último registro completo.
+
+    :returns: Marca de agua del archivo.
+    '''
+    if offset is None:
+        offset = get_complete_size(filepath)
+    return {'offset': offset, 'digest': get_digest(filepath, offset)}
+
+def get_appended_offset(filepath: str, mark: Optional[Dict[str, Any]]) -> Optional[int]:
+    '''
+    :returns: Byte a partir del cual están los registros agregados después de `mark`
+        (igual al tamaño del archivo si no hay nuevos), o `None` si no hay marca,
+        el archivo no existe o cambió antes de la marca y debe procesarse completo.
+    '''
+    if mark is None or not os.path.exists(filepath):
+        return None
+    offset = mark['offset']
+    # sin registros antes de la marca no hay nada que conservar
+    if offset <= 0 or os.path.getsize(filepath) < offset:
+        return None
+    if get_digest(filepath, offset) != mark['digest']:
+        return None
+    return offset
+
+def read_appended(filepath: str, offset: int, **kwargs: Any) -> Tuple[pd.DataFrame, int]:
+    '''
+    Lee los registros completos del CSV a partir del byte `offset`,
+    con el encabezado del inicio del archivo.
+
+    :param kwargs: Argumentos de `pandas.read_csv`, ejemplo: `usecols`.
+
+    :returns: Registros nuevos y byte siguiente al último registro leído,
+        la marca para la próxima lectura.
+    '''
+    with open(filepath, 'rb') as file:
+        header = file.readline()
+        file.seek(offset)
+        appended = file.read()
+    # omitir un último registro incompleto, se leerá en la próxima
+    end = appended.rfind(b'\n') + 1
+    dataframe = pd.read_csv(io.BytesIO(header + appended[:end]), **kwargs)
+    return dataframe, offset + end
+
+def read_watermark(markpath: str) -> Optional[Dict[str, Any]]:
+    '''
+    :returns: Marca guardada en `markpath`, o `None` si no existe o no se pudo leer.
+    '''
+    try:
+        with open(markpath, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def write_watermark(markpath: str, mark: Dict[str, Any]) -> None:
+    '''
+    Guarda la marca en `markpath`, a un temporal y luego renombrándolo.
+    '''
+    temppath = f'{markpath}.{os.getpid()}.tmp'
+    with open(temppath, 'w') as file:
+        json.dump(mark, file)
+    os.replace(temppath, markpath)
@@ -0,0 +1,21 @@
+'''
+Los módulos de `georef` se importan sin paquete, igual que desde `cli.py`.
+'''
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'georef'))
+
+@pytest.fixture
+def results_dir(tmp_path, monkeypatch):
+    '''
+    Carpeta temporal de `results`, leyendo los resultados guardados.
+    '''
+    import results
+    monkeypatch.setattr(results, 'RESULTS_DIR', str(tmp_path / 'results'))
+    monkeypatch.setattr(results, 'use_saved', True)
+    monkeypatch.delenv(results.RECOMPUTE_ENV, raising=False)
+    return tmp_path / 'results'
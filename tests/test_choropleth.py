@@ -0,0 +1,124 @@
+import epiweeks
+import numpy as np
+import pandas as pd
+
+from choropleth import EntriesCube, count_entries_cube, get_epiweek_label, get_epiweek_numbers
+
+MUNICS = pd.DataFrame({'MUNIC': ['006', '019', '039', '046'], 'NOM_MUN': ['Apodaca', 'San Pedro', 'Monterrey', 'San Nicolás']})
+CIES = ['A', 'J']
+
+def make_entries(seed: int = 0, n: int = 400) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    # semanas de fin de 2019 a inicio de 2020, la semana 1 de 2020 empieza el 29 de diciembre
+    start = pd.Timestamp('2019-12-01')
+    return pd.DataFrame({
+        'INGRE': start + pd.to_timedelta(rng.integers(0, 60, n), unit='D')
+            + pd.to_timedelta(rng.integers(0, 24, n), unit='h'),
+        # '999' y 'Z' no se pidieron y se descartan
+        'MUNIC': rng.choice(list(MUNICS['MUNIC']) + ['999'], n),
+        'DIAG_INI': [letter + '09X' for letter in rng.choice(CIES + ['Z'], n)],
+    })
+
+def get_reference(entries: pd.DataFrame) -> pd.Series:
+    '''
+    Conteos por (letra, municipio, semana) con `groupby` y `epiweeks`.
+    '''
+    entries = entries[entries['MUNIC'].isin(MUNICS['MUNIC']) & entries['DIAG_INI'].str[0].isin(CIES)]
+    weeks = [epiweeks.Week.fromdate(date.date()) for date in entries['INGRE']]
+    return entries.groupby([entries['DIAG_INI'].str[0], entries['MUNIC'], pd.Series(weeks, index=entries.index)]).size()
+
+def get_cube_counts(cube: EntriesCube) -> pd.Series:
+    labels = cube.get_week_labels()
+    return pd.Series({
+        (letter, munic, labels[w]): int(cube.counts[l, m, w])
+        for l, letter in enumerate(cube.letters)
+        for m, munic in enumerate(cube.munics['MUNIC'])
+        for w in range(cube.counts.shape[2])
+    })
+
+def test_epiweek_numbers_match_epiweeks():
+    dates = pd.Series(pd.date_range('2014-12-20', '2021-01-10', freq='19h'))
+    numbers = get_epiweek_numbers(dates)
+
+    expected = [epiweeks.Week.fromdate(date.date()) for date in dates]
+    assert [get_epiweek_label(number) for number in numbers] == expected
+    # semanas consecutivas, también entre años de 52 y 53 semanas
+    weeks = sorted(set(numbers))
+    assert weeks == list(range(weeks[0], weeks[-1] + 1))
+
+def test_epiweek_year_boundary():
+    dates = pd.Series(pd.to_datetime(['2019-12-28', '2019-12-29', '2020-01-04', '2020-01-05']))
+    numbers = get_epiweek_numbers(dates)
+    first = numbers[0]
+    assert list(numbers) == [first, first + 1, first + 1, first + 2]
+    assert get_epiweek_label(numbers[0]) == epiweeks.Week(2019, 52)
+    assert get_epiweek_label(numbers[1]) == epiweeks.Week(2020, 1)
+
+def test_count_matches_groupby():
+    entries = make_entries()
+    cube = count_entries_cube(entries, MUNICS, CIES)
+    counts = get_cube_counts(cube)
+    reference = get_reference(entries)
+
+    assert cube.counts.shape[:2] == (len(CIES), len(MUNICS))
+    assert counts.sum() == reference.sum()
+    for key, count in reference.items():
+        assert counts[key] == count
+    # celdas sin casos están en el cubo con 0
+    missing = counts.index.difference(reference.index)
+    assert len(missing) > 0
+    assert (counts[missing] == 0).all()
+    # semanas de ambos años
+    years = {week.year for week in cube.get_week_labels()}
+    assert years == {2019, 2020}
+
+def test_count_empty():
+    entries = make_entries().iloc[:0]
+    cube = count_entries_cube(entries, MUNICS, CIES)
+    assert cube.counts.shape == (len(CIES), len(MUNICS), 0)
+
+def test_add_matches_count_of_union():
+    entries = make_entries(n=600)
+    dates = entries['INGRE']
+    early = entries[dates < '2019-12-20']
+    late = entries[dates >= '2020-01-10']
+    middle = entries[(dates >= '2019-12-20') & (dates < '2020-01-10')]
+
+    # cubos que no se traslapan y con un hueco entre ellos
+    cube = count_entries_cube(early, MUNICS, CIES).add(count_entries_cube(late, MUNICS, CIES))
+    expected = count_entries_cube(pd.concat([early, late]), MUNICS, CIES)
+    assert cube.first_week == expected.first_week
+    np.testing.assert_array_equal(cube.counts, expected.counts)
+
+    # cubos traslapados y uno vacío
+    cube = cube.add(count_entries_cube(middle, MUNICS, CIES)).add(count_entries_cube(middle.iloc[:0], MUNICS, CIES))
+    expected = count_entries_cube(entries, MUNICS, CIES)
+    assert cube.first_week == expected.first_week
+    np.testing.assert_array_equal(cube.counts, expected.counts)
+
+def test_select_trims_weeks():
+    entries = pd.DataFrame({
+        'INGRE': pd.to_datetime(['2019-12-01', '2019-12-16', '2020-01-02', '2020-01-20']),
+        'MUNIC': ['006', '019', '039', '006'],
+        'DIAG_INI': ['A09X', 'J45X', 'J20X', 'A01X'],
+    })
+    cube = count_entries_cube(entries, MUNICS, CIES)
+    assert cube.counts.shape[2] == 8
+
+    selected = cube.select('J')
+    assert selected.letters == ['J']
+    assert selected.get_week_labels() == [epiweeks.Week(2019, 51), epiweeks.Week(2019, 52), epiweeks.Week(2020, 1)]
+    np.testing.assert_array_equal(selected.counts.sum(axis=(0, 1)), [1, 0, 1])
+
+    # la letra A ocupa todas las semanas
+    selected = cube.select('A')
+    assert selected.first_week == cube.first_week
+    assert selected.counts.shape == (1, len(MUNICS), 8)
+
+def test_select_without_cases():
+    entries = pd.DataFrame({
+        'INGRE': pd.to_datetime(['2019-12-01']), 'MUNIC': ['006'], 'DIAG_INI': ['A09X'],
+    })
+    selected = count_entries_cube(entries, MUNICS, CIES).select('J')
+    assert selected.counts.shape == (1, len(MUNICS), 0)
+    assert selected.get_week_labels() == []
@@ -0,0 +1,27 @@
+from argparse import ArgumentTypeError
+
+import pytest
+
+from cli import parse_arguments, positive_int, year_range
+
+def test_positive_int():
+    assert positive_int('100000') == 100000
+    for value in ('0', '-5', 'abc'):
+        with pytest.raises(ArgumentTypeError):
+            positive_int(value)
+
+def test_year_range():
+    assert year_range('2018') == [2018]
+    assert year_range('2015-2017') == [2015, 2016, 2017]
+    with pytest.raises(ArgumentTypeError):
+        year_range('2018-2015')
+
+@pytest.mark.parametrize('command', [
+    ['hm', 'PM10', '15-Dec-18', '-w', '0'],
+    ['cm', '2018', 'A', '--workers', '-1'],
+    ['serve', '-w', '0'],
+])
+def test_workers_must_be_positive(command, capsys):
+    with pytest.raises(SystemExit):
+        parse_arguments(command)
+    assert 'debe ser mayor que cero' in capsys.readouterr().err
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import filter_geojson
+from filter_geojson import iter_features, write_filtered_geojson
+
+def make_geojson() -> dict:
+    features = list()
+    for i in range(30):
+        features.append({
+            'type': 'Feature',
+            'properties': {'CVE_ENT': '19' if i % 2 else '05', 'CVE_MUN': f'{i:03d}', 'NOMGEO': 'Nuevo León á "x"'},
+            'geometry': {'type': 'Polygon', 'coordinates': [[[-100.123456789 - i, 25.5], [-100.1, 25.987654321], [1e-7, -3], [-100.123456789 - i, 25.5]]]},
+        })
+    return {'type': 'FeatureCollection', 'name': 'municipios', 'features': features, 'crs': {'type': 'name'}}
+
+@pytest.mark.parametrize('read_size', [1, 7, 64, 2**20])
+def test_iter_features_across_read_boundaries(tmp_path, monkeypatch, read_size):
+    geojson = make_geojson()
+    filepath = tmp_path / 'nacional.json'
+    filepath.write_text(json.dumps(geojson, indent=1, ensure_ascii=False), encoding='utf-8')
+    monkeypatch.setattr(filter_geojson, 'READ_SIZE', read_size)
+
+    assert list(iter_features(str(filepath))) == geojson['features']
+
+@pytest.mark.parametrize('read_size', [5, 2**20])
+def test_write_filtered_geojson(tmp_path, monkeypatch, read_size):
+    geojson = make_geojson()
+    source, target = tmp_path / 'nacional.json', tmp_path / 'amm.json'
+    source.write_text(json.dumps(geojson), encoding='utf-8')
+    monkeypatch.setattr(filter_geojson, 'READ_SIZE', read_size)
+
+    count = write_filtered_geojson(['19001', '19003', '05'], str(source), str(target))
+    filtered = json.loads(target.read_text(encoding='utf-8'))
+
+    expected = [
+        dict(feature, id=feature['properties']['CVE_MUN']) for feature in geojson['features']
+        if feature['properties']['CVE_ENT'] == '05' or feature['properties']['CVE_MUN'] in ('001', '003')
+    ]
+    assert count == len(expected) == 17
+    assert filtered['features'] == expected
+    assert filtered['name'] == 'municipios' and filtered['crs'] == geojson['crs']
+
+def test_invalid_json(tmp_path):
+    filepath = tmp_path / 'roto.json'
+    filepath.write_text('{"features": [{"a": 1} {"b": 2}]}', encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(iter_features(str(filepath)))
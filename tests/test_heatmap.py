@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import profiling
+from heatmap import build_frames
+from kriging import KrigingEngine
+
+pytestmark = pytest.mark.usefixtures('results_dir')
+
+def make_day(hours: int) -> pd.DataFrame:
+    rng = np.random.default_rng(3)
+    lon, lat = rng.uniform(-100.6, -100.0, 9), rng.uniform(25.5, 25.9, 9)
+    rows = list()
+    for hour in range(hours):
+        timestamp = pd.Timestamp('2018-12-15') + pd.Timedelta(hours=hour)
+        for station in range(9):
+            rows.append({
+                'station': f'S{station}', 'lon': lon[station], 'lat': lat[station], 'timestamp': timestamp,
+                'PM10': 40 + 10 * np.sin(lon[station] * 9 + hour) + station % 3,
+                'velocity': 5 + np.cos(lat[station] * 7 + hour), 'direction': (40 * station + 10 * hour) % 360,
+            })
+    return pd.DataFrame(rows)
+
+def render(dataset: pd.DataFrame) -> list:
+    '''
+    :returns: Intervalos de `results` al generar los cuadros de `dataset`.
+    '''
+    profiling.enable()
+    try:
+        list(build_frames(dataset, 'PM10', (0, 100), (0, 10)))
+    finally:
+        profiling.disable()
+    return [record for record in profiling.get_trace()['spans'] if record['name'] == 'results']
+
+def test_appended_hour_only_misses():
+    first = render(make_day(4))
+    assert [record['namespace'] for record in first if not record['hit']] == ['variograms'] + ['kriging'] * 4
+
+    # una hora más: los variogramas del día y las demás horas se reutilizan
+    second = render(make_day(5))
+    misses = [record['namespace'] for record in second if not record['hit']]
+    assert misses == ['kriging']
+    assert [record['namespace'] for record in second if record['hit']] == ['variograms'] + ['kriging'] * 4
+
+def test_cached_render_does_no_kriging(monkeypatch):
+    dataset = make_day(3)
+    # valores del mapa de calor de cada cuadro
+    first = [frame['data'][2]['z'] for frame, _ in build_frames(dataset, 'PM10', (0, 100), (0, 10))]
+
+    def fail(*args, **kwargs):
+        raise AssertionError('se volvió a interpolar')
+    monkeypatch.setattr(KrigingEngine, 'solve', fail)
+    monkeypatch.setattr(KrigingEngine, 'fit_variograms', fail)
+
+    second = [frame['data'][2]['z'] for frame, _ in build_frames(dataset, 'PM10', (0, 100), (0, 10))]
+    assert second == first
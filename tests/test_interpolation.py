@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from interpolation import IDWEngine, get_engine, interpolate
+from kriging import KrigingEngine
+
+GRID = range(5, 21, 5)
+
+def make_stations(seed: int = 1, n: int = 10):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-100.6, -100.0, n), rng.uniform(25.5, 25.9, n), rng.uniform(10, 90, n)
+
+def brute_idw(x, y, z, targets, neighbors, power=2.0):
+    estimated = list()
+    for tx, ty in targets:
+        distances = np.hypot(x - tx, y - ty)
+        nearest = np.argsort(distances)[:neighbors]
+        if distances[nearest[0]] == 0:
+            estimated.append(z[nearest[0]])
+            continue
+        weights = 1.0 / distances[nearest] ** power
+        estimated.append(np.sum(weights * z[nearest]) / np.sum(weights))
+    return np.array(estimated)
+
+def test_same_grid_as_kriging():
+    x, y, _ = make_stations()
+    xidw, yidw, _ = IDWEngine(x, y, GRID).interpolate(np.ones(len(x)))
+    targets = KrigingEngine(x, y, GRID).steps[-1].targets
+    np.testing.assert_allclose(xidw, targets[:, 0])
+    np.testing.assert_allclose(yidw, targets[:, 1])
+
+@pytest.mark.parametrize('neighbors', [1, 4, 8])
+def test_matches_brute_force(neighbors):
+    x, y, z = make_stations()
+    engine = IDWEngine(x, y, GRID, neighbors=neighbors)
+    _, _, zpoints = engine.interpolate(z)
+    np.testing.assert_allclose(zpoints, brute_idw(x, y, z, engine.targets, neighbors), rtol=1e-12)
+
+def test_exact_at_stations_and_constant():
+    x, y, z = make_stations()
+    # estaciones en las esquinas de la malla
+    x[:2], y[:2] = (x.min(), x.max()), (y.min(), y.max())
+    engine = IDWEngine(x, y, GRID)
+    _, _, zpoints = engine.interpolate(z)
+    assert zpoints[0] == z[0] and zpoints[-1] == z[1]
+
+    _, _, flat = engine.interpolate(np.full(len(x), 3.5))
+    np.testing.assert_allclose(flat, 3.5)
+
+def test_batched_and_dispatch():
+    x, y, z = make_stations()
+    block = np.stack([z, z * 2, z[::-1]])
+    _, _, batched = get_engine('idw', x, y, GRID).interpolate_many(block)
+    for row, values in zip(batched, block):
+        np.testing.assert_allclose(row, interpolate(x, y, values, GRID, 'idw')[2])
+
+    assert get_engine('nearest', x, y, GRID).weights.shape[1] == 1
+    with pytest.raises(ValueError):
+        get_engine('spline', x, y, GRID)
@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from pykrige.ok import OrdinaryKriging
+
+from kriging import KrigingEngine, get_segments, interpolate, interpolate_fields
+
+def make_stations(seed: int = 0, n: int = 12):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-100.6, -100.0, n), rng.uniform(25.5, 25.9, n)
+
+def make_field(x, y, phase: float) -> np.ndarray:
+    return 50 + 20 * np.sin(x * 8 + phase) * np.cos(y * 6)
+
+def test_single_step_matches_pykrige():
+    x, y = make_stations()
+    z = make_field(x, y, 0.0)
+    engine = KrigingEngine(x, y, range(10, 11))
+
+    _, _, zpoints = engine.interpolate(z)
+    xpoints, ypoints = get_segments(x, 10), get_segments(y, 10)
+    expected, _ = OrdinaryKriging(x, y, z, variogram_model='spherical').execute('grid', xpoints, ypoints)
+    np.testing.assert_allclose(zpoints, np.ravel(expected), rtol=1e-6)
+
+def test_batched_matches_per_row():
+    x, y = make_stations()
+    block = np.array([make_field(x, y, phase) for phase in np.linspace(0, 2, 6)])
+    engine = KrigingEngine(x, y, range(5, 21, 5))
+    variograms = engine.fit_variograms(block)
+
+    _, _, batched = engine.interpolate_many(block, variograms)
+    per_row = [engine.interpolate(row, variograms)[2] for row in block]
+    np.testing.assert_allclose(batched, per_row, rtol=1e-9, atol=1e-9)
+    # un sistema factorizado por paso para todas las filas
+    assert len(engine.factors) <= len(engine.steps)
+
+def test_constant_rows():
+    x, y = make_stations()
+    block = np.array([np.full(len(x), 7.0), make_field(x, y, 1.0)])
+    engine = KrigingEngine(x, y, range(5, 21, 5))
+
+    _, _, zpoints = engine.interpolate_many(block)
+    np.testing.assert_allclose(zpoints[0], 7.0)
+    _, _, single = engine.interpolate(block[1])
+    np.testing.assert_allclose(zpoints[1], single, rtol=1e-9)
+
+def test_fields_match_per_field_interpolate():
+    x, y = make_stations()
+    velocity = make_field(x, y, 0.5) / 10
+    direction = 180 + 150 * np.cos(x * 5 - y * 3)
+    _, _, fields = interpolate_fields(x, y, [velocity, direction], range(5, 21, 5))
+    for row, values in zip(fields, (velocity, direction)):
+        np.testing.assert_allclose(row, interpolate(x, y, values, range(5, 21, 5))[2], rtol=1e-9)
+
+def test_day_variograms_per_field():
+    x, y = make_stations()
+    hours = np.array([
+        [make_field(x, y, hour / 4) / 10, 180 + 150 * np.cos(x * 5 - y * 3 + hour)]
+        for hour in range(6)
+    ])
+    engine = KrigingEngine(x, y, range(5, 21, 5))
+    variograms = engine.fit_variograms(hours)
+    assert all(len(step) == 2 for step in variograms)
+
+    _, _, batched = engine.interpolate_many(hours, variograms)
+    for hour, values in zip(batched, hours):
+        for field in range(2):
+            single = [(step[field],) for step in variograms]
+            np.testing.assert_allclose(hour[field], engine.interpolate(values[field], single)[2], rtol=1e-9)
+
+def test_shared_engine_across_threads():
+    x, y = make_stations()
+    rows = [make_field(x, y, phase) for phase in np.linspace(0, 3, 6)]
+    expected = [KrigingEngine(x, y, range(5, 21, 5)).interpolate(row)[2] for row in rows]
+
+    # caché pequeña para que los hilos agreguen y desalojen a la vez
+    engine = KrigingEngine(x, y, range(5, 21, 5), cache_size=2)
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda row: engine.interpolate(row)[2], rows * 2))
+
+    for zpoints, reference in zip(results, expected * 2):
+        np.testing.assert_allclose(zpoints, reference, rtol=1e-9, atol=1e-9)
+    assert len(engine.factors) <= 2
@@ -0,0 +1,125 @@
+import base64
+import json
+
+import numpy as np
+import plotly.graph_objects as go
+import pytest
+from plotly.io.json import to_json_plotly
+
+from output import FigureWriter, OutputOptions, compact_value, encode_array
+
+def make_figure():
+    data = [go.Scatter(x=[0, 1, 2], y=[1.5, 2.5, 0.5], mode='markers').to_plotly_json()]
+    frames = [
+        dict(name=str(hour), data=[go.Scatter(x=[0, 1, 2], y=[hour, hour + 1, hour + 2]).to_plotly_json()])
+        for hour in range(3)
+    ]
+    layout = go.Layout(
+        title='prueba',
+        sliders=[dict(steps=[dict(label=frame['name'], args=[[frame['name']]]) for frame in frames])]
+    )
+    return data, layout, frames
+
+def get_expected(data, layout, frames) -> dict:
+    figure = go.Figure(data=data, layout=layout, frames=frames).to_dict()
+    return json.loads(to_json_plotly(figure))
+
+def write_figure(filepath, options, data, layout, frames) -> None:
+    with FigureWriter(filepath, options) as writer:
+        for frame in frames:
+            writer.add_frame(frame)
+        writer.finish(data, layout)
+
+def decode_at(text: str, start: int):
+    return json.JSONDecoder().raw_decode(text, start)
+
+def test_json_matches_figure(tmp_path):
+    data, layout, frames = make_figure()
+    filepath = tmp_path / 'mapa.json'
+    write_figure(filepath, OutputOptions(format='json', auto_open=False), data, layout, frames)
+
+    written = json.loads(filepath.read_text(encoding='utf-8'))
+    expected = get_expected(data, layout, frames)
+    for key in ('data', 'layout', 'frames'):
+        assert written[key] == expected[key]
+
+def test_html_matches_figure(tmp_path):
+    data, layout, frames = make_figure()
+    filepath = tmp_path / 'mapa.html'
+    write_figure(filepath, OutputOptions(plotlyjs=False, auto_open=False), data, layout, frames)
+
+    html = filepath.read_text(encoding='utf-8')
+    written_frames, _ = decode_at(html, html.index('var frames = ') + len('var frames = '))
+    start = html.index('Plotly.newPlot(')
+    start = html.index(', ', start) + 2
+    written_data, end = decode_at(html, start)
+    written_layout, _ = decode_at(html, end + 2)
+
+    expected = get_expected(data, layout, frames)
+    assert written_data == expected['data']
+    assert written_layout == expected['layout']
+    assert written_frames == expected['frames']
+
+@pytest.mark.parametrize('format', ['html', 'json'])
+def test_partial_file_removed(tmp_path, format):
+    data, layout, frames = make_figure()
+    filepath = tmp_path / f'mapa.{format}'
+
+    with pytest.raises(RuntimeError):
+        with FigureWriter(filepath, OutputOptions(format=format, auto_open=False)) as writer:
+            writer.add_frame(frames[0])
+            assert filepath.exists()
+            raise RuntimeError('error al generar un cuadro')
+    assert not filepath.exists()
+
+    # sin error pero sin llamar a `finish`
+    with FigureWriter(filepath, OutputOptions(format=format, auto_open=False)) as writer:
+        writer.add_frame(frames[0])
+    assert not filepath.exists()
+
+def decode_array(encoded: dict) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(encoded['bdata']), dtype='<' + encoded['dtype'])
+
+def test_compact_rounds_to_precision():
+    trace = {'lat': [25.123456, 25.98765], 'marker': {'size': 10.55555, 'opacity': [0.123456]}, 'name': 'PM10'}
+    compacted = compact_value(trace, OutputOptions(precision=2))
+    assert compacted == {'lat': [25.12, 25.99], 'marker': {'size': 10.56, 'opacity': [0.12]}, 'name': 'PM10'}
+
+    # sin precisión ni binario los valores no cambian
+    assert compact_value(trace, OutputOptions()) == trace
+
+def test_compact_keeps_text_and_geojson():
+    geojson = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [-100.123456, 25.654321]}}
+    ]}
+    trace = {'text': [1.23456, 2.34567], 'hovertext': np.array([3.45678]), 'geojson': geojson, 'z': [1.23456]}
+    compacted = compact_value(trace, OutputOptions(precision=1, binary=True))
+
+    assert compacted['text'] == [1.2, 2.3]
+    assert compacted['hovertext'] == [3.5]
+    assert compacted['geojson'] is geojson
+    assert compacted['z']['dtype'] == 'f4'
+
+def test_encode_array_round_trip():
+    integers = np.array([0, -3, 2 ** 31 - 1, 7], dtype=np.int64)
+    encoded = encode_array(integers)
+    assert encoded['dtype'] == 'i4'
+    decoded = decode_array(encoded)
+    assert decoded.dtype == np.int32
+    np.testing.assert_array_equal(decoded, integers)
+
+    floats = np.array([25.5, -100.25, 1e-3, 3.14159])
+    encoded = encode_array(floats)
+    assert encoded['dtype'] == 'f4'
+    decoded = decode_array(encoded)
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded, floats.astype(np.float32))
+
+def test_compact_binary_decodes_rounded_values():
+    trace = {'x': [1, 2, 3], 'y': [0.123456, 9.87654], 'customdata': [True, False]}
+    compacted = compact_value(trace, OutputOptions(precision=3, binary=True))
+
+    np.testing.assert_array_equal(decode_array(compacted['x']), np.array([1, 2, 3], dtype=np.int32))
+    np.testing.assert_array_equal(decode_array(compacted['y']), np.array([0.123, 9.877], dtype=np.float32))
+    # los booleanos no son arreglos numéricos
+    assert compacted['customdata'] == [True, False]
@@ -0,0 +1,51 @@
+import profiling
+from profiling import span
+
+def test_nested_rows_counted_once():
+    profiling.enable()
+    try:
+        with span('read') as record:
+            with span('filter', rows=10):
+                pass
+            record['rows'] = 10
+        with span('filter', rows=5):
+            pass
+        with span('frame'):
+            with span('write', rows=3):
+                pass
+    finally:
+        profiling.disable()
+
+    summary = profiling.get_trace()['summary']
+    assert summary['read']['rows'] == 10
+    # el 'filter' dentro de 'read' ya está contado en 'read'
+    assert summary['filter']['count'] == 2
+    assert summary['filter']['rows'] == 5
+    # 'frame' no reporta registros, así que 'write' es el más externo
+    assert summary['write']['rows'] == 3
+
+def test_ids_unique_after_discarded_span():
+    def frames():
+        yield 0
+        # trabajo dentro del último intervalo de `timed`, que se descarta
+        with span('write', rows=3):
+            pass
+
+    profiling.enable()
+    try:
+        with span('run'):
+            assert list(profiling.timed('frame', frames())) == [0]
+            with span('read') as record:
+                with span('filter', rows=4):
+                    pass
+                record['rows'] = 4
+    finally:
+        profiling.disable()
+
+    trace = profiling.get_trace()
+    ids = [record['id'] for record in trace['spans']]
+    assert len(ids) == len(set(ids)) == 5
+    # el 'filter' dentro de 'read' no se suma, el 'write' sí
+    assert trace['summary']['filter']['rows'] == 0
+    assert trace['summary']['read']['rows'] == 4
+    assert trace['summary']['write']['rows'] == 3
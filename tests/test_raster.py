@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from heatmap import fit_day_variograms, interpolate_hour, POLLUTION_GRID, WIND_GRID
+from raster import GridCube, GridWriter
+
+def make_day(hours: int = 4) -> pd.DataFrame:
+    rng = np.random.default_rng(2)
+    lon, lat = rng.uniform(-100.6, -100.0, 9), rng.uniform(25.5, 25.9, 9)
+    rows = list()
+    for hour in range(hours):
+        timestamp = pd.Timestamp('2018-12-15') + pd.Timedelta(hours=hour)
+        for station in range(9):
+            rows.append({
+                'station': f'S{station}', 'lon': lon[station], 'lat': lat[station], 'timestamp': timestamp,
+                'PM10': 40 + 10 * np.sin(lon[station] * 9 + hour) + rng.normal(),
+                'velocity': rng.uniform(0, 10), 'direction': rng.uniform(0, 360),
+            })
+    return pd.DataFrame(rows)
+
+def write_grids(filepath, dataset, method, variograms=None):
+    hourly = [(hour, data) for hour, data in dataset.groupby('timestamp')]
+    grids = [interpolate_hour(data, 'PM10', method, variograms) for _, data in hourly]
+    bounds = (dataset.lon.min(), dataset.lat.min(), dataset.lon.max(), dataset.lat.max())
+    with GridWriter(str(filepath), 'PM10', method, bounds, (POLLUTION_GRID[-1], WIND_GRID[-1])) as writer:
+        for (hour, _), hourgrids in zip(hourly, grids):
+            writer.add_hour(hour, hourgrids)
+    return [hour for hour, _ in hourly], grids
+
+@pytest.mark.usefixtures('results_dir')
+@pytest.mark.parametrize('method', ['idw', 'kriging'])
+def test_round_trip(tmp_path, method):
+    dataset = make_day()
+    variograms = fit_day_variograms(dataset, 'PM10') if method == 'kriging' else None
+    hours, grids = write_grids(tmp_path / 'PM10.grid', dataset, method, variograms)
+
+    cube = GridCube(str(tmp_path / 'PM10.grid'))
+    assert len(cube) == len(hours) and cube.method == method
+    assert list(cube.timestamps) == list(hours)
+    for index, (xpollution, ypollution, zpollution, xwind, ywind, zwind) in enumerate(grids):
+        np.testing.assert_allclose(cube.get_field('PM10', index).ravel(), zpollution, rtol=1e-5)
+        np.testing.assert_allclose(cube.get_grid('wind', index).reshape(2, -1), zwind, rtol=1e-5, atol=1e-4)
+        np.testing.assert_allclose(cube.get_field('direction', index).ravel(), zwind[1], rtol=1e-5, atol=1e-4)
+
+        columns, rows = cube.get_coordinates('pollutant', index)
+        np.testing.assert_allclose(np.meshgrid(columns, rows)[0].ravel(), xpollution)
+        np.testing.assert_allclose(np.meshgrid(columns, rows)[1].ravel(), ypollution)
+        columns, rows = cube.get_coordinates('wind', index)
+        np.testing.assert_allclose(np.meshgrid(columns, rows)[0].ravel(), xwind)
+        np.testing.assert_allclose(np.meshgrid(columns, rows)[1].ravel(), ywind)
+
+    assert cube.get_hours('2018-12-15 01:00', '2018-12-15 03:00') == slice(1, 3)
+    assert cube.get_field('velocity', cube.get_hours(start='2018-12-15 02:00')).shape == (2, 20, 20)
+    with pytest.raises(KeyError):
+        cube.get_field('NO2')
+
+def test_empty_failed_and_invalid(tmp_path):
+    filepath = tmp_path / 'vacio.grid'
+    with GridWriter(str(filepath), 'PM10', 'idw', (0, 0, 1, 1), (40, 20)):
+        pass
+    assert len(GridCube(str(filepath))) == 0
+
+    # un error al escribir no deja un archivo a medias
+    failed = tmp_path / 'error.grid'
+    with pytest.raises(RuntimeError):
+        with GridWriter(str(failed), 'PM10', 'idw', (0, 0, 1, 1), (40, 20)):
+            raise RuntimeError
+    assert list(tmp_path.iterdir()) == [filepath]
+
+    invalid = tmp_path / 'otro.grid'
+    invalid.write_bytes(b'x' * 64)
+    with pytest.raises(ValueError):
+        GridCube(str(invalid))
@@ -0,0 +1,104 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import readers
+from readers import (
+    build_entries_cache, get_entries_path, is_entries_cache_fresh, read_entries, read_entries_cache, stream_entries
+)
+
+YEAR = 2018
+
+@pytest.fixture
+def entries_dir(tmp_path, monkeypatch):
+    '''
+    Carpeta temporal con resources/EGRESO_`YEAR`.csv, las rutas de `readers` son relativas.
+    '''
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('resources')
+    write_entries(make_entries())
+    return tmp_path
+
+def make_entries(seed: int = 0, n: int = 3000) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    entries = pd.DataFrame({
+        'ID': np.arange(n),
+        'INGRE': (pd.Timestamp(f'{YEAR}-01-01') + pd.to_timedelta(rng.integers(0, 365, n), unit='D')).strftime('%Y-%m-%d'),
+        'ENTIDAD': rng.choice(['05', '19', '28'], n),
+        'MUNIC': rng.choice(['006', '019', '039', '046', '048'], n),
+        'DIAG_INI': [
+            f'{letter}{number:02d}{suffix}'
+            for letter, number, suffix in zip(rng.choice(list('AJOZ'), n), rng.integers(0, 100, n), rng.choice(['X', '0', '9'], n))
+        ],
+    })
+    # registros incompletos, se descartan en ambas lecturas
+    entries.loc[::97, 'DIAG_INI'] = None
+    entries.loc[::89, 'MUNIC'] = None
+    return entries
+
+def write_entries(entries: pd.DataFrame) -> None:
+    entries.to_csv(get_entries_path(YEAR), index=False)
+
+def normalize(entries: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Mismos tipos y orden para comparar registros leídos de distintas fuentes.
+    '''
+    entries = entries[['INGRE', 'ENTIDAD', 'MUNIC', 'DIAG_INI']].astype(
+        {'ENTIDAD': str, 'MUNIC': str, 'DIAG_INI': str}
+    )
+    entries = entries.assign(INGRE=pd.to_datetime(entries['INGRE']).astype('datetime64[ns]'))
+    return entries.sort_values(list(entries.columns), ignore_index=True)
+
+@pytest.mark.parametrize('filters', [
+    dict(),
+    dict(entity='19'),
+    dict(munics=['006', '039']),
+    dict(cie='J'),
+    dict(cie='J4'),
+    dict(cie='O2'),
+    dict(entity='19', munics=['019', '048'], cie='A0'),
+    dict(entity='99'),
+])
+def test_cache_matches_stream(entries_dir, filters):
+    # grupos de filas pequeños para que los filtros descarten algunos
+    build_entries_cache(YEAR, row_group_size=100)
+    cached = read_entries_cache(YEAR, **filters)
+    streamed = stream_entries(get_entries_path(YEAR), chunksize=700, **filters)
+
+    assert list(cached.columns) == ['INGRE', 'ENTIDAD', 'MUNIC', 'DIAG_INI']
+    pd.testing.assert_frame_equal(normalize(cached), normalize(streamed))
+    if filters != dict(entity='99'):
+        assert len(cached) > 0
+
+def test_cache_stale_after_csv_changes(entries_dir):
+    assert not is_entries_cache_fresh(YEAR)
+    cachepath = build_entries_cache(YEAR)
+    assert is_entries_cache_fresh(YEAR)
+
+    # agregar registros al CSV después de crear el caché
+    entries = make_entries()
+    entries = pd.concat([entries, make_entries(seed=1, n=10).assign(ENTIDAD='19', MUNIC='006', DIAG_INI='J45X')])
+    write_entries(entries)
+    # el caché queda más antiguo que el CSV aunque el sistema de archivos tenga poca resolución
+    mtime = os.path.getmtime(get_entries_path(YEAR)) - 10
+    os.utime(cachepath, (mtime, mtime))
+    assert not is_entries_cache_fresh(YEAR)
+
+    # con el caché desactualizado se lee el CSV, con los registros nuevos
+    expected = stream_entries(get_entries_path(YEAR), entity='19', munics=['006'], cie='J45')
+    stale = read_entries(YEAR, entity='19', munics=['006'], cie='J45')
+    pd.testing.assert_frame_equal(normalize(stale), normalize(expected))
+    assert len(stale) > len(read_entries_cache(YEAR, entity='19', munics=['006'], cie='J45'))
+
+    build_entries_cache(YEAR)
+    assert is_entries_cache_fresh(YEAR)
+    fresh = read_entries(YEAR, entity='19', munics=['006'], cie='J45')
+    pd.testing.assert_frame_equal(normalize(fresh), normalize(expected))
+
+def test_cache_only_source(entries_dir):
+    build_entries_cache(YEAR)
+    os.remove(get_entries_path(YEAR))
+    assert is_entries_cache_fresh(YEAR)
+    assert readers.get_entries_source(YEAR) == readers.get_entries_cache_path(YEAR)
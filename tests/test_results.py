@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+import results
+
+pytestmark = pytest.mark.usefixtures('results_dir')
+
+def test_make_key(tmp_path):
+    filepath = tmp_path / 'EGRESO_2018.csv'
+    filepath.write_text('a,b\n1,2\n')
+    key = results.make_key('amm_entries', [str(filepath)], year=2018, cie='A')
+
+    assert key.startswith('amm_entries-')
+    assert key == results.make_key('amm_entries', [str(filepath)], cie='A', year=2018)
+    assert key != results.make_key('amm_entries', [str(filepath)], year=2018, cie='B')
+
+    filepath.write_text('a,b\n1,2\n3,4\n')
+    assert key != results.make_key('amm_entries', [str(filepath)], year=2018, cie='A')
+
+def test_cached():
+    calls = list()
+    def compute():
+        calls.append(1)
+        return {'total': len(calls)}
+
+    key = results.make_key('kriging', data='abc')
+    assert results.cached(key, compute) == {'total': 1}
+    assert results.cached(key, compute) == {'total': 1}
+    assert len(calls) == 1
+
+    # sin leer los guardados se vuelve a calcular y se guarda el nuevo
+    results.set_use_saved(False)
+    try:
+        assert os.environ[results.RECOMPUTE_ENV] == '1'
+        assert results.cached(key, compute) == {'total': 2}
+    finally:
+        results.set_use_saved(True)
+    assert results.load(key) == {'total': 2}
+
+def test_corrupt_result_is_removed():
+    key = results.make_key('kriging', data='roto')
+    os.makedirs(results.RESULTS_DIR)
+    with open(results.get_path(key), 'wb') as file:
+        file.write(b'no es un pickle')
+
+    assert results.load(key) is None
+    assert not os.path.exists(results.get_path(key))
+
+def test_evict_least_recently_used():
+    keys = [results.make_key('kriging', data=str(i)) for i in range(3)]
+    for age, key in zip((300, 200, 100), keys):
+        results.store(key, bytes(1000))
+        # fecha de último uso en el pasado, el primero es el más antiguo
+        past = os.path.getmtime(results.get_path(key)) - age
+        os.utime(results.get_path(key), (past, past))
+
+    # leer el más antiguo lo marca como reciente
+    assert results.load(keys[0]) is not None
+    assert results.get_usage()['kriging']['count'] == 3
+
+    size = os.path.getsize(results.get_path(keys[0]))
+    assert results.evict(2 * size) == 1
+    assert [os.path.exists(results.get_path(key)) for key in keys] == [True, False, True]
+    assert results.clear() == 2
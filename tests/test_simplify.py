@@ -0,0 +1,34 @@
+import math
+
+from simplify import simplify_geojson
+
+def make_circle(center, radius, n, start=0):
+    points = [
+        [center[0] + radius * math.cos(2 * math.pi * (i + start) / n),
+         center[1] + radius * math.sin(2 * math.pi * (i + start) / n) * (1 + 0.1 * math.sin(7 * i))]
+        for i in range(n)
+    ]
+    return points + [points[0]]
+
+def feature(id, rings):
+    return {'type': 'Feature', 'id': id, 'geometry': {'type': 'Polygon', 'coordinates': rings}}
+
+def test_enclave_matches_hole():
+    island = make_circle((0, 0), 1, 40)
+    # el mismo anillo, empezando en otro punto y en sentido contrario
+    hole = (island[:-1][17:] + island[:-1][:17])[::-1]
+    hole.append(hole[0])
+    outer = [[-3, -3], [3, -3], [3, 3], [-3, 3], [-3, -3]]
+    geojson = {'type': 'FeatureCollection', 'features': [
+        feature('island', [island]),
+        feature('around', [outer, hole]),
+    ]}
+
+    simplified = simplify_geojson(geojson, tolerance=0.05)
+    island_ring = simplified['features'][0]['geometry']['coordinates'][0]
+    hole_ring = simplified['features'][1]['geometry']['coordinates'][1]
+
+    assert len(island_ring) < len(island)
+    assert island_ring[0] == island_ring[-1] and hole_ring[0] == hole_ring[-1]
+    # mismos vértices, en sentido contrario
+    assert island_ring == hole_ring[::-1]
@@ -0,0 +1,56 @@
+import json
+import os
+
+import numpy as np
+
+from spatial import PolygonIndex, get_rings
+
+RESOURCES = os.path.join(os.path.dirname(__file__), '..', 'resources')
+
+def naive_contains(rings, x, y) -> np.ndarray:
+    '''
+    Rayo horizontal contra todas las aristas, sin índice.
+    '''
+    inside = np.zeros(len(x), dtype=bool)
+    for ring in rings:
+        for (x1, y1), (x2, y2) in zip(ring[:-1], ring[1:]):
+            if y1 == y2:
+                continue
+            crosses = (y1 > y) != (y2 > y)
+            xcross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+            inside ^= crosses & (x < xcross)
+    return inside
+
+def naive_locate(features, x, y) -> np.ndarray:
+    positions = np.full(len(x), -1)
+    for position, feature in enumerate(features):
+        positions[naive_contains(get_rings(feature['geometry']), x, y)] = position
+    return positions
+
+def test_hole_and_multipolygon():
+    features = [
+        {'id': 'hueco', 'geometry': {'type': 'Polygon', 'coordinates': [
+            [[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]],
+            [[1, 1], [3, 1], [3, 3], [1, 3], [1, 1]],
+        ]}},
+        {'id': 'multi', 'geometry': {'type': 'MultiPolygon', 'coordinates': [
+            [[[1.5, 1.5], [2.5, 1.5], [2.5, 2.5], [1.5, 2.5], [1.5, 1.5]]],
+            [[[5, 0], [6, 0], [6, 1], [5, 0]]],
+        ]}},
+    ]
+    index = PolygonIndex(features)
+    x = np.array([0.5, 1.2, 2.0, 5.8, 5.2, 10.0])
+    y = np.array([0.5, 1.2, 2.0, 0.5, 0.5, 10.0])
+    np.testing.assert_array_equal(index.locate(x, y), [0, -1, 1, 1, -1, -1])
+
+def test_matches_naive_on_amm():
+    with open(os.path.join(RESOURCES, 'amm_mun2019gw_low.json'), encoding='utf-8') as file:
+        features = json.load(file)['features']
+    index = PolygonIndex(features)
+
+    rng = np.random.default_rng(0)
+    xmin, ymin, xmax, ymax = index.bounds
+    x, y = rng.uniform(xmin, xmax, 3000), rng.uniform(ymin, ymax, 3000)
+    np.testing.assert_array_equal(index.locate(x, y), naive_locate(features, x, y))
+    # con pocas franjas las aristas largas cruzan varias
+    np.testing.assert_array_equal(PolygonIndex(features, bands=3).locate(x, y), naive_locate(features, x, y))
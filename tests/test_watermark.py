@@ -0,0 +1,62 @@
+from watermark import (
+    get_appended_offset, make_watermark, read_appended, read_watermark, write_watermark
+)
+
+HEADER = 'timestamp,station,PM10\n'
+ROWS = [f'2018-12-01 {hour:02d}:00:00,{station},{hour * 3 + len(station)}\n' for hour in range(24) for station in ('SE', 'NE')]
+
+def write(path, text, mode='w'):
+    with open(path, mode, newline='') as file:
+        file.write(text)
+
+def test_append(tmp_path):
+    filepath = tmp_path / 'filled.csv'
+    write(filepath, HEADER + ''.join(ROWS[:10]))
+    mark = make_watermark(str(filepath))
+
+    # sin registros nuevos
+    assert get_appended_offset(str(filepath), mark) == filepath.stat().st_size
+
+    # registros nuevos y uno incompleto al final
+    write(filepath, ''.join(ROWS[10:20]) + ROWS[20][:8], 'a')
+    offset = get_appended_offset(str(filepath), mark)
+    assert offset == mark['offset']
+    new, end = read_appended(str(filepath), offset)
+    assert len(new) == 10
+    assert list(new.columns) == ['timestamp', 'station', 'PM10']
+    assert new['PM10'].tolist() == [int(row.rsplit(',', 1)[1]) for row in ROWS[10:20]]
+
+    # el registro incompleto se lee en la siguiente
+    mark = make_watermark(str(filepath), end)
+    write(filepath, ROWS[20][8:], 'a')
+    new, _ = read_appended(str(filepath), get_appended_offset(str(filepath), mark))
+    assert len(new) == 1
+
+def test_truncated_and_rewritten(tmp_path):
+    filepath = tmp_path / 'filled.csv'
+    write(filepath, HEADER + ''.join(ROWS))
+    mark = make_watermark(str(filepath))
+
+    write(filepath, HEADER + ''.join(ROWS[:30]))
+    assert get_appended_offset(str(filepath), mark) is None
+
+    # mismo tamaño, un valor distinto antes de la marca
+    rewritten = HEADER + ''.join(ROWS[:-1]) + ROWS[-1].replace('SE', 'SO').replace('NE', 'NO')
+    write(filepath, rewritten)
+    assert filepath.stat().st_size == mark['offset']
+    assert get_appended_offset(str(filepath), mark) is None
+
+def test_missing(tmp_path):
+    filepath = tmp_path / 'filled.csv'
+    assert get_appended_offset(str(filepath), None) is None
+    assert get_appended_offset(str(filepath), {'offset': 10, 'digest': ''}) is None
+    write(filepath, HEADER)
+    assert get_appended_offset(str(filepath), {'offset': 0, 'digest': ''}) is None
+
+def test_read_write_watermark(tmp_path):
+    markpath = str(tmp_path / 'filled.watermark')
+    assert read_watermark(markpath) is None
+    write_watermark(markpath, {'offset': 5, 'digest': 'abc'})
+    assert read_watermark(markpath) == {'offset': 5, 'digest': 'abc'}
+    write(markpath, '{roto')
+    assert read_watermark(markpath) is None